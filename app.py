@@ -1,14 +1,32 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import time
 import numpy as np
-import sqlite3
 import io
 import streamlit_authenticator as stauth
+from services.preco_service import PrecoService
+from services.historico_service import HistoricoService
+from services.retornos_service import RetornosService
+from services.correlacao_service import CorrelacaoService
+from services.risco_service import RiscoService
+from services.estresse_service import EstresseService
+from services.cenario_service import CenarioService
+from services.bola_neve_service import BolaNeveService
+from services.aquecimento_service import AquecimentoService
+from services.patrimonio_service import PatrimonioService
+from services.analise_service import AnaliseService
+from services.scanner_service import ScannerService
+from services.filtro_service import FiltroInvalido, FiltroService
+from config.settings import settings
+from database.conexao import get_gerenciador
+from database.migracoes import adotar_banco_legado, aplicar_migracoes
+from database.repository import (AtivoRepository, LoteInvalido, MetaRepository, Transacao,
+                                 TransacaoInvalida, TransacaoRepository)
+from utils.concorrencia import executar_em_lote
+from utils.formatters import formatar_idade
 
 # ============================================
 # CONFIGURAÇÃO INICIAL
@@ -35,116 +53,72 @@ st.markdown("""
 # ============================================
 # BANCO DE DADOS (SQLite) e FUNÇÕES CRUD
 # ============================================
-DB_PATH = 'invest_v8.db'
-
-def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+# Um único arquivo para o app, os repositórios e os jobs (variável de ambiente DB_PATH);
+# na primeira execução, os dados de invest_v8.db são copiados para ele
+DB_PATH = settings.DB_PATH
+adotar_banco_legado(DB_PATH)
+# Pool de conexões: cada rerun (uma thread nova) reaproveita uma conexão já aberta (WAL, comandos em cache)
+banco = get_gerenciador(DB_PATH)
 
 def init_db():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            nome TEXT NOT NULL,
-            senha_hash TEXT NOT NULL
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ativos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            ticker TEXT NOT NULL,
-            qtd REAL NOT NULL,
-            pm REAL NOT NULL,
-            setor TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES usuarios(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS metas_alocacao (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            classe TEXT NOT NULL,
-            percentual REAL NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES usuarios(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS alertas (
-            id TEXT PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            ticker TEXT NOT NULL,
-            tipo TEXT NOT NULL,
-            preco REAL NOT NULL,
-            ativo BOOL NOT NULL,
-            criado_em TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES usuarios(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    aplicar_migracoes(banco)
+
+ativos_repo = AtivoRepository(banco)
+metas_repo = MetaRepository(banco)
+transacoes_repo = TransacaoRepository(banco)
+patrimonio_service = PatrimonioService(banco)
 
 def criar_usuario(username, nome, senha_plana):
     hashed = stauth.Hasher.hash(senha_plana)
-    conn = get_connection()
-    c = conn.cursor()
     try:
-        c.execute(
+        banco.conexao().execute(
             "INSERT INTO usuarios (username, nome, senha_hash) VALUES (?, ?, ?)",
             (username, nome, hashed)
         )
-        conn.commit()
-        conn.close()
         return True
     except Exception as e:
         print(f"Erro ao criar usuário: {e}")
-        conn.close()
         return False
 
 def buscar_usuario_por_username(username):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT id, username, nome, senha_hash FROM usuarios WHERE username = ?", (username,))
-    row = c.fetchone()
-    conn.close()
+    row = banco.conexao().execute(
+        "SELECT id, username, nome, senha_hash FROM usuarios WHERE username = ?", (username,)).fetchone()
     if row:
         return {'id': row[0], 'username': row[1], 'nome': row[2], 'senha_hash': row[3]}
     return None
 
 def salvar_ativo(user_id, ticker, qtd, pm, setor):
-    if not ticker or len(ticker.strip()) < 2:
-        st.error("❌ Ticker inválido!")
-        return False
-    if qtd <= 0:
-        st.error("❌ Quantidade deve ser maior que zero!")
-        return False
-    if pm <= 0:
-        st.error("❌ Preço médio deve ser maior que zero!")
-        return False
+    # Ticker já cadastrado: as cotas somam à posição e o preço médio é reponderado
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO ativos (user_id, ticker, qtd, pm, setor) VALUES (?, ?, ?, ?, ?)",
-            (user_id, ticker.upper().strip(), float(qtd), float(pm), setor)
-        )
-        conn.commit()
-        conn.close()
+        ativos_repo.salvar_lote(user_id, pd.DataFrame([{'ticker': ticker, 'qtd': qtd, 'pm': pm, 'setor': setor}]))
+        patrimonio_service.refazer(user_id, datetime.now().date())
         st.success(f"✅ {ticker.upper()} salvo!")
         return True
+    except LoteInvalido as e:
+        st.error(f"❌ {e.invalidos['motivo'].iloc[0].capitalize()}!")
+        return False
     except Exception as e:
         st.error(f"❌ Erro ao salvar: {str(e)}")
         return False
 
+def salvar_carteira(user_id, df_ativos):
+    """Grava todas as linhas (Ticker, Cotas, Preço, Classe) em uma única transação."""
+    lote = df_ativos.rename(columns={'Ticker': 'ticker', 'Cotas': 'qtd', 'Preço': 'pm', 'Classe': 'setor'})
+    try:
+        salvos = ativos_repo.salvar_lote(user_id, lote)
+        patrimonio_service.refazer(user_id, datetime.now().date())
+        return salvos
+    except LoteInvalido as e:
+        st.error(f"❌ Nada foi salvo: {e}")
+    except Exception as e:
+        st.error(f"❌ Erro ao salvar: {str(e)}")
+    return 0
+
 def excluir_ativo(user_id, ticker):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM ativos WHERE user_id = ? AND ticker = ?", (user_id, ticker))
-        conn.commit()
-        conn.close()
+        transacoes_repo.excluir(user_id, ticker)
+        # O histórico do ticker saiu do livro: a série inteira é refeita sem ele
+        patrimonio_service.refazer(user_id)
         st.success(f"✅ {ticker} excluído!")
         return True
     except Exception as e:
@@ -153,14 +127,8 @@ def excluir_ativo(user_id, ticker):
 
 def atualizar_ativo(user_id, ticker, qtd, pm, setor):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(
-            "UPDATE ativos SET qtd=?, pm=?, setor=? WHERE user_id=? AND ticker=?",
-            (float(qtd), float(pm), setor, user_id, ticker.upper().strip())
-        )
-        conn.commit()
-        conn.close()
+        transacoes_repo.redefinir(user_id, ticker, qtd, pm, setor)
+        patrimonio_service.refazer(user_id)
         st.success(f"✅ {ticker} atualizado!")
         return True
     except Exception as e:
@@ -168,23 +136,27 @@ def atualizar_ativo(user_id, ticker, qtd, pm, setor):
         return False
 
 def carregar_ativos(user_id):
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM ativos WHERE user_id = ?", conn, params=(user_id,))
-    conn.close()
-    return df
+    # Posições zeradas continuam na tabela por causa do lucro realizado
+    return pd.read_sql_query("SELECT * FROM ativos WHERE user_id = ? AND qtd > 0", banco.conexao(), params=(user_id,))
+
+def registrar_transacao(user_id, transacao):
+    try:
+        transacao = transacoes_repo.validar(transacao)
+        transacoes_repo.registrar(user_id, [transacao])
+        # O lançamento muda o patrimônio de todos os dias desde a sua data
+        patrimonio_service.refazer(user_id, datetime.fromisoformat(transacao.data).date())
+        st.success(f"✅ {transacao.tipo.capitalize()} de {transacao.ticker.upper()} registrada!")
+        return True
+    except TransacaoInvalida as e:
+        st.error(f"❌ {e}")
+        return False
+    except Exception as e:
+        st.error(f"❌ Erro ao registrar: {str(e)}")
+        return False
 
 def salvar_metas(user_id, metas):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM metas_alocacao WHERE user_id = ?", (user_id,))
-        for classe, percentual in metas.items():
-            c.execute(
-                "INSERT INTO metas_alocacao (user_id, classe, percentual) VALUES (?, ?, ?)",
-                (user_id, classe, percentual)
-            )
-        conn.commit()
-        conn.close()
+        metas_repo.salvar(user_id, metas)
         return True
     except Exception as e:
         st.error(f"❌ Erro ao salvar metas: {str(e)}")
@@ -192,24 +164,18 @@ def salvar_metas(user_id, metas):
 
 def carregar_metas(user_id):
     try:
-        conn = get_connection()
-        df = pd.read_sql_query("SELECT classe, percentual FROM metas_alocacao WHERE user_id = ?", conn, params=(user_id,))
-        conn.close()
+        df = pd.read_sql_query("SELECT classe, percentual FROM metas_alocacao WHERE user_id = ?", banco.conexao(), params=(user_id,))
         return dict(zip(df['classe'], df['percentual']))
     except:
         return {}
 
 def salvar_alerta(user_id, ticker, tipo, preco):
     try:
-        conn = get_connection()
-        c = conn.cursor()
         alerta_id = f"{ticker}_{tipo}_{preco}_{datetime.now().timestamp()}"
-        c.execute(
+        banco.conexao().execute(
             "INSERT INTO alertas (id, user_id, ticker, tipo, preco, ativo, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (alerta_id, user_id, ticker, tipo, preco, 1, datetime.now().strftime('%d/%m/%Y %H:%M'))
         )
-        conn.commit()
-        conn.close()
         return True
     except Exception as e:
         st.error(f"❌ Erro ao salvar alerta: {str(e)}")
@@ -217,11 +183,9 @@ def salvar_alerta(user_id, ticker, tipo, preco):
 
 def carregar_alertas(user_id):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT id, ticker, tipo, preco, ativo, criado_em FROM alertas WHERE user_id = ? AND ativo = 1", (user_id,))
-        rows = c.fetchall()
-        conn.close()
+        rows = banco.conexao().execute(
+            "SELECT id, ticker, tipo, preco, ativo, criado_em FROM alertas WHERE user_id = ? AND ativo = 1", (user_id,)
+        ).fetchall()
         alertas = {}
         for r in rows:
             alertas[r[0]] = {
@@ -235,38 +199,63 @@ def carregar_alertas(user_id):
     except:
         return {}
 
+def salvar_filtro(user_id, nome, expressao):
+    try:
+        expressao = FiltroService.validar(expressao)
+    except FiltroInvalido as e:
+        st.error(f"❌ {e}")
+        return False
+    try:
+        banco.conexao().execute(
+            "INSERT INTO filtros_salvos (user_id, nome, expressao, criado_em) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id, nome) DO UPDATE SET expressao = excluded.expressao, criado_em = excluded.criado_em",
+            (user_id, nome.strip(), expressao, datetime.now().strftime('%d/%m/%Y %H:%M'))
+        )
+        return True
+    except Exception as e:
+        st.error(f"❌ Erro ao salvar filtro: {str(e)}")
+        return False
+
+def carregar_filtros(user_id):
+    try:
+        rows = banco.conexao().execute(
+            "SELECT nome, expressao FROM filtros_salvos WHERE user_id = ? ORDER BY nome", (user_id,)).fetchall()
+        return dict(rows)
+    except:
+        return {}
+
+def excluir_filtro(user_id, nome):
+    try:
+        banco.conexao().execute("DELETE FROM filtros_salvos WHERE user_id = ? AND nome = ?", (user_id, nome))
+        return True
+    except:
+        return False
+
 def excluir_alerta(alerta_id):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM alertas WHERE id = ?", (alerta_id,))
-        conn.commit()
-        conn.close()
+        banco.conexao().execute("DELETE FROM alertas WHERE id = ?", (alerta_id,))
         return True
     except:
         return False# ============================================
 # FUNÇÕES DE PREÇO E ANÁLISE
 # ============================================
-@st.cache_data(ttl=300)
 def pegar_preco(ticker):
-    try:
-        if ticker[-1].isdigit():
-            ticker_yf = f"{ticker}.SA"
-        else:
-            ticker_yf = ticker
-        acao = yf.Ticker(ticker_yf)
-        hist = acao.history(period="2d")
-        if hist.empty:
-            return None, "erro", "Sem dados disponíveis"
-        preco = hist['Close'].iloc[-1]
-        ultima_data = hist.index[-1].date()
-        hoje = datetime.now().date()
-        if ultima_data == hoje:
-            return preco, "ok", "Atualizado"
-        else:
-            return preco, "aviso", f"Último: {ultima_data.strftime('%d/%m')}"
-    except Exception as e:
-        return None, "erro", str(e)
+    # Ticker vazio ou em branco é descartado pelo lote e não volta no resultado
+    dados = PrecoService.buscar_precos_batch([ticker]).get(ticker)
+    if dados is None:
+        return None, "erro", "Ticker inválido"
+    preco = dados.preco_atual if dados.status != "erro" else None
+    return preco, dados.status, dados.mensagem
+
+def pegar_precos(tickers):
+    """Busca os preços de vários ativos em lote. Retorna DataFrame (ticker, preco, status, msg, atualizado_em)."""
+    cotacoes = PrecoService.buscar_precos_batch(sorted(set(tickers)))
+    return pd.DataFrame(
+        [{'ticker': t, 'preco': d.preco_atual if d.status != "erro" else 0, 'status': d.status, 'msg': d.mensagem,
+          'atualizado_em': d.atualizado_em}
+         for t, d in cotacoes.items()],
+        columns=['ticker', 'preco', 'status', 'msg', 'atualizado_em']
+    )
 
 def pegar_preco_simples(ticker):
     preco, _, _ = pegar_preco(ticker)
@@ -275,16 +264,10 @@ def pegar_preco_simples(ticker):
 @st.cache_data(ttl=3600)
 def buscar_dados_historicos(ticker, periodo="5y"):
     try:
-        if ticker[-1].isdigit():
-            ticker_yf = f"{ticker}.SA"
-        else:
-            ticker_yf = ticker
-        acao = yf.Ticker(ticker_yf)
-        hist = acao.history(period=periodo)
+        # Histórico persistido em data/cache; só o trecho faltante vai à rede
+        hist = HistoricoService().obter(ticker, periodo)
         if hist.empty:
-            hist = acao.history(period="max")
-            if hist.empty:
-                return None
+            return None
         # Usar preços ajustados para cálculos históricos
         adj_close = hist['Adj Close']
         preco_atual = hist['Close'].iloc[-1]  # preço de fechamento real para exibição
@@ -303,7 +286,7 @@ def buscar_dados_historicos(ticker, periodo="5y"):
         else:
             variacao_anual = 0
         try:
-            dividends = acao.dividends.tail(24)
+            dividends = hist['Dividends'][hist['Dividends'] > 0].tail(24)
             if not dividends.empty:
                 dividends_12m = dividends.tail(12).sum()
                 if len(dividends) < 12:
@@ -471,27 +454,46 @@ def plotar_grafico_historico(dados_historicos, ticker):
     fig.update_layout(title=f"{ticker} - Histórico de Preços (5 anos)", yaxis_title="Preço (R$)", xaxis_title="Data", height=400, showlegend=True, plot_bgcolor='#0F1116', paper_bgcolor='#0F1116', font=dict(color='white'))
     return fig
 
+def montar_tabela_scanner(resultados, sensibilidade):
+    """Tabela do Scanner (resultado de ScannerService), com as faixas da sensibilidade escolhida."""
+    # Só troca as faixas de classificação: nada de rede, histórico ou nova pontuação
+    pontos = AnaliseService.reclassificar(resultados, sensibilidade)
+    return pd.DataFrame({
+        "Ticker": resultados['ticker'],
+        "Status": pontos['status'],
+        "Preço": resultados['preco_atual'],
+        "DY (%)": resultados['dividend_yield'].fillna(0),
+        "Pontuação": pontos['pontuacao'],
+        "Detalhes": pontos['mensagem']
+    }).sort_values("Pontuação", ascending=True)
+
+def colorir_status(val):
+    if val == 'oportunidade':
+        return 'background-color: #006400; color: white'
+    elif val == 'barato':
+        return 'background-color: #32CD32; color: black'
+    elif val == 'neutro':
+        return 'background-color: #D4AF37; color: black'
+    elif val == 'atencao':
+        return 'background-color: #FFA500; color: black'
+    elif val == 'caro':
+        return 'background-color: #8B0000; color: white'
+    return ''
+
+def estilizar_tabela_scanner(df_scan):
+    return df_scan.style.format({
+        "Preço": "R$ {:.2f}",
+        "DY (%)": "{:.2f}%",
+        "Pontuação": "{:.0f}"
+    }).applymap(colorir_status, subset=["Status"])
+
 def calcular_matriz_correlacao(tickers, periodo="1y"):
     if len(tickers) < 2:
         return None, None
-    dados = {}
-    for ticker in tickers:
-        try:
-            if ticker[-1].isdigit():
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            acao = yf.Ticker(ticker_yf)
-            hist = acao.history(period=periodo)['Close']
-            if not hist.empty:
-                dados[ticker] = hist
-        except:
-            continue
-    if len(dados) < 2:
+    correlacao = CorrelacaoService.obter(tickers, periodo)
+    if correlacao is None:
         return None, None
-    df = pd.DataFrame(dados)
-    correlacao = df.pct_change().corr()
-    return correlacao, df
+    return correlacao, RetornosService.obter(tickers, periodo).precos
 
 def analisar_concentracao_setorial(df_ativos):
     if df_ativos.empty:
@@ -512,12 +514,8 @@ def analisar_concentracao_setorial(df_ativos):
 
 def calcular_preco_teto_bazin(ticker, dy_desejado=0.06):
     try:
-        if ticker[-1].isdigit():
-            ticker_yf = f"{ticker}.SA"
-        else:
-            ticker_yf = ticker
-        acao = yf.Ticker(ticker_yf)
-        dividends = acao.dividends.tail(12)
+        hist = HistoricoService().obter(ticker, "5y")
+        dividends = hist['Dividends'][hist['Dividends'] > 0].tail(12)
         if dividends.empty:
             return None, "Sem histórico de dividendos"
         dividendo_anual_medio = dividends.mean() * 4
@@ -527,46 +525,16 @@ def calcular_preco_teto_bazin(ticker, dy_desejado=0.06):
         return None, str(e)
 
 def calcular_risco_retorno(tickers):
-    dados_risco = {}
-    for ticker in tickers:
-        try:
-            if ticker[-1].isdigit():
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            acao = yf.Ticker(ticker_yf)
-            hist = acao.history(period="1y")['Close']
-            if not hist.empty:
-                retornos = hist.pct_change().dropna()
-                dados_risco[ticker] = {
-                    'retorno_medio': retornos.mean() * 252 * 100,
-                    'volatilidade': retornos.std() * np.sqrt(252) * 100,
-                    'max_drawdown': (hist / hist.cummax() - 1).min() * 100
-                }
-        except:
-            continue
-    return dados_risco
+    """Métricas de risco por ativo (RiscoService.COLUNAS), calculadas de uma vez sobre a matriz de 1 ano."""
+    return RiscoService.metricas(RetornosService.obter(tickers, "1y"))
 
-def calcular_evolucao_patrimonio(df_ativos):
-    dados_historicos = {}
-    for ticker in df_ativos['ticker']:
-        try:
-            if ticker[-1].isdigit():
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            acao = yf.Ticker(ticker_yf)
-            hist = acao.history(period="1mo")
-            if not hist.empty:
-                qtd = df_ativos[df_ativos['ticker'] == ticker]['qtd'].iloc[0]
-                dados_historicos[ticker] = hist['Close'] * qtd
-        except:
-            continue
-    if dados_historicos:
-        df_evolucao = pd.DataFrame(dados_historicos)
-        df_evolucao['Total'] = df_evolucao.sum(axis=1)
-        return df_evolucao
-    return None
+def carregar_evolucao(user_id, inicio=None):
+    """
+    Série diária gravada. O que falta antes do último pregão (a série inteira na
+    primeira visita) é reconstruído do livro e do histórico local.
+    """
+    patrimonio_service.atualizar(user_id)
+    return patrimonio_service.repo.serie(user_id, inicio)
 
 def calcular_rebalanceamento(df_ativos, metas, valor_disponivel=0):
     if df_ativos.empty or not metas:
@@ -602,11 +570,7 @@ def calcular_rebalanceamento(df_ativos, metas, valor_disponivel=0):
 # AUTENTICAÇÃO
 # ============================================
 def carregar_credenciais():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT username, nome, senha_hash FROM usuarios")
-    usuarios = c.fetchall()
-    conn.close()
+    usuarios = banco.conexao().execute("SELECT username, nome, senha_hash FROM usuarios").fetchall()
     credentials = {"usernames": {}}
     for u in usuarios:
         credentials["usernames"][u[0]] = {
@@ -723,8 +687,7 @@ SCANNER_INTERNACIONAL = [
 # INICIALIZAÇÃO DO BANCO E CRIAÇÃO DO ADMIN
 # ============================================
 init_db()
-conn = get_connection()
-cursor = conn.cursor()
+cursor = banco.conexao().cursor()
 
 cursor.execute("SELECT username FROM usuarios WHERE username='admin'")
 if not cursor.fetchone():
@@ -733,11 +696,27 @@ if not cursor.fetchone():
         "INSERT INTO usuarios (username, nome, senha_hash) VALUES (?, ?, ?)",
         ('admin', 'Igor Barbo', hashed_password)
     )
-    conn.commit()
     print("✅ Usuário admin criado com senha 1234")
 else:
     print("ℹ️ Usuário admin já existe")
-conn.close()
+
+# ============================================
+# AQUECIMENTO DE COTAÇÕES EM SEGUNDO PLANO
+# ============================================
+def coletar_tickers_aquecimento():
+    """Tickers distintos das carteiras mais os universos do scanner."""
+    rows = banco.conexao().execute("SELECT DISTINCT ticker FROM ativos WHERE qtd > 0").fetchall()
+    return [r[0] for r in rows] + SCANNER_FIIS + SCANNER_ACOES + SCANNER_ETFS + SCANNER_BDRS + SCANNER_INTERNACIONAL
+
+@st.cache_resource
+def iniciar_aquecimento():
+    # Cada ciclo regrava a fotografia do dia: a última do pregão fica como fechamento
+    servico = AquecimentoService(coletar_tickers_aquecimento, ao_concluir=patrimonio_service.fotografar)
+    servico.iniciar()
+    return servico
+
+if settings.AQUECIMENTO_ATIVO:
+    iniciar_aquecimento()
 
 # ============================================
 # SISTEMA DE LOGIN
@@ -793,17 +772,14 @@ if menu == "🏠 Dashboard":
     with col2:
         st.caption(f"🕐 {datetime.now().strftime('%H:%M:%S')}")
     with col3:
-        if st.button("🔄 Atualizar Preços"):
-            st.cache_data.clear()
-            st.rerun()
+        atualizar_precos = st.button("🔄 Atualizar Preços")
     df = carregar_ativos(st.session_state.user_id)
+    if atualizar_precos and not df.empty:
+        # Revalida só as cotações desta carteira; as atuais seguem na tela até chegarem as novas
+        PrecoService.revalidar_cotacoes(df['ticker'])
     if not df.empty:
         with st.spinner('🔄 Buscando preços do mercado...'):
-            precos_info = []
-            for ticker in df['ticker']:
-                preco, status, msg = pegar_preco(ticker)
-                precos_info.append({'ticker': ticker, 'preco': preco if preco else 0, 'status': status, 'msg': msg})
-            df_precos = pd.DataFrame(precos_info)
+            df_precos = pegar_precos(df['ticker'])
             df = df.merge(df_precos, on='ticker')
             df['Patrimônio'] = df['qtd'] * df['preco']
             df['Custo Total'] = df['qtd'] * df['pm']
@@ -829,8 +805,12 @@ if menu == "🏠 Dashboard":
                     else:
                         st.markdown(f"<p style='color:{alerta['cor']};'>{alerta['mensagem']}</p>", unsafe_allow_html=True)
         st.subheader("📋 Detalhamento por Ativo")
-        df_display = df[['ticker', 'qtd', 'pm', 'preco', 'Patrimônio', 'Lucro/Prejuízo', 'Variação %', 'status']].copy()
-        df_display.columns = ['Ticker', 'Qtd', 'P.Médio', 'P.Atual', 'Patrimônio', 'Lucro/Prej', 'Var %', 'Status']
+        if PrecoService.revalidando(df['ticker']):
+            st.caption("⏳ Atualizando cotações em segundo plano; clique em 🔄 novamente em instantes.")
+        df['Atualizado'] = [formatar_idade((datetime.now() - t).total_seconds()) if pd.notna(t) else "-"
+                            for t in df['atualizado_em']]
+        df_display = df[['ticker', 'qtd', 'pm', 'preco', 'Patrimônio', 'Lucro/Prejuízo', 'Variação %', 'status', 'Atualizado']].copy()
+        df_display.columns = ['Ticker', 'Qtd', 'P.Médio', 'P.Atual', 'Patrimônio', 'Lucro/Prej', 'Var %', 'Status', 'Atualizado']
         st.dataframe(df_display.style.format({'P.Médio': 'R$ {:.2f}', 'P.Atual': 'R$ {:.2f}', 'Patrimônio': 'R$ {:.2f}', 'Lucro/Prej': 'R$ {:.2f}', 'Var %': '{:.1f}%'}), width='stretch', height=400)
         col_g1, col_g2 = st.columns(2)
         with col_g1:
@@ -1051,11 +1031,10 @@ elif menu == "🎯 Montar Carteira":
                     st.rerun()
             with col_b2:
                 if st.button("💾 Salvar na Carteira", use_container_width=True):
-                    for _, ativo in df_final.iterrows():
-                        salvar_ativo(st.session_state.user_id, ativo['Ticker'], ativo['Cotas'], ativo['Preço'], ativo['Classe'])
-                    st.balloons()
-                    st.success("✅ Todos os ativos foram salvos na sua carteira!")
-                    st.info("📋 Vá para o Dashboard para acompanhar seus investimentos")
+                    if salvar_carteira(st.session_state.user_id, df_final):
+                        st.balloons()
+                        st.success(f"✅ {len(df_final)} ativos salvos na sua carteira!")
+                        st.info("📋 Vá para o Dashboard para acompanhar seus investimentos")
             with col_b3:
                 if st.button("📊 Ver Dashboard", use_container_width=True):
                     st.session_state.etapa_carteira = 1
@@ -1072,22 +1051,44 @@ elif menu == "📈 Evolução":
     if df.empty:
         st.info("Adicione ativos para ver a evolução")
     else:
-        with st.spinner("Buscando dados históricos..."):
-            df_evolucao = calcular_evolucao_patrimonio(df)
-            if df_evolucao is not None:
-                fig = px.line(df_evolucao, y='Total', title="Patrimônio Total - Últimos 30 Dias", labels={'value': 'Patrimônio (R$)', 'index': 'Data'})
-                fig.update_traces(line_color='#D4AF37', line_width=3)
-                st.plotly_chart(fig, use_container_width=True)
-                col_ev1, col_ev2, col_ev3 = st.columns(3)
-                with col_ev1:
-                    variacao = (df_evolucao['Total'].iloc[-1] / df_evolucao['Total'].iloc[0] - 1) * 100
+        periodos = {"1 mês": pd.DateOffset(months=1), "6 meses": pd.DateOffset(months=6), "1 ano": pd.DateOffset(years=1),
+                    "5 anos": pd.DateOffset(years=5), "Tudo": None}
+        periodo = st.radio("Período", list(periodos), index=2, horizontal=True)
+        inicio = (pd.Timestamp.now().normalize() - periodos[periodo]).date() if periodos[periodo] is not None else None
+        with st.spinner("Carregando histórico..."):
+            df_evolucao = carregar_evolucao(st.session_state.user_id, inicio)
+        if not df_evolucao.empty:
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=df_evolucao.index, y=df_evolucao['patrimonio'], name="Patrimônio",
+                                     line=dict(color='#D4AF37', width=3)))
+            fig.add_trace(go.Scatter(x=df_evolucao.index, y=df_evolucao['custo'], name="Valor investido",
+                                     line=dict(color='#8B8B8B', width=2, dash='dot')))
+            fig.update_layout(title=f"Patrimônio Total - {periodo}", xaxis_title="Data", yaxis_title="Patrimônio (R$)",
+                              hovermode="x unified")
+            st.plotly_chart(fig, use_container_width=True)
+            col_ev1, col_ev2, col_ev3, col_ev4 = st.columns(4)
+            with col_ev1:
+                # Medida a partir do primeiro dia com patrimônio (a carteira pode começar vazia)
+                positivos = df_evolucao['patrimonio'][df_evolucao['patrimonio'] > 0]
+                if positivos.empty:
+                    st.metric("Variação no Período", "-")
+                else:
+                    variacao = (df_evolucao['patrimonio'].iloc[-1] / positivos.iloc[0] - 1) * 100
                     st.metric("Variação no Período", f"{variacao:.2f}%")
-                with col_ev2:
-                    st.metric("Máximo", f"R$ {df_evolucao['Total'].max():,.2f}")
-                with col_ev3:
-                    st.metric("Mínimo", f"R$ {df_evolucao['Total'].min():,.2f}")
-            else:
-                st.warning("Não foi possível buscar dados históricos")
+            with col_ev2:
+                st.metric("Máximo", f"R$ {df_evolucao['patrimonio'].max():,.2f}")
+            with col_ev3:
+                st.metric("Mínimo", f"R$ {df_evolucao['patrimonio'].min():,.2f}")
+            with col_ev4:
+                ganho = df_evolucao['patrimonio'].iloc[-1] - df_evolucao['custo'].iloc[-1]
+                st.metric("Ganho sobre o investido", f"R$ {ganho:,.2f}")
+            classes = df_evolucao.drop(columns=['patrimonio', 'custo'])
+            if not classes.empty:
+                fig_classes = px.area(classes, title="Patrimônio por Classe",
+                                      labels={'value': 'Patrimônio (R$)', 'data': 'Data', 'variable': 'Classe'})
+                st.plotly_chart(fig_classes, use_container_width=True)
+        else:
+            st.warning("Ainda não há histórico de patrimônio para este período")
 
 # ============================================
 # 4. ALERTAS
@@ -1120,8 +1121,9 @@ elif menu == "🔔 Alertas":
             if not alertas:
                 st.info("Nenhum alerta configurado")
             else:
+                precos_alertas = pegar_precos({a['ticker'] for a in alertas.values()}).set_index('ticker')['preco']
                 for alerta_id, alerta in list(alertas.items()):
-                    preco_atual, _, _ = pegar_preco(alerta['ticker'])
+                    preco_atual = precos_alertas.get(alerta['ticker'], 0)
                     with st.container():
                         col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
                         with col1:
@@ -1197,9 +1199,11 @@ elif menu == "💰 Preço Teto":
         with col_t2:
             st.metric("DY Selecionado", f"{dy_desejado*100:.1f}%")
         resultados_teto = []
+        precos_atuais = pegar_precos(df['ticker']).set_index('ticker')['preco']
+        tetos = executar_em_lote(lambda t: calcular_preco_teto_bazin(t, dy_desejado), df['ticker'])
         for ticker in df['ticker']:
-            preco_teto, msg = calcular_preco_teto_bazin(ticker, dy_desejado)
-            preco_atual, _, _ = pegar_preco(ticker)
+            preco_teto, msg = tetos.get(ticker) or (None, "Tempo esgotado")
+            preco_atual = precos_atuais.get(ticker, 0)
             if preco_teto and preco_atual:
                 diferenca = (preco_teto - preco_atual) / preco_atual * 100
                 if preco_atual <= preco_teto:
@@ -1236,27 +1240,36 @@ elif menu == "📊 Análise Avançada":
                     fig = px.imshow(correlacao, text_auto=True, aspect="auto", color_continuous_scale='RdYlGn', title="Matriz de Correlação")
                     st.plotly_chart(fig, use_container_width=True)
                     st.subheader("🔍 Insights de Correlação")
-                    for i in range(len(correlacao.columns)):
-                        for j in range(i+1, len(correlacao.columns)):
-                            corr_val = correlacao.iloc[i, j]
-                            ativo1 = correlacao.columns[i]
-                            ativo2 = correlacao.columns[j]
-                            if abs(corr_val) > 0.8:
-                                st.warning(f"⚠️ **Alta correlação** entre {ativo1} e {ativo2}: {corr_val:.2f}")
-                                st.caption("Isso significa que eles tendem a se mover na mesma direção. Pouca diversificação.")
-                            elif abs(corr_val) < 0.3:
-                                st.success(f"✅ **Baixa correlação** entre {ativo1} e {ativo2}: {corr_val:.2f}")
-                                st.caption("Ótimo para diversificação! Eles se movem de forma independente.")
+                    mais, menos = CorrelacaoService.pares_extremos(correlacao, k=5)
+                    valores = correlacao.to_numpy()[np.triu_indices(len(correlacao.columns), k=1)]
+                    col_alta, col_baixa = st.columns(2)
+                    with col_alta:
+                        st.metric("Pares com alta correlação (|r| > 0,8)", int((np.abs(valores) > 0.8).sum()))
+                        st.caption("Tendem a se mover na mesma direção. Pouca diversificação.")
+                        st.dataframe(mais.style.format({'correlacao': '{:.2f}'}), hide_index=True, width='stretch')
+                    with col_baixa:
+                        st.metric("Pares com baixa correlação (|r| < 0,3)", int((np.abs(valores) < 0.3).sum()))
+                        st.caption("Ótimo para diversificação! Movem-se de forma independente.")
+                        st.dataframe(menos.style.format({'correlacao': '{:.2f}'}), hide_index=True, width='stretch')
                 else:
                     st.warning("Não foi possível calcular correlações (precisa de pelo menos 2 ativos com histórico)")
         with tab_av2:
             st.subheader("📈 Análise de Risco")
             with st.spinner("Calculando métricas de risco..."):
-                dados_risco = calcular_risco_retorno(df['ticker'].tolist())
-                if dados_risco:
-                    df_risco = pd.DataFrame(dados_risco).T
-                    df_risco.columns = ['Retorno Anual %', 'Volatilidade %', 'Drawdown Máx %']
-                    st.dataframe(df_risco.style.format('{:.2f}%'), width='stretch')
+                risco = calcular_risco_retorno(df['ticker'].tolist())
+                if not risco.empty:
+                    df_risco = risco.rename(columns={
+                        'retorno_anual': 'Retorno Anual %', 'volatilidade': 'Volatilidade %',
+                        'max_drawdown': 'Drawdown Máx %', 'pico': 'Pico', 'vale': 'Vale',
+                        'sharpe': 'Sharpe', 'sortino': 'Sortino', 'downside': 'Downside %',
+                        'var': 'VaR 95% (dia)', 'cvar': 'CVaR 95% (dia)'}).drop(columns=['observacoes'])
+                    st.dataframe(df_risco.style.format({
+                        'Retorno Anual %': '{:.2f}%', 'Volatilidade %': '{:.2f}%', 'Drawdown Máx %': '{:.2f}%',
+                        'Downside %': '{:.2f}%', 'VaR 95% (dia)': '{:.2f}%', 'CVaR 95% (dia)': '{:.2f}%',
+                        'Sharpe': '{:.2f}', 'Sortino': '{:.2f}', 'Pico': '{:%d/%m/%Y}', 'Vale': '{:%d/%m/%Y}'
+                    }, na_rep='-'), width='stretch')
+                    st.caption(f"Sharpe e Sortino com taxa livre de risco de {settings.TAXA_LIVRE_RISCO:.1%} a.a.; "
+                               "VaR/CVaR: perda diária histórica no nível de 95%.")
                     fig = px.scatter(df_risco, x='Volatilidade %', y='Retorno Anual %',
                                     text=df_risco.index,
                                     title="Risco x Retorno",
@@ -1279,11 +1292,7 @@ elif menu == "📊 Análise Avançada":
         with tab_av4:
             st.subheader("📥 Exportar Dados")
             with st.spinner("Preparando dados para exportação..."):
-                precos_info = []
-                for ticker in df['ticker']:
-                    preco, status, msg = pegar_preco(ticker)
-                    precos_info.append({'ticker': ticker, 'preco': preco if preco else 0, 'status': status})
-                df_precos = pd.DataFrame(precos_info)
+                df_precos = pegar_precos(df['ticker'])[['ticker', 'preco', 'status']]
                 df_export = df.merge(df_precos, on='ticker')
                 df_export['Patrimônio'] = df_export['qtd'] * df_export['preco']
                 df_export['Custo Total'] = df_export['qtd'] * df_export['pm']
@@ -1322,7 +1331,7 @@ elif menu == "📊 Análise Avançada":
 # ============================================
 elif menu == "⚙️ Gestão":
     st.title("⚙️ Gerenciar Ativos")
-    tab1, tab2 = st.tabs(["📥 Adicionar", "✏️ Editar/Excluir"])
+    tab1, tab2, tab3 = st.tabs(["📥 Adicionar", "✏️ Editar/Excluir", "🧾 Transações"])
     with tab1:
         with st.form("add_ativo", clear_on_submit=True):
             st.subheader("➕ Novo Ativo")
@@ -1373,8 +1382,42 @@ elif menu == "⚙️ Gestão":
                                     st.session_state.editando = None
                                     st.rerun()
                     st.divider()
+            st.caption("ℹ️ Editar a quantidade ou o preço médio substitui o histórico de transações do ativo.")
         else:
             st.info("📭 Nenhum ativo cadastrado.")
+    with tab3:
+        with st.form("add_transacao", clear_on_submit=True):
+            st.subheader("🧾 Registrar Transação")
+            tipos_transacao = {"Compra": "compra", "Venda": "venda", "Dividendo/JCP": "dividendo", "Desdobramento/Grupamento": "desdobramento"}
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                tipo_label = st.selectbox("Tipo", list(tipos_transacao))
+                ticker_t = st.text_input("📌 Ticker", help="Ex: PETR4, MXRF11").upper()
+            with col2:
+                data_t = st.date_input("📅 Data", value=datetime.now().date(), format="DD/MM/YYYY")
+                qtd_t = st.number_input("🔢 Quantidade / fator", min_value=0.0, value=0.0, step=1.0, format="%.4f",
+                                        help="Dividendo: 0 usa a posição atual. Desdobramento: 2 = cada cota vira duas; 0,1 = grupamento de 10 para 1")
+            with col3:
+                preco_t = st.number_input("💵 Preço por cota (R$)", min_value=0.0, value=0.0, step=0.01, format="%.4f")
+                taxas_t = st.number_input("🧾 Taxas / IR retido (R$)", min_value=0.0, value=0.0, step=0.01, format="%.2f")
+            setor_t = st.selectbox("🏷️ Classe (primeira compra)", ["Ações", "FII Papel", "FII Tijolo", "ETF", "Renda Fixa"])
+            if st.form_submit_button("💾 Registrar", use_container_width=True):
+                tipo_t = tipos_transacao[tipo_label]
+                registrar_transacao(st.session_state.user_id, Transacao(
+                    tipo_t, ticker_t, qtd_t, preco_t, data_t.isoformat(), taxas_t,
+                    setor_t if tipo_t == "compra" else None))
+        df_resultados = transacoes_repo.resultados(st.session_state.user_id)
+        col_r1, col_r2 = st.columns(2)
+        col_r1.metric("💹 Lucro realizado", f"R$ {df_resultados['lucro_realizado'].sum():,.2f}")
+        col_r2.metric("💰 Proventos recebidos", f"R$ {df_resultados['proventos'].sum():,.2f}")
+        st.subheader("📜 Últimos lançamentos")
+        df_extrato = transacoes_repo.extrato(st.session_state.user_id)
+        if not df_extrato.empty:
+            st.dataframe(df_extrato.rename(columns={'data': 'Data', 'ticker': 'Ticker', 'tipo': 'Tipo', 'qtd': 'Qtd',
+                                                    'preco': 'Preço', 'taxas': 'Taxas', 'resultado': 'Resultado'}),
+                         width='stretch', hide_index=True)
+        else:
+            st.info("📭 Nenhuma transação registrada.")
 
 # ============================================
 # 9. BOLA DE NEVE
@@ -1390,23 +1433,8 @@ elif menu == "❄️ Bola de Neve":
         taxa_anual = st.slider("📈 Rentabilidade anual (%)", 0.0, 20.0, 10.0, step=0.5) / 100
         anos = st.slider("⏳ Período (anos)", 1, 50, 20)
     meses = anos * 12
-    taxa_mensal = (1 + taxa_anual) ** (1/12) - 1
-    # Simulação mês a mês
-    df_sim = pd.DataFrame({'Mês': range(1, meses+1)})
-    # Com reinvestimento
-    patrimonio = []
-    atual = valor_inicial
-    for i in range(meses):
-        atual = atual * (1 + taxa_mensal) + aporte_mensal
-        patrimonio.append(atual)
-    df_sim['Com reinvestimento'] = patrimonio
-    # Sem reinvestimento
-    patrimonio_sem = []
-    atual_sem = valor_inicial
-    for i in range(meses):
-        atual_sem = atual_sem + aporte_mensal
-        patrimonio_sem.append(atual_sem)
-    df_sim['Sem reinvestimento'] = patrimonio_sem
+    # Forma fechada dos juros compostos: todos os meses de uma vez
+    df_sim = BolaNeveService.projetar(valor_inicial, aporte_mensal, taxa_anual, anos)
     # Totais
     final_com = df_sim['Com reinvestimento'].iloc[-1]
     final_sem = df_sim['Sem reinvestimento'].iloc[-1]
@@ -1428,13 +1456,65 @@ elif menu == "❄️ Bola de Neve":
     st.plotly_chart(fig, use_container_width=True)
     # Tabela anual
     with st.expander("📊 Ver tabela anual"):
-        df_sim['Ano'] = ((df_sim['Mês'] - 1) // 12) + 1
-        df_anual = df_sim.groupby('Ano').last().reset_index()
-        df_anual = df_anual[['Ano', 'Com reinvestimento', 'Sem reinvestimento']]
+        df_anual = BolaNeveService.tabela_anual(df_sim)
         df_anual.columns = ['Ano', 'Com reinvestimento (R$)', 'Sem reinvestimento (R$)']
-        df_anual['Com reinvestimento (R$)'] = df_anual['Com reinvestimento (R$)'].apply(lambda x: f"{x:,.2f}")
-        df_anual['Sem reinvestimento (R$)'] = df_anual['Sem reinvestimento (R$)'].apply(lambda x: f"{x:,.2f}")
-        st.table(df_anual)
+        st.table(df_anual.style.format("{:,.2f}", subset=['Com reinvestimento (R$)', 'Sem reinvestimento (R$)']))
+    # Varredura de cenários
+    with st.expander("🗺️ Comparar cenários (taxa × prazo × aporte)"):
+        taxas_grade = np.round(np.arange(0.0, 20.01, 0.5), 1)
+        anos_grade = np.arange(1, 51)
+        aportes_grade = sorted({100.0 * k for k in range(1, 51)} | {aporte_mensal})
+        finais = BolaNeveService.varredura(valor_inicial, taxas_grade / 100, anos_grade, aportes_grade)
+        aporte_mapa = st.select_slider("Aporte mensal do mapa (R$)", options=aportes_grade, value=aporte_mensal,
+                                       format_func=lambda v: f"{v:,.0f}")
+        fig_mapa = px.imshow(finais[:, :, aportes_grade.index(aporte_mapa)], x=anos_grade, y=taxas_grade,
+                             origin='lower', aspect='auto', color_continuous_scale='YlOrBr',
+                             labels={'x': 'Anos', 'y': 'Rentabilidade anual (%)', 'color': 'Patrimônio final (R$)'},
+                             title=f"Patrimônio final com R$ {aporte_mapa:,.0f}/mês ({finais.size:,} cenários calculados)")
+        st.plotly_chart(fig_mapa, use_container_width=True)
+    # Modo estocástico
+    st.subheader("🎲 E se a rentabilidade variar?")
+    st.caption("Milhares de trajetórias com retornos mensais sorteados, em vez de uma taxa fixa todo mês.")
+    col_e1, col_e2, col_e3 = st.columns(3)
+    with col_e1:
+        modelo = st.radio("Modelo de retornos", BolaNeveService.MODELOS,
+                          format_func={"Normal": "Normal", "Histórico": "Histórico de um índice",
+                                       "Regimes": "Mercado normal × crise"}.get)
+    with col_e2:
+        if modelo == "Histórico":
+            nome_benchmark = st.selectbox("Índice de referência", list(BolaNeveService.BENCHMARKS))
+            volatilidade = 0.0
+        else:
+            nome_benchmark = None
+            volatilidade = st.slider("Volatilidade anual (%)", 0, 40, 20) / 100
+        caminhos = st.select_slider("Trajetórias", options=[1_000, 2_000, 5_000, 10_000], value=5_000)
+    with col_e3:
+        meta = st.number_input("🎯 Meta de patrimônio (R$)", min_value=0.0, value=1_000_000.0, step=50_000.0)
+    try:
+        simulacao = BolaNeveService.simular(
+            valor_inicial, aporte_mensal, anos, modelo, taxa_anual=taxa_anual, volatilidade_anual=volatilidade,
+            benchmark=BolaNeveService.BENCHMARKS.get(nome_benchmark, "^BVSP"), caminhos=caminhos)
+    except ValueError as e:
+        st.warning(str(e))
+    else:
+        faixas = simulacao.faixas
+        col_s1, col_s2, col_s3, col_s4 = st.columns(4)
+        col_s1.metric("Pessimista (p10)", f"R$ {faixas['p10'].iloc[-1]:,.2f}")
+        col_s2.metric("Mediano (p50)", f"R$ {faixas['p50'].iloc[-1]:,.2f}")
+        col_s3.metric("Otimista (p90)", f"R$ {faixas['p90'].iloc[-1]:,.2f}")
+        col_s4.metric("Chance de atingir a meta", f"{simulacao.chance(meta) * 100:.1f}%")
+        fig_leque = go.Figure([
+            go.Scatter(x=faixas.index, y=faixas['p90'], line=dict(width=0), showlegend=False, hoverinfo='skip'),
+            go.Scatter(x=faixas.index, y=faixas['p10'], fill='tonexty', fillcolor='rgba(212,175,55,0.25)',
+                       line=dict(width=0), name='p10–p90'),
+            go.Scatter(x=faixas.index, y=faixas['p50'], line=dict(color='#D4AF37'), name='Mediana'),
+            go.Scatter(x=faixas.index, y=BolaNeveService.valor_futuro(valor_inicial, aporte_mensal, taxa_anual, faixas.index * 12), line=dict(color='#FF4B4B', dash='dot'), name='Taxa fixa'),
+        ])
+        if meta > 0:
+            fig_leque.add_hline(y=meta, line_dash="dash", annotation_text="Meta")
+        fig_leque.update_layout(title=f"Faixas de patrimônio ({simulacao.caminhos:,} trajetórias)",
+                                xaxis_title="Ano", yaxis_title="Patrimônio (R$)")
+        st.plotly_chart(fig_leque, use_container_width=True)
 
 # ============================================
 # 10. BALANCEAMENTO INTELIGENTE MENSAL
@@ -1447,11 +1527,7 @@ elif menu == "🔄 Balanceamento":
         st.info("Adicione ativos para ver as recomendações de balanceamento.")
     else:
         with st.spinner("Atualizando preços..."):
-            precos_info = []
-            for ticker in df['ticker']:
-                preco, _, _ = pegar_preco(ticker)
-                precos_info.append(preco if preco else 0)
-            df['preco'] = precos_info
+            df['preco'] = df['ticker'].map(pegar_precos(df['ticker']).set_index('ticker')['preco']).fillna(0)
             df['Patrimônio'] = df['qtd'] * df['preco']
         total_patrimonio = df['Patrimônio'].sum()
         metas = carregar_metas(st.session_state.user_id)
@@ -1553,98 +1629,174 @@ elif menu == "🔄 Balanceamento":
             st.dataframe(df_desvios, width='stretch')
             st.info("💡 **Dica:** Em cenários de crise, mantenha a calma e evite vender ativos desvalorizados. Use os aportes mensais para comprar nas classes que ficaram abaixo da meta, aproveitando preços baixos.")
 
+            st.subheader("🎲 Simulação de Monte Carlo")
+            st.caption("Milhares de cenários de 1 ano sorteados a partir da volatilidade e da correlação históricas (5 anos) dos seus ativos.")
+            col_m1, col_m2, col_m3 = st.columns(3)
+            caminhos = col_m1.select_slider("Cenários", options=[1_000, 5_000, 10_000, 20_000], value=10_000)
+            piso_pct = col_m2.slider("Piso de patrimônio (%)", 50, 100, 80)
+            semente = int(col_m3.number_input("Semente", min_value=0, value=42, step=1))
+            if st.button("▶️ Simular cenários"):
+                with st.spinner("Simulando..."):
+                    st.session_state['estresse'] = EstresseService.simular(
+                        df.groupby('ticker')['Patrimônio'].sum(),
+                        df.groupby('ticker')['setor'].first(),
+                        RetornosService.obter(df['ticker'], "5y"),
+                        caminhos=caminhos, piso=piso_pct / 100, semente=semente,
+                        processos=min(4, settings.MAX_WORKERS),
+                    )
+            resultado = st.session_state.get('estresse')
+            if resultado is not None and resultado.vazio:
+                st.warning("Sem cotações válidas para simular a carteira.")
+            elif resultado is not None:
+                p = resultado.percentis
+                col_r1, col_r2, col_r3, col_r4 = st.columns(4)
+                col_r1.metric("Cenário mediano", f"{p[50]:+.1f}%")
+                col_r2.metric("Pior 5%", f"{p[5]:+.1f}%")
+                col_r3.metric("CVaR 95%", f"-{resultado.cvar:.1f}%")
+                if resultado.prob_piso is not None:
+                    col_r4.metric("Chance de romper o piso", f"{resultado.prob_piso * 100:.1f}%")
+                faixas = resultado.faixas.rename(columns={'p5': 'Pessimista (p5)', 'p50': 'Mediano (p50)', 'p95': 'Otimista (p95)'})
+                fig_faixas = px.line(faixas, labels={'dia': 'Dias úteis', 'value': 'Patrimônio (R$)', 'variable': ''},
+                                     title=f"Faixas de patrimônio ({resultado.caminhos:,} cenários)")
+                st.plotly_chart(fig_faixas, use_container_width=True)
+                contrib = resultado.contribuicao.rename(columns={
+                    'valor_inicial': 'Valor atual (R$)', 'resultado_medio': 'Resultado médio (R$)',
+                    'resultado_cauda': 'Resultado nos piores 5% (R$)', 'participacao_perda': 'Parcela da perda (%)'})
+                st.write("**Quem responde pela perda nos piores cenários:**")
+                st.dataframe(contrib.style.format({
+                    'Valor atual (R$)': "R$ {:,.2f}", 'Resultado médio (R$)': "R$ {:,.2f}",
+                    'Resultado nos piores 5% (R$)': "R$ {:,.2f}", 'Parcela da perda (%)': "{:.1f}%"}), width='stretch')
+                if resultado.sem_historico:
+                    st.caption(f"Sem histórico (mantidos com valor constante): {', '.join(resultado.sem_historico)}")
+
+            st.subheader("🕰️ Crises Históricas")
+            st.caption("Sua carteira de hoje atravessando crises reais do mercado brasileiro.")
+            cenarios = CenarioService.carregar_cenarios()
+            if cenarios.empty:
+                st.info("Nenhum cenário cadastrado.")
+            else:
+                nome_cenario = st.selectbox("Cenário", cenarios['nome'].tolist(), index=len(cenarios) - 1)
+                cenario = cenarios[cenarios['nome'] == nome_cenario].iloc[0]
+                st.caption(f"{cenario['inicio']:%d/%m/%Y} a {cenario['fim']:%d/%m/%Y} — {cenario['descricao']}")
+                with st.spinner("Reproduzindo cenário..."):
+                    replay = CenarioService.reproduzir(df.groupby('ticker')['Patrimônio'].sum(),
+                                                       df.groupby('ticker')['setor'].first(), nome_cenario)
+                if replay is None:
+                    st.warning("Sem histórico de preços para este período.")
+                else:
+                    carteira = replay.por_classe.loc["Carteira"]
+                    col_c1, col_c2, col_c3 = st.columns(3)
+                    col_c1.metric("Queda máxima da carteira", f"{carteira['perda_max']:.1f}%")
+                    col_c2.metric("Perda no vale", f"R$ {-carteira['perda_max'] / 100 * carteira['valor_inicial']:,.2f}")
+                    col_c3.metric("Recuperação", f"{carteira['dias_recuperacao']} pregões"
+                                  if pd.notna(carteira['dias_recuperacao']) else "Ainda não recuperou")
+                    fig_cenario = px.line(replay.trajetoria, labels={'index': 'Data', 'value': 'Valor (R$)', 'variable': ''},
+                                          title=f"Carteira atual em: {nome_cenario}")
+                    st.plotly_chart(fig_cenario, use_container_width=True)
+                    tabela_cenario = replay.por_classe.copy()
+                    tabela_cenario['dias_recuperacao'] = tabela_cenario['dias_recuperacao'].astype(object).where(
+                        tabela_cenario['dias_recuperacao'].notna(), "não recuperou")
+                    tabela_cenario.columns = ['Valor atual (R$)', 'Queda pico-vale (%)', 'Pico', 'Vale', 'Recuperou em', 'Pregões até recuperar']
+                    st.dataframe(tabela_cenario.style.format({
+                        'Valor atual (R$)': "R$ {:,.2f}", 'Queda pico-vale (%)': "{:.1f}%",
+                        'Pico': "{:%d/%m/%Y}", 'Vale': "{:%d/%m/%Y}", 'Recuperou em': lambda d: f"{d:%d/%m/%Y}" if pd.notna(d) else "-"}),
+                        width='stretch')
+                    if replay.proxies:
+                        st.caption("Sem histórico na época, representados por índice: " +
+                                   ", ".join(f"{t} → {p}" for t, p in replay.proxies.items()))
+                    if replay.sem_proxy:
+                        st.caption(f"Mantidos com valor constante: {', '.join(replay.sem_proxy)}")
+
 # ============================================
 # 11. SCANNER DE OPORTUNIDADES
 # ============================================
 elif menu == "🔍 Scanner de Oportunidades":
     st.title("🔍 Scanner de Oportunidades")
     st.markdown("### Encontre ativos baratos em diversas categorias")
-    categoria = st.selectbox("Escolha uma categoria para analisar", 
-                             ["FIIs", "Ações", "ETFs Nacionais", "BDRs", "Internacional"])
-    if categoria == "FIIs":
-        tickers = SCANNER_FIIS
-    elif categoria == "Ações":
-        tickers = SCANNER_ACOES
-    elif categoria == "ETFs Nacionais":
-        tickers = SCANNER_ETFS
-    elif categoria == "BDRs":
-        tickers = SCANNER_BDRS
-    else:
-        tickers = SCANNER_INTERNACIONAL
+    scanner = ScannerService()
+    categoria = st.selectbox("Escolha uma categoria para analisar", ScannerService.CLASSES)
     sensibilidade = st.select_slider("Sensibilidade da análise", 
                                      options=["Conservador", "Moderado", "Agressivo"], 
                                      value="Moderado")
-    if st.button("🔍 Analisar oportunidades", use_container_width=True):
-        with st.spinner(f"Analisando {len(tickers)} ativos..."):
-            resultados = []
-            for ticker in tickers:
-                dados_hist = buscar_dados_historicos(ticker)
+    # O resultado da varredura fica salvo em disco; a tela só filtra e ordena
+    resultados = scanner.carregar_resultados(categoria)
+    col_info, col_botao = st.columns([3, 1])
+    with col_botao:
+        varrer = st.button("🔄 Atualizar varredura", use_container_width=True)
+    if varrer:
+        # Resultados aparecem conforme cada lote de tickers fica pronto
+        universo = scanner.carregar_universo(categoria)
+        barra = st.progress(0.0, text=f"Analisando {len(universo)} ativos...")
+        contagens = st.empty()
+        tabela = st.empty()
+        parciais, processados = [], 0
+        for concluidos, lote in scanner.varrer_progressivo(categoria):
+            processados += len(concluidos)
+            if not lote.empty:
+                parciais.append(lote)
+            barra.progress(processados / max(len(universo), 1),
+                           text=f"{processados}/{len(universo)} ativos analisados")
+            if parciais:
+                df_parcial = montar_tabela_scanner(pd.concat(parciais, ignore_index=True), sensibilidade)
+                por_status = df_parcial['Status'].value_counts()
+                contagens.markdown(" · ".join(
+                    f"**{status}**: {por_status.get(status, 0)}" for status in AnaliseService.MENSAGENS))
+                tabela.dataframe(estilizar_tabela_scanner(df_parcial), width='stretch', height=400)
+        barra.empty()
+        contagens.empty()
+        tabela.empty()
+        resultados = scanner.carregar_resultados(categoria)
+    with col_info:
+        if resultados.empty:
+            st.info("Nenhuma varredura salva para esta categoria. Clique em **Atualizar varredura**.")
+        else:
+            st.caption(f"Calculado em {resultados['calculado_em'].max():%d/%m/%Y %H:%M} · "
+                       f"{len(resultados)} ativos com dados")
+    if not resultados.empty:
+        with st.expander("🧪 Filtros personalizados"):
+            st.caption("Ex.: `dy > 8 and variacao_anual < -10 and preco < percentil_20`. Variáveis: " +
+                       ", ".join(f"`{v}`" for v in FiltroService.VARIAVEIS))
+            filtros_salvos = carregar_filtros(st.session_state.user_id)
+            filtro_escolhido = st.selectbox("Filtro salvo", ["(nenhum)"] + list(filtros_salvos))
+            expressao = st.text_input("Expressão",
+                                      value=filtros_salvos.get(filtro_escolhido, ""),
+                                      key=f"expressao_filtro_{filtro_escolhido}")
+            col_nome, col_salvar, col_excluir = st.columns([2, 1, 1])
+            with col_nome:
+                nome_filtro = st.text_input("Nome para salvar",
+                                            value=filtro_escolhido if filtro_escolhido in filtros_salvos else "")
+            with col_salvar:
+                if st.button("💾 Salvar filtro") and nome_filtro.strip() and expressao.strip():
+                    if salvar_filtro(st.session_state.user_id, nome_filtro, expressao):
+                        st.success(f"✅ Filtro {nome_filtro} salvo!")
+            with col_excluir:
+                if filtro_escolhido in filtros_salvos and st.button("🗑️ Excluir filtro"):
+                    excluir_filtro(st.session_state.user_id, filtro_escolhido)
+                    st.rerun()
+        if expressao.strip():
+            try:
+                resultados = FiltroService.aplicar(expressao, resultados)
+                st.caption(f"Filtro `{FiltroService.normalizar(expressao)}`: {len(resultados)} ativos")
+            except FiltroInvalido as e:
+                st.error(f"❌ {e}")
+        df_scan = montar_tabela_scanner(resultados, sensibilidade)
+        filtro_status = st.multiselect("Filtrar por status", list(AnaliseService.MENSAGENS), default=[])
+        if filtro_status:
+            df_scan = df_scan[df_scan['Status'].isin(filtro_status)]
+        st.subheader("Resultados ordenados (mais baratos primeiro)")
+        st.dataframe(estilizar_tabela_scanner(df_scan), width='stretch', height=400)
+        if not df_scan.empty:
+            st.subheader("🔎 Ver análise detalhada")
+            ticker_detalhe = st.selectbox("Selecione um ativo para análise completa", df_scan['Ticker'].tolist())
+            if ticker_detalhe:
+                dados_hist = buscar_dados_historicos(ticker_detalhe)
                 if dados_hist:
-                    status, msg, cor, explicacao, pontuacao = analisar_preco_ativo(ticker, dados_hist)
-                    preco = dados_hist['preco_atual']
-                    dy = dados_hist['dividend_yield']
-                    if sensibilidade == "Agressivo":
-                        if pontuacao <= -30:
-                            status = "oportunidade"
-                            msg = "🔥 OPORTUNIDADE!"
-                        elif pontuacao <= -10:
-                            status = "barato"
-                            msg = "👍 Barato"
-                        elif pontuacao <= 0:
-                            status = "neutro"
-                            msg = "⚖️ Neutro"
-                        elif pontuacao <= 15:
-                            status = "atencao"
-                            msg = "⚠️ Atenção"
-                        else:
-                            status = "caro"
-                            msg = "❌ Caro"
-                    resultados.append({
-                        "Ticker": ticker,
-                        "Status": status,
-                        "Preço": preco,
-                        "DY (%)": dy if dy else 0,
-                        "Pontuação": pontuacao,
-                        "Detalhes": explicacao[:100] + "..."
-                    })
-            if resultados:
-                df_scan = pd.DataFrame(resultados)
-                df_scan = df_scan.sort_values("Pontuação", ascending=True)
-                st.subheader("Resultados ordenados (mais baratos primeiro)")
-                def colorir_status(val):
-                    if val == 'oportunidade':
-                        return 'background-color: #006400; color: white'
-                    elif val == 'barato':
-                        return 'background-color: #32CD32; color: black'
-                    elif val == 'neutro':
-                        return 'background-color: #D4AF37; color: black'
-                    elif val == 'atencao':
-                        return 'background-color: #FFA500; color: black'
-                    elif val == 'caro':
-                        return 'background-color: #8B0000; color: white'
-                    return ''
-                st.dataframe(
-                    df_scan.style.format({
-                        "Preço": "R$ {:.2f}",
-                        "DY (%)": "{:.2f}%",
-                        "Pontuação": "{:.0f}"
-                    }).applymap(colorir_status, subset=["Status"]),
-                    width='stretch',
-                    height=400
-                )
-                st.subheader("🔎 Ver análise detalhada")
-                ticker_detalhe = st.selectbox("Selecione um ativo para análise completa", df_scan['Ticker'].tolist())
-                if ticker_detalhe:
-                    dados_hist = buscar_dados_historicos(ticker_detalhe)
-                    if dados_hist:
-                        status, msg, cor, explicacao, pontuacao = analisar_preco_ativo(ticker_detalhe, dados_hist)
-                        st.markdown(f"<h3 style='color:{cor}'>{msg}</h3>", unsafe_allow_html=True)
-                        st.markdown(explicacao)
-                        fig = plotar_grafico_historico(dados_hist, ticker_detalhe)
-                        if fig:
-                            st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("Nenhum dado encontrado para os ativos desta categoria.")
+                    status, msg, cor, explicacao, pontuacao = analisar_preco_ativo(ticker_detalhe, dados_hist)
+                    st.markdown(f"<h3 style='color:{cor}'>{msg}</h3>", unsafe_allow_html=True)
+                    st.markdown(explicacao)
+                    fig = plotar_grafico_historico(dados_hist, ticker_detalhe)
+                    if fig:
+                        st.plotly_chart(fig, use_container_width=True)
 
 # ============================================
 # RODAPÉ
@@ -1652,3 +1804,6 @@ elif menu == "🔍 Scanner de Oportunidades":
 st.sidebar.markdown("---")
 st.sidebar.caption(f"🕐 {datetime.now().strftime('%d/%m/%Y %H:%M')}")
 st.sidebar.caption("💎 Igorbarbo Private Banking v10.0 - Completo")
+if settings.DEBUG_MODE:
+    with st.sidebar.expander("🗄️ Banco de dados"):
+        st.json(banco.estatisticas())
@@ -12,9 +12,23 @@ class Settings:
     ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD") or secrets.token_urlsafe(16)
     DB_PATH: str = os.getenv("DB_PATH", "invest_v8_secure.db")
     BACKUP_DIR: str = os.getenv("BACKUP_DIR", "backups")
+    CACHE_DIR: str = os.getenv("CACHE_DIR", "data/cache")
+    RAW_DIR: str = os.getenv("RAW_DIR", "data/raw")
+    PROCESSED_DIR: str = os.getenv("PROCESSED_DIR", "data/processed")
+    UNIVERSO_PATH: str = os.getenv("UNIVERSO_PATH", "data/universo_b3.csv")
+    CENARIOS_PATH: str = os.getenv("CENARIOS_PATH", "data/cenarios_crise.csv")
+    MARKET_PROVIDER: str = os.getenv("MARKET_PROVIDER", "yfinance")
     YF_CACHE_TTL: int = int(os.getenv("YF_CACHE_TTL", "300"))
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "10"))
     YF_TIMEOUT: int = int(os.getenv("YF_TIMEOUT", "10"))
+    DOWNLOAD_LOTE: int = int(os.getenv("DOWNLOAD_LOTE", "100"))
+    MAX_MATRIZES: int = int(os.getenv("MAX_MATRIZES", "64"))
+    YF_NEGATIVE_TTL: int = int(os.getenv("YF_NEGATIVE_TTL", "1800"))
+    CIRCUITO_FALHAS: int = int(os.getenv("CIRCUITO_FALHAS", "5"))
+    CIRCUITO_ESPERA: int = int(os.getenv("CIRCUITO_ESPERA", "60"))
+    AQUECIMENTO_ATIVO: bool = os.getenv("AQUECIMENTO_ATIVO", "true").lower() == "true"
+    AQUECIMENTO_INTERVALO: int = int(os.getenv("AQUECIMENTO_INTERVALO", "240"))
+    TAXA_LIVRE_RISCO: float = float(os.getenv("TAXA_LIVRE_RISCO", "0.10"))
     ENABLE_AUDIT_LOG: bool = os.getenv("ENABLE_AUDIT_LOG", "true").lower() == "true"
     DEBUG_MODE: bool = os.getenv("DEBUG_MODE", "false").lower() == "true"
     
@@ -0,0 +1,73 @@
+# database/benchmark.py
+"""
+Tempo das consultas por usuário com e sem os índices da migração 3, em um banco
+temporário com 100 mil posições. Uso: python -m database.benchmark [posicoes] [usuarios]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from database.conexao import GerenciadorConexoes
+from database.migracoes import aplicar_migracoes
+
+CONSULTAS = {
+    'ativos': ("SELECT * FROM ativos WHERE user_id = ?", False),
+    'alertas': ("SELECT id, ticker, tipo, preco, ativo, criado_em FROM alertas WHERE user_id = ? AND ativo = 1", False),
+    'metas': ("SELECT classe, percentual FROM metas_alocacao WHERE user_id = ?", False),
+    'ativo do usuário': ("SELECT qtd, pm FROM ativos WHERE user_id = ? AND ticker = ?", True),
+}
+
+
+def popular(banco: GerenciadorConexoes, posicoes: int, usuarios: int):
+    rng = random.Random(42)
+    tickers = [f"ATV{i:03d}3" for i in range(500)]
+    classes = ["Ações", "FII Papel", "FII Tijolo", "ETF", "Renda Fixa"]
+    with banco.transacao() as conn:
+        conn.executemany("INSERT INTO usuarios (id, username, nome, senha_hash) VALUES (?, ?, ?, '')",
+                         [(u, f"u{u}", f"Usuário {u}") for u in range(1, usuarios + 1)])
+        conn.executemany("INSERT INTO ativos (user_id, ticker, qtd, pm, setor) VALUES (?, ?, ?, ?, ?)",
+                         [(rng.randint(1, usuarios), rng.choice(tickers), rng.randint(1, 1000),
+                           rng.uniform(5, 100), rng.choice(classes)) for _ in range(posicoes)])
+        conn.executemany("INSERT INTO alertas (id, user_id, ticker, tipo, preco, ativo, criado_em) "
+                         "VALUES (?, ?, ?, 'acima', ?, ?, '01/01/2025 10:00')",
+                         [(f"a{i}", rng.randint(1, usuarios), rng.choice(tickers), rng.uniform(5, 100),
+                           rng.random() < 0.5) for i in range(posicoes // 5)])
+        conn.executemany("INSERT INTO metas_alocacao (user_id, classe, percentual) VALUES (?, ?, 20)",
+                         [(u, c) for u in range(1, usuarios + 1) for c in classes])
+    return tickers
+
+
+def medir(banco: GerenciadorConexoes, usuarios: int, tickers, repeticoes: int = 2000):
+    rng = random.Random(7)
+    conn = banco.conexao()
+    resultados = {}
+    for nome, (sql, com_ticker) in CONSULTAS.items():
+        parametros = [(rng.randint(1, usuarios),) + ((rng.choice(tickers),) if com_ticker else ())
+                      for _ in range(repeticoes)]
+        inicio = time.perf_counter()
+        for p in parametros:
+            conn.execute(sql, p).fetchall()
+        plano = conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros[0]).fetchall()
+        resultados[nome] = ((time.perf_counter() - inicio) / repeticoes * 1000, plano[-1][-1])
+    return resultados
+
+
+def main(posicoes: int = 100_000, usuarios: int = 2_000):
+    with tempfile.TemporaryDirectory() as pasta:
+        banco = GerenciadorConexoes(os.path.join(pasta, "benchmark.db"))
+        aplicar_migracoes(banco, ate=2)
+        tickers = popular(banco, posicoes, usuarios)
+        antes = medir(banco, usuarios, tickers)
+        aplicar_migracoes(banco, ate=3)
+        depois = medir(banco, usuarios, tickers)
+        banco.fechar_todas()
+
+    print(f"{posicoes:,} posições, {usuarios:,} usuários (ms por consulta)")
+    for nome in CONSULTAS:
+        (t_antes, plano_antes), (t_depois, plano_depois) = antes[nome], depois[nome]
+        print(f"  {nome:<18} {t_antes:8.3f} -> {t_depois:7.3f}  ({t_antes / t_depois:5.0f}x)  {plano_depois}")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,217 @@
+# database/conexao.py
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# Gerenciadores por (arquivo, row_factory), compartilhados por todas as sessões do processo
+_gerenciadores: Dict[Tuple[str, Optional[Callable]], "GerenciadorConexoes"] = {}
+_gerenciadores_lock = threading.Lock()
+
+
+class _Contadores:
+    """Contagens e tempos (s) de um gerenciador, somados por todas as threads."""
+
+    TIPOS = ("conexoes", "comandos", "transacoes")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.contagens = dict.fromkeys(self.TIPOS, 0)
+        self.tempos = dict.fromkeys(self.TIPOS, 0.0)
+
+    def somar(self, tipo: str, segundos: float):
+        with self.lock:
+            self.contagens[tipo] += 1
+            self.tempos[tipo] += segundos
+
+
+class _CursorMedido(sqlite3.Cursor):
+    """Cursor que soma o tempo de cada comando nos contadores do gerenciador."""
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self.connection.contadores.somar("comandos", time.perf_counter() - inicio)
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            self.connection.contadores.somar("comandos", time.perf_counter() - inicio)
+
+
+class _ConexaoMedida(sqlite3.Connection):
+    contadores: _Contadores
+
+    def cursor(self, factory=_CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+class _Emprestimo:
+    """
+    Posse de uma conexão pela thread, guardada no seu threading.local. Quando a thread
+    termina o Python descarta o local, o empréstimo é coletado e a conexão volta ao pool.
+    """
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+class GerenciadorConexoes:
+    """
+    Pool de conexões SQLite. Cada thread usa uma conexão só sua enquanto vive; o
+    Streamlit roda cada rerun numa thread nova, então, quando a thread termina, a
+    conexão (com o cache de comandos preparados do sqlite3 e os PRAGMAs já
+    aplicados) volta a um pool limitado de conexões ociosas e é reaproveitada pela
+    próxima thread, em vez de cada interação abrir uma conexão. O arquivo usa WAL,
+    então leitores não bloqueiam o escritor nem uns aos outros; `busy_timeout` faz
+    quem encontra o banco travado esperar em vez de falhar. As conexões ficam em
+    autocommit: escritas com mais de um comando usam `transacao()`.
+    """
+
+    BUSY_TIMEOUT_MS = 5000
+    COMANDOS_EM_CACHE = 256
+    # Conexões ociosas guardadas; as que sobram ao serem devolvidas são fechadas
+    MAX_OCIOSAS = 8
+
+    def __init__(self, caminho: str, row_factory: Optional[Callable] = None):
+        self.caminho = caminho
+        self.row_factory = row_factory
+        self.contadores = _Contadores()
+        self._local = threading.local()
+        self._ociosas: List[sqlite3.Connection] = []
+        self._emprestadas: Set[sqlite3.Connection] = set()
+        self._reaproveitadas = 0
+        self._lock = threading.Lock()
+
+    def conexao(self) -> sqlite3.Connection:
+        """Conexão da thread atual (não feche: ela volta ao pool quando a thread termina)."""
+        emprestimo = getattr(self._local, "emprestimo", None)
+        if emprestimo is None:
+            conn = self._retirar()
+            emprestimo = _Emprestimo(conn)
+            weakref.finalize(emprestimo, self._devolver, conn)
+            self._local.emprestimo = emprestimo
+        return emprestimo.conn
+
+    @contextmanager
+    def transacao(self) -> Iterator[sqlite3.Connection]:
+        """
+        BEGIN IMMEDIATE ... COMMIT (ROLLBACK se der erro). Reserva a escrita já no
+        início, para não falhar no meio ao disputar o banco com outra sessão. Dentro
+        de uma transação já aberta, só participa dela.
+        """
+        conn = self.conexao()
+        if conn.in_transaction:
+            yield conn
+            return
+        inicio = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self.contadores.somar("transacoes", time.perf_counter() - inicio)
+
+    def estatisticas(self) -> Dict[str, float]:
+        """Contadores desde a criação: conexões, comandos e transações, com tempos em ms."""
+        c = self.contadores
+        with c.lock, self._lock:
+            comandos = c.contagens['comandos']
+            return {
+                'conexoes_abertas': len(self._emprestadas) + len(self._ociosas),
+                'conexoes_ociosas': len(self._ociosas),
+                'conexoes_criadas': c.contagens['conexoes'],
+                'conexoes_reaproveitadas': self._reaproveitadas,
+                'tempo_conexao_ms': c.tempos['conexoes'] * 1000,
+                'comandos': comandos,
+                'tempo_comandos_ms': c.tempos['comandos'] * 1000,
+                'tempo_medio_comando_ms': c.tempos['comandos'] * 1000 / comandos if comandos else 0.0,
+                'transacoes': c.contagens['transacoes'],
+                'tempo_transacoes_ms': c.tempos['transacoes'] * 1000,
+            }
+
+    def fechar_todas(self):
+        """
+        Fecha todas as conexões (as threads abrem novas na próxima consulta). Para
+        encerrar o processo ou trocar o arquivo; não chame com consultas em andamento.
+        """
+        with self._lock:
+            conexoes = self._ociosas + list(self._emprestadas)
+            self._ociosas, self._emprestadas = [], set()
+        for conn in conexoes:
+            conn.close()
+        self._local = threading.local()
+
+    def _retirar(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._ociosas:
+                conn = self._ociosas.pop()
+                self._emprestadas.add(conn)
+                self._reaproveitadas += 1
+                return conn
+        conn = self._abrir()
+        with self._lock:
+            self._emprestadas.add(conn)
+        return conn
+
+    def _devolver(self, conn: sqlite3.Connection):
+        """Chamado quando a thread dona termina: a conexão volta ao pool (ou é fechada)."""
+        with self._lock:
+            if conn not in self._emprestadas:
+                return  # fechada por fechar_todas
+            self._emprestadas.discard(conn)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._ociosas) < self.MAX_OCIOSAS:
+                self._ociosas.append(conn)
+                return
+        conn.close()
+
+    def _abrir(self) -> sqlite3.Connection:
+        inicio = time.perf_counter()
+        conn = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None,
+                               timeout=self.BUSY_TIMEOUT_MS / 1000, factory=_ConexaoMedida,
+                               cached_statements=self.COMANDOS_EM_CACHE)
+        conn.contadores = self.contadores
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Em WAL, NORMAL só sincroniza o disco nos checkpoints: seguro contra corrupção,
+        # e uma queda de energia perde no máximo as últimas transações
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self.contadores.somar("conexoes", time.perf_counter() - inicio)
+        return conn
+
+
+def get_gerenciador(caminho: str, row_factory: Optional[Callable] = None) -> GerenciadorConexoes:
+    """Gerenciador compartilhado do arquivo `caminho`."""
+    chave = (caminho, row_factory)
+    with _gerenciadores_lock:
+        gerenciador = _gerenciadores.get(chave)
+        if gerenciador is None:
+            gerenciador = _gerenciadores[chave] = GerenciadorConexoes(caminho, row_factory)
+        return gerenciador
@@ -0,0 +1,203 @@
+# database/migracoes.py
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple, Union
+from database.conexao import GerenciadorConexoes
+
+# Bancos já migrados neste processo: a verificação roda uma vez, não a cada rerun
+_migrados: set = set()
+_migrados_lock = threading.Lock()
+
+# Arquivo que o app.py e o modules/database.py usavam antes de settings.DB_PATH
+BANCO_LEGADO = "invest_v8.db"
+
+
+def _adicionar_ultimo_login(conn):
+    # Bancos criados pelo app.py não têm a coluna usada pelo UsuarioRepository
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(usuarios)").fetchall()}
+    if 'ultimo_login' not in colunas:
+        conn.execute("ALTER TABLE usuarios ADD COLUMN ultimo_login TEXT")
+
+
+# (versão, descrição, comandos SQL ou função que recebe a conexão), em ordem.
+# Nunca altere uma migração já publicada: acrescente outra no fim.
+MIGRACOES: List[Tuple[int, str, Union[Sequence[str], Callable]]] = [
+    (1, "Esquema base", (
+        '''CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            nome TEXT NOT NULL,
+            senha_hash TEXT NOT NULL,
+            ultimo_login TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS ativos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            qtd REAL NOT NULL,
+            pm REAL NOT NULL,
+            setor TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES usuarios(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS metas_alocacao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            classe TEXT NOT NULL,
+            percentual REAL NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES usuarios(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS alertas (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            preco REAL NOT NULL,
+            ativo BOOL NOT NULL,
+            criado_em TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES usuarios(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS filtros_salvos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            nome TEXT NOT NULL,
+            expressao TEXT NOT NULL,
+            criado_em TEXT NOT NULL,
+            UNIQUE(user_id, nome),
+            FOREIGN KEY(user_id) REFERENCES usuarios(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS logs_auditoria (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            acao TEXT NOT NULL,
+            detalhes TEXT,
+            ip_address TEXT,
+            criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )''',
+    )),
+    (2, "usuarios.ultimo_login", _adicionar_ultimo_login),
+    (3, "Índices das consultas por usuário", (
+        # Cobrem as consultas das telas: a leitura sai só do índice, sem ir à tabela
+        "CREATE INDEX IF NOT EXISTS idx_ativos_usuario ON ativos(user_id, ticker, qtd, pm, setor)",
+        "CREATE INDEX IF NOT EXISTS idx_alertas_usuario ON alertas(user_id, ativo, id, ticker, tipo, preco, criado_em)",
+        "CREATE INDEX IF NOT EXISTS idx_metas_usuario ON metas_alocacao(user_id, classe, percentual)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_usuario ON logs_auditoria(user_id, criado_em)",
+        "ANALYZE",
+    )),
+    (4, "Uma posição por (user_id, ticker)", (
+        # Duplicatas antigas viram uma linha só: quantidades somadas, preço médio ponderado
+        # (sem quantidade no grupo, fica o maior preço médio: pm é NOT NULL)
+        '''UPDATE ativos SET
+            qtd = (SELECT SUM(a.qtd) FROM ativos a WHERE a.user_id = ativos.user_id AND a.ticker = ativos.ticker),
+            pm = (SELECT COALESCE(SUM(a.qtd * a.pm) / NULLIF(SUM(a.qtd), 0), MAX(a.pm)) FROM ativos a
+                  WHERE a.user_id = ativos.user_id AND a.ticker = ativos.ticker)
+        WHERE id IN (SELECT MIN(id) FROM ativos GROUP BY user_id, ticker HAVING COUNT(*) > 1)''',
+        "DELETE FROM ativos WHERE id NOT IN (SELECT MIN(id) FROM ativos GROUP BY user_id, ticker)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_ativos_usuario_ticker ON ativos(user_id, ticker)",
+    )),
+    (5, "Livro de transações; ativos vira a posição materializada", (
+        # `resultado`: lucro da venda ou provento líquido, calculado ao registrar
+        '''CREATE TABLE IF NOT EXISTS transacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ('compra', 'venda', 'dividendo', 'desdobramento')),
+            data TEXT NOT NULL,
+            qtd REAL NOT NULL,
+            preco REAL NOT NULL DEFAULT 0,
+            taxas REAL NOT NULL DEFAULT 0,
+            resultado REAL NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES usuarios(id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_transacoes_ticker ON transacoes(user_id, ticker, data, id)",
+        "CREATE INDEX IF NOT EXISTS idx_transacoes_data ON transacoes(user_id, data, id)",
+        "ALTER TABLE ativos ADD COLUMN lucro_realizado REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE ativos ADD COLUMN proventos REAL NOT NULL DEFAULT 0",
+        # O índice de cobertura passa a incluir as colunas novas
+        "DROP INDEX IF EXISTS idx_ativos_usuario",
+        "CREATE INDEX idx_ativos_usuario ON ativos(user_id, ticker, qtd, pm, setor, lucro_realizado, proventos)",
+        # Posições existentes entram no livro como uma compra pelo preço médio
+        '''INSERT INTO transacoes (user_id, ticker, tipo, data, qtd, preco)
+            SELECT user_id, ticker, 'compra', date('now', 'localtime'), qtd, pm FROM ativos WHERE qtd > 0''',
+    )),
+    (6, "Fotografias diárias do patrimônio", (
+        # Sem rowid, as linhas ficam ordenadas pela chave: a série de um usuário é uma
+        # única leitura contígua. `classes` é um JSON {classe: valor}
+        '''CREATE TABLE IF NOT EXISTS patrimonio_diario (
+            user_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            patrimonio REAL NOT NULL,
+            custo REAL NOT NULL,
+            classes TEXT NOT NULL,
+            PRIMARY KEY (user_id, data)
+        ) WITHOUT ROWID''',
+    )),
+]
+
+
+def versao_atual(banco: GerenciadorConexoes) -> int:
+    """Maior versão aplicada (0 em banco novo)."""
+    conn = banco.conexao()
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_versao (
+        versao INTEGER PRIMARY KEY,
+        descricao TEXT NOT NULL,
+        aplicada_em TEXT NOT NULL
+    )''')
+    return conn.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao").fetchone()[0]
+
+
+def aplicar_migracoes(banco: GerenciadorConexoes, ate: int = None) -> List[int]:
+    """
+    Aplica, em ordem, as migrações que faltam (até a versão `ate`, se informada), cada
+    uma na sua transação junto com o registro em schema_versao. Depois da primeira
+    chamada completa no processo vira um no-op. Devolve as versões aplicadas agora.
+    """
+    with _migrados_lock:
+        if banco.caminho in _migrados and ate is None:
+            return []
+    aplicadas = []
+    atual = versao_atual(banco)
+    for versao, descricao, passos in MIGRACOES:
+        if versao <= atual or (ate is not None and versao > ate):
+            continue
+        with banco.transacao() as conn:
+            # Outro processo pode ter aplicado enquanto esperávamos a trava de escrita
+            if conn.execute("SELECT 1 FROM schema_versao WHERE versao = ?", (versao,)).fetchone():
+                continue
+            if callable(passos):
+                passos(conn)
+            else:
+                for comando in passos:
+                    conn.execute(comando)
+            conn.execute("INSERT INTO schema_versao (versao, descricao, aplicada_em) VALUES (?, ?, ?)",
+                         (versao, descricao, time.strftime('%Y-%m-%d %H:%M:%S')))
+        aplicadas.append(versao)
+    if ate is None:
+        with _migrados_lock:
+            _migrados.add(banco.caminho)
+    return aplicadas
+
+
+def adotar_banco_legado(caminho: str, legado: str = BANCO_LEGADO) -> bool:
+    """
+    Instalações anteriores gravavam tudo em `legado` (invest_v8.db). Se o banco
+    configurado em `caminho` ainda não existe e o legado existe, copia o legado para
+    `caminho` (cópia consistente pela API de backup do SQLite; o arquivo antigo fica
+    intacto). Deve rodar antes de abrir `caminho`. Devolve True se copiou.
+    """
+    destino, origem = Path(caminho), Path(legado)
+    with _migrados_lock:
+        if destino.exists() or not origem.is_file() or destino.resolve() == origem.resolve():
+            return False
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+        fonte, copia = sqlite3.connect(str(origem)), sqlite3.connect(str(temporario))
+        try:
+            fonte.backup(copia)
+        finally:
+            copia.close()
+            fonte.close()
+        os.replace(temporario, destino)
+        return True
@@ -1,33 +1,38 @@
+import json
+import math
 import sqlite3
 from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from config.settings import settings
+from database.conexao import GerenciadorConexoes, get_gerenciador
+from database.migracoes import adotar_banco_legado, aplicar_migracoes
+
+def banco_padrao() -> GerenciadorConexoes:
+    """Gerenciador compartilhado do banco do app (settings.DB_PATH), o mesmo que o app.py usa."""
+    adotar_banco_legado(settings.DB_PATH)
+    return get_gerenciador(settings.DB_PATH)
+
 
 class DatabaseManager:
-    def __init__(self, db_path="database/invest.db"):
-        self.db_path = db_path
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or settings.DB_PATH
+        if db_path is None:
+            adotar_banco_legado(self.db_path)
+        self.banco = get_gerenciador(self.db_path, row_factory=sqlite3.Row)
         self._init_database()
 
     def _init_database(self):
-        with self.get_connection() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS usuarios (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE,
-                    nome TEXT,
-                    senha_hash TEXT,
-                    ultimo_login DATETIME
-                )
-            """)
-            # Adicione aqui as outras tabelas (ativos, transacoes, etc)
+        aplicar_migracoes(self.banco)
 
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
+        # Conexão da thread, reaproveitada (autocommit; não é fechada ao sair do bloco)
+        yield self.banco.conexao()
 
     def backup(self):
         # Lógica de backup simplificada
@@ -48,5 +53,362 @@ class UsuarioRepository:
         with self.db.get_connection() as conn:
             conn.execute("UPDATE usuarios SET ultimo_login = ? WHERE id = ?", 
                          (datetime.datetime.now(), user_id))
-            conn.commit()
             
+
+
+class LoteInvalido(ValueError):
+    """Lote rejeitado; `invalidos` traz as linhas problemáticas com a coluna `motivo`."""
+
+    def __init__(self, invalidos: pd.DataFrame):
+        self.invalidos = invalidos
+        resumo = "; ".join(f"{linha.ticker}: {linha.motivo}" for linha in invalidos.head(5).itertuples())
+        super().__init__(f"{len(invalidos)} linha(s) inválida(s) — {resumo}")
+
+
+class AtivoRepository:
+    """
+    Posições da carteira (tabela `ativos`, uma linha por usuário e ticker). Escritas
+    em lote: o lote inteiro é validado de uma vez e gravado com `executemany` em uma
+    única transação.
+    """
+
+    COLUNAS = ['ticker', 'qtd', 'pm', 'setor']
+
+    # Ticker já na carteira: soma as quantidades e recalcula o preço médio ponderado
+    # (no SET, `ativos.*` ainda são os valores anteriores)
+    SQL_UPSERT = (
+        "INSERT INTO ativos (user_id, ticker, qtd, pm, setor) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id, ticker) DO UPDATE SET "
+        "pm = (ativos.qtd * ativos.pm + excluded.qtd * excluded.pm) / (ativos.qtd + excluded.qtd), "
+        "qtd = ativos.qtd + excluded.qtd, setor = excluded.setor"
+    )
+
+    def __init__(self, banco: GerenciadorConexoes = None):
+        self.banco = banco or banco_padrao()
+        aplicar_migracoes(self.banco)
+
+    def carregar_por_usuario(self, user_id: int) -> List[Dict]:
+        linhas = self.banco.conexao().execute(
+            "SELECT ticker, qtd, pm, setor FROM ativos WHERE user_id = ? AND qtd > 0 ORDER BY ticker",
+            (user_id,)).fetchall()
+        return [dict(zip(self.COLUNAS, linha)) for linha in linhas]
+
+    @classmethod
+    def validar_lote(cls, ativos: pd.DataFrame) -> pd.DataFrame:
+        """
+        Normaliza (ticker em maiúsculas, números como float) e valida o lote inteiro
+        com operações de coluna. Levanta LoteInvalido se alguma linha for rejeitada.
+        """
+        faltando = [c for c in cls.COLUNAS if c not in ativos.columns]
+        if faltando:
+            raise ValueError(f"Colunas ausentes no lote: {', '.join(faltando)}")
+        lote = ativos[cls.COLUNAS].copy()
+        lote['ticker'] = lote['ticker'].astype(str).str.upper().str.strip()
+        lote['setor'] = lote['setor'].fillna("").astype(str).str.strip()
+        lote['qtd'] = pd.to_numeric(lote['qtd'], errors='coerce')
+        lote['pm'] = pd.to_numeric(lote['pm'], errors='coerce')
+
+        motivo = pd.Series("", index=lote.index)
+        motivo = motivo.mask(lote['setor'] == "", "classe vazia")
+        motivo = motivo.mask(~(lote['pm'] > 0) | ~np.isfinite(lote['pm']), "preço médio deve ser maior que zero")
+        motivo = motivo.mask(~(lote['qtd'] > 0) | ~np.isfinite(lote['qtd']), "quantidade deve ser maior que zero")
+        motivo = motivo.mask(lote['ticker'].str.len() < 2, "ticker inválido")
+        invalidos = motivo != ""
+        if invalidos.any():
+            raise LoteInvalido(lote.loc[invalidos, ['ticker']].assign(motivo=motivo[invalidos]))
+        return lote.astype({'qtd': float, 'pm': float})
+
+    def salvar_lote(self, user_id: int, ativos: pd.DataFrame) -> int:
+        """
+        Grava todas as posições do lote (upsert por ticker) em uma transação, cada uma
+        registrada no livro como compra de hoje pelo preço médio. Devolve quantas.
+        """
+        lote = self.validar_lote(ativos)
+        if lote.empty:
+            return 0
+        usuarios = [user_id] * len(lote)
+        hoje = [date.today().isoformat()] * len(lote)
+        with self.banco.transacao() as conn:
+            conn.executemany("INSERT INTO transacoes (user_id, ticker, tipo, data, qtd, preco) "
+                             "VALUES (?, ?, 'compra', ?, ?, ?)",
+                             zip(usuarios, lote['ticker'], hoje, lote['qtd'], lote['pm']))
+            conn.executemany(self.SQL_UPSERT,
+                             zip(usuarios, lote['ticker'], lote['qtd'], lote['pm'], lote['setor']))
+        return len(lote)
+
+
+class MetaRepository:
+    """Metas de alocação por classe (`metas_alocacao`), sempre gravadas como um conjunto."""
+
+    def __init__(self, banco: GerenciadorConexoes = None):
+        self.banco = banco or banco_padrao()
+        aplicar_migracoes(self.banco)
+
+    def carregar(self, user_id: int) -> Dict[str, float]:
+        linhas = self.banco.conexao().execute(
+            "SELECT classe, percentual FROM metas_alocacao WHERE user_id = ?", (user_id,)).fetchall()
+        return {classe: percentual for classe, percentual in linhas}
+
+    def salvar(self, user_id: int, metas: Dict[str, float]) -> int:
+        """Substitui as metas do usuário em uma transação (percentuais de 0 a 100)."""
+        percentuais = pd.to_numeric(pd.Series(metas, dtype=object), errors='coerce')
+        invalidos = percentuais.isna() | (percentuais < 0) | (percentuais > 100)
+        if invalidos.any():
+            raise LoteInvalido(pd.DataFrame({'ticker': percentuais.index[invalidos],
+                                             'motivo': "percentual deve estar entre 0 e 100"}))
+        with self.banco.transacao() as conn:
+            conn.execute("DELETE FROM metas_alocacao WHERE user_id = ?", (user_id,))
+            conn.executemany("INSERT INTO metas_alocacao (user_id, classe, percentual) VALUES (?, ?, ?)",
+                             [(user_id, classe, float(p)) for classe, p in percentuais.items()])
+        return len(percentuais)
+
+
+class TransacaoInvalida(ValueError):
+    """Transação que não pode ser aplicada à posição (ex.: venda maior que a posição)."""
+
+
+@dataclass(frozen=True)
+class Transacao:
+    """
+    Um lançamento do livro. `qtd` é a quantidade negociada na compra/venda, as cotas
+    que receberam o provento no dividendo (0 = a posição atual) e o fator no
+    desdobramento (2 = cada cota vira duas; 0.1 = grupamento de 10 para 1). `preco` é
+    por cota; `taxas` entram no custo da compra e saem da venda e do provento (IR
+    retido). `setor` só é obrigatório na primeira compra do ticker.
+    """
+    tipo: str
+    ticker: str
+    qtd: float
+    preco: float = 0.0
+    data: Optional[str] = None
+    taxas: float = 0.0
+    setor: Optional[str] = None
+
+
+class TransacaoRepository:
+    """
+    Livro de transações (`transacoes`) com a posição materializada em `ativos`. Cada
+    lançamento atualiza só a linha do seu ticker, pelo preço médio ponderado da
+    Receita (compras somam custo e taxas, vendas apuram lucro sem mexer no preço
+    médio, posição zerada zera o preço médio): as telas leem `ativos` sem nunca
+    percorrer o livro. Um lançamento com data anterior ao último do ticker refaz só
+    o histórico daquele ticker.
+    """
+
+    TIPOS = ("compra", "venda", "dividendo", "desdobramento")
+    # Sobra de ponto flutuante abaixo disso é posição zerada
+    RESIDUO = 1e-9
+
+    SQL_POSICAO = (
+        "INSERT INTO ativos (user_id, ticker, qtd, pm, setor, lucro_realizado, proventos) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id, ticker) DO UPDATE SET qtd = excluded.qtd, pm = excluded.pm, "
+        "setor = excluded.setor, lucro_realizado = excluded.lucro_realizado, proventos = excluded.proventos"
+    )
+
+    def __init__(self, banco: GerenciadorConexoes = None):
+        self.banco = banco or banco_padrao()
+        aplicar_migracoes(self.banco)
+
+    @classmethod
+    def aplicar(cls, qtd: float, pm: float, t: Transacao) -> Tuple[float, float, float, float]:
+        """
+        Efeito de `t` sobre a posição (qtd, pm): devolve (nova qtd, novo pm, resultado,
+        qtd registrada no livro). `resultado` é o lucro da venda ou o provento líquido.
+        """
+        if t.tipo == "compra":
+            nova = qtd + t.qtd
+            return nova, (qtd * pm + t.qtd * t.preco + t.taxas) / nova, 0.0, t.qtd
+        if t.tipo == "venda":
+            if t.qtd > qtd + cls.RESIDUO:
+                raise TransacaoInvalida(f"{t.ticker}: venda de {t.qtd:g} cotas com apenas {qtd:g} em carteira")
+            nova = qtd - t.qtd
+            lucro = t.qtd * (t.preco - pm) - t.taxas
+            if nova <= cls.RESIDUO:
+                return 0.0, 0.0, lucro, t.qtd
+            return nova, pm, lucro, t.qtd
+        if t.tipo == "dividendo":
+            cotas = t.qtd or qtd
+            if cotas <= 0:
+                raise TransacaoInvalida(f"{t.ticker}: provento sem cotas em carteira")
+            return qtd, pm, cotas * t.preco - t.taxas, cotas
+        if qtd <= 0:
+            raise TransacaoInvalida(f"{t.ticker}: desdobramento sem cotas em carteira")
+        return qtd * t.qtd, pm / t.qtd, 0.0, t.qtd
+
+    @classmethod
+    def validar(cls, t: Transacao) -> Transacao:
+        """Normaliza ticker e data (ISO, hoje se vazia) e confere os campos do tipo."""
+        ticker = str(t.ticker or "").upper().strip()
+        if len(ticker) < 2:
+            raise TransacaoInvalida("ticker inválido")
+        if t.tipo not in cls.TIPOS:
+            raise TransacaoInvalida(f"{ticker}: tipo '{t.tipo}' desconhecido")
+        try:
+            qtd, preco, taxas = float(t.qtd), float(t.preco), float(t.taxas)
+        except (TypeError, ValueError):
+            raise TransacaoInvalida(f"{ticker}: quantidade, preço e taxas devem ser números") from None
+        if not all(map(math.isfinite, (qtd, preco, taxas))) or taxas < 0 or preco < 0:
+            raise TransacaoInvalida(f"{ticker}: preço e taxas devem ser números não negativos")
+        if qtd < 0 or (qtd == 0 and t.tipo != "dividendo"):
+            raise TransacaoInvalida(f"{ticker}: quantidade deve ser maior que zero")
+        if preco == 0 and t.tipo != "desdobramento":
+            raise TransacaoInvalida(f"{ticker}: preço deve ser maior que zero")
+        try:
+            data = date.fromisoformat(str(t.data)[:10]).isoformat() if t.data else date.today().isoformat()
+        except ValueError:
+            raise TransacaoInvalida(f"{ticker}: data '{t.data}' inválida") from None
+        return Transacao(t.tipo, ticker, qtd, preco, data, taxas, t.setor)
+
+    def registrar(self, user_id: int, transacoes: Sequence[Transacao]) -> int:
+        """
+        Lança as transações, em ordem, numa única transação do banco: se qualquer uma
+        for inválida nada é gravado. Devolve quantas foram lançadas.
+        """
+        validas = [self.validar(t) for t in transacoes]
+        with self.banco.transacao() as conn:
+            for t in validas:
+                self._lancar(conn, user_id, t)
+        return len(validas)
+
+    def _lancar(self, conn, user_id: int, t: Transacao):
+        posicao = conn.execute(
+            "SELECT qtd, pm, setor, lucro_realizado, proventos FROM ativos WHERE user_id = ? AND ticker = ?",
+            (user_id, t.ticker)).fetchone()
+        qtd, pm, setor, lucro, proventos = tuple(posicao) if posicao else (0.0, 0.0, None, 0.0, 0.0)
+        setor = t.setor or setor
+        if setor is None:
+            raise TransacaoInvalida(f"{t.ticker}: informe a classe na primeira compra")
+        ultima = conn.execute("SELECT MAX(data) FROM transacoes WHERE user_id = ? AND ticker = ?",
+                              (user_id, t.ticker)).fetchone()[0]
+
+        if ultima is not None and t.data < ultima:
+            # Retroativo: o preço médio das operações seguintes muda, refaz o ticker
+            conn.execute("INSERT INTO transacoes (user_id, ticker, tipo, data, qtd, preco, taxas) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (user_id, t.ticker, t.tipo, t.data, t.qtd, t.preco, t.taxas))
+            self._refazer(conn, user_id, t.ticker, setor)
+            return
+
+        qtd, pm, resultado, registrada = self.aplicar(qtd, pm, t)
+        conn.execute("INSERT INTO transacoes (user_id, ticker, tipo, data, qtd, preco, taxas, resultado) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (user_id, t.ticker, t.tipo, t.data, registrada, t.preco, t.taxas, resultado))
+        if t.tipo == "venda":
+            lucro += resultado
+        elif t.tipo == "dividendo":
+            proventos += resultado
+        conn.execute(self.SQL_POSICAO, (user_id, t.ticker, qtd, pm, setor, lucro, proventos))
+
+    def _refazer(self, conn, user_id: int, ticker: str, setor: str):
+        """Reaplica o histórico de um ticker em ordem de data e reescreve resultados e posição."""
+        linhas = conn.execute("SELECT id, tipo, data, qtd, preco, taxas FROM transacoes "
+                              "WHERE user_id = ? AND ticker = ? ORDER BY data, id", (user_id, ticker)).fetchall()
+        qtd = pm = lucro = proventos = 0.0
+        resultados = []
+        for id_, tipo, data, q, preco, taxas in linhas:
+            qtd, pm, resultado, registrada = self.aplicar(qtd, pm, Transacao(tipo, ticker, q, preco, data, taxas))
+            lucro += resultado if tipo == "venda" else 0.0
+            proventos += resultado if tipo == "dividendo" else 0.0
+            resultados.append((resultado, registrada, id_))
+        conn.executemany("UPDATE transacoes SET resultado = ?, qtd = ? WHERE id = ?", resultados)
+        conn.execute(self.SQL_POSICAO, (user_id, ticker, qtd, pm, setor, lucro, proventos))
+
+    def reconstruir(self, user_id: int) -> int:
+        """Recalcula todas as posições do usuário a partir do livro (reparo). Devolve quantas."""
+        with self.banco.transacao() as conn:
+            setores = dict(conn.execute("SELECT ticker, setor FROM ativos WHERE user_id = ?", (user_id,)).fetchall())
+            tickers = [linha[0] for linha in conn.execute(
+                "SELECT DISTINCT ticker FROM transacoes WHERE user_id = ?", (user_id,)).fetchall()]
+            for ticker in tickers:
+                self._refazer(conn, user_id, ticker, setores.get(ticker, ""))
+        return len(tickers)
+
+    def redefinir(self, user_id: int, ticker: str, qtd: float, pm: float, setor: str):
+        """
+        Correção manual da posição: o histórico do ticker é substituído por uma compra
+        de hoje com a quantidade e o preço médio informados.
+        """
+        t = self.validar(Transacao("compra", ticker, qtd, pm, setor=setor))
+        with self.banco.transacao() as conn:
+            self._apagar(conn, user_id, t.ticker)
+            self._lancar(conn, user_id, t)
+
+    def excluir(self, user_id: int, ticker: str):
+        """Remove o ticker da carteira junto com o seu histórico."""
+        with self.banco.transacao() as conn:
+            self._apagar(conn, user_id, ticker.upper().strip())
+
+    @staticmethod
+    def _apagar(conn, user_id: int, ticker: str):
+        conn.execute("DELETE FROM transacoes WHERE user_id = ? AND ticker = ?", (user_id, ticker))
+        conn.execute("DELETE FROM ativos WHERE user_id = ? AND ticker = ?", (user_id, ticker))
+
+    def extrato(self, user_id: int, ticker: str = None, limite: int = 100) -> pd.DataFrame:
+        """Lançamentos mais recentes (do ticker, se informado), do mais novo ao mais antigo."""
+        sql = "SELECT data, ticker, tipo, qtd, preco, taxas, resultado FROM transacoes WHERE user_id = ?"
+        parametros: tuple = (user_id,)
+        if ticker:
+            sql += " AND ticker = ?"
+            parametros += (ticker.upper().strip(),)
+        sql += " ORDER BY data DESC, id DESC LIMIT ?"
+        return pd.read_sql_query(sql, self.banco.conexao(), params=parametros + (limite,))
+
+    def resultados(self, user_id: int) -> pd.DataFrame:
+        """Lucro realizado e proventos acumulados por ticker (lidos da posição, não do livro)."""
+        return pd.read_sql_query(
+            "SELECT ticker, setor, qtd, lucro_realizado, proventos FROM ativos "
+            "WHERE user_id = ? AND (lucro_realizado != 0 OR proventos != 0) ORDER BY ticker",
+            self.banco.conexao(), params=(user_id,))
+
+
+class PatrimonioRepository:
+    """Fotografias diárias do patrimônio (`patrimonio_diario`), uma linha por usuário e dia."""
+
+    def __init__(self, banco: GerenciadorConexoes = None):
+        self.banco = banco or banco_padrao()
+        aplicar_migracoes(self.banco)
+
+    def salvar(self, fotos: pd.DataFrame) -> int:
+        """
+        Grava (ou substitui) as linhas de `fotos` (colunas user_id, data, patrimonio,
+        custo e classes, um dict {classe: valor}) em uma transação. Devolve quantas.
+        """
+        if fotos.empty:
+            return 0
+        classes = [json.dumps({c: round(float(v), 2) for c, v in d.items()}, ensure_ascii=False,
+                              separators=(',', ':')) for d in fotos['classes']]
+        linhas = zip(fotos['user_id'].astype(int).tolist(), pd.to_datetime(fotos['data']).dt.strftime('%Y-%m-%d'),
+                     fotos['patrimonio'].round(2).tolist(), fotos['custo'].round(2).tolist(), classes)
+        with self.banco.transacao() as conn:
+            conn.executemany("INSERT OR REPLACE INTO patrimonio_diario (user_id, data, patrimonio, custo, classes) "
+                             "VALUES (?, ?, ?, ?, ?)", linhas)
+        return len(fotos)
+
+    def serie(self, user_id: int, inicio: date = None) -> pd.DataFrame:
+        """
+        Série diária do usuário a partir de `inicio`: índice de datas, colunas
+        patrimonio e custo e uma coluna por classe.
+        """
+        linhas = self.banco.conexao().execute(
+            "SELECT data, patrimonio, custo, classes FROM patrimonio_diario WHERE user_id = ? AND data >= ? "
+            "ORDER BY data", (user_id, inicio.isoformat() if inicio else "")).fetchall()
+        if not linhas:
+            return pd.DataFrame(columns=['patrimonio', 'custo'], index=pd.DatetimeIndex([], name='data'))
+        datas, patrimonio, custo, classes = zip(*linhas)
+        indice = pd.DatetimeIndex(datas, name='data')
+        por_classe = pd.DataFrame([json.loads(c) for c in classes], index=indice).fillna(0.0)
+        return pd.concat([pd.DataFrame({'patrimonio': patrimonio, 'custo': custo}, index=indice), por_classe], axis=1)
+
+    def ultima_data(self, user_id: int, antes: date = None) -> Optional[date]:
+        """Dia mais recente gravado (anterior a `antes`, se informado)."""
+        linha = self.banco.conexao().execute(
+            "SELECT MAX(data) FROM patrimonio_diario WHERE user_id = ? AND data < ?",
+            (user_id, antes.isoformat() if antes else "9999-12-31")).fetchone()
+        return date.fromisoformat(linha[0]) if linha[0] else None
+
+    def apagar(self, user_id: int, desde: date = None):
+        """Remove as fotografias do usuário a partir de `desde` (todas, se omitido)."""
+        with self.banco.transacao() as conn:
+            conn.execute("DELETE FROM patrimonio_diario WHERE user_id = ? AND data >= ?",
+                         (user_id, desde.isoformat() if desde else ""))
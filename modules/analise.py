@@ -1,32 +1,33 @@
 # Modules/analise.py
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime
 import streamlit as st
+from services.preco_service import PrecoService
+from services.historico_service import HistoricoService
+from services.retornos_service import RetornosService
+from services.correlacao_service import CorrelacaoService
+from services.risco_service import RiscoService
 
-@st.cache_data(ttl=300)
 def pegar_preco(ticker):
     """Busca preço atual do ativo. Retorna (preco, status, msg)."""
-    try:
-        if ticker[-1].isdigit():
-            ticker_yf = f"{ticker}.SA"
-        else:
-            ticker_yf = ticker
-        acao = yf.Ticker(ticker_yf)
-        hist = acao.history(period="2d")
-        if hist.empty:
-            return None, "erro", "Sem dados disponíveis"
-        preco = hist['Close'].iloc[-1]
-        ultima_data = hist.index[-1].date()
-        hoje = datetime.now().date()
-        if ultima_data == hoje:
-            return preco, "ok", "Atualizado"
-        else:
-            return preco, "aviso", f"Último: {ultima_data.strftime('%d/%m')}"
-    except Exception as e:
-        return None, "erro", str(e)
+    # Ticker vazio ou em branco é descartado pelo lote e não volta no resultado
+    dados = PrecoService.buscar_precos_batch([ticker]).get(ticker)
+    if dados is None:
+        return None, "erro", "Ticker inválido"
+    preco = dados.preco_atual if dados.status != "erro" else None
+    return preco, dados.status, dados.mensagem
+
+def pegar_precos(tickers):
+    """Busca os preços de vários ativos em lote. Retorna DataFrame (ticker, preco, status, msg, atualizado_em)."""
+    cotacoes = PrecoService.buscar_precos_batch(sorted(set(tickers)))
+    return pd.DataFrame(
+        [{'ticker': t, 'preco': d.preco_atual if d.status != "erro" else 0, 'status': d.status, 'msg': d.mensagem,
+          'atualizado_em': d.atualizado_em}
+         for t, d in cotacoes.items()],
+        columns=['ticker', 'preco', 'status', 'msg', 'atualizado_em']
+    )
 
 def pegar_preco_simples(ticker):
     preco, _, _ = pegar_preco(ticker)
@@ -36,16 +37,10 @@ def pegar_preco_simples(ticker):
 def buscar_dados_historicos(ticker, periodo="5y"):
     """Busca dados históricos e retorna um dicionário com métricas."""
     try:
-        if ticker[-1].isdigit():
-            ticker_yf = f"{ticker}.SA"
-        else:
-            ticker_yf = ticker
-        acao = yf.Ticker(ticker_yf)
-        hist = acao.history(period=periodo)
+        # Histórico persistido em data/cache; só o trecho faltante vai à rede
+        hist = HistoricoService().obter(ticker, periodo)
         if hist.empty:
-            hist = acao.history(period="max")
-            if hist.empty:
-                return None
+            return None
         preco_atual = hist['Close'].iloc[-1]
         if len(hist) >= 252:
             preco_medio_12m = hist['Close'].tail(252).mean()
@@ -62,7 +57,7 @@ def buscar_dados_historicos(ticker, periodo="5y"):
         else:
             variacao_anual = 0
         try:
-            dividends = acao.dividends.tail(24)
+            dividends = hist['Dividends'][hist['Dividends'] > 0].tail(24)
             if not dividends.empty:
                 dividends_12m = dividends.tail(12).sum()
                 if len(dividends) < 12:
@@ -204,24 +199,10 @@ def plotar_grafico_historico(dados_historicos, ticker):
 def calcular_matriz_correlacao(tickers, periodo="1y"):
     if len(tickers) < 2:
         return None, None
-    dados = {}
-    for ticker in tickers:
-        try:
-            if ticker[-1].isdigit():
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            acao = yf.Ticker(ticker_yf)
-            hist = acao.history(period=periodo)['Close']
-            if not hist.empty:
-                dados[ticker] = hist
-        except:
-            continue
-    if len(dados) < 2:
+    correlacao = CorrelacaoService.obter(tickers, periodo)
+    if correlacao is None:
         return None, None
-    df = pd.DataFrame(dados)
-    correlacao = df.pct_change().corr()
-    return correlacao, df
+    return correlacao, RetornosService.obter(tickers, periodo).precos
 
 def analisar_concentracao_setorial(df_ativos):
     if df_ativos.empty:
@@ -242,12 +223,8 @@ def analisar_concentracao_setorial(df_ativos):
 
 def calcular_preco_teto_bazin(ticker, dy_desejado=0.06):
     try:
-        if ticker[-1].isdigit():
-            ticker_yf = f"{ticker}.SA"
-        else:
-            ticker_yf = ticker
-        acao = yf.Ticker(ticker_yf)
-        dividends = acao.dividends.tail(12)
+        hist = HistoricoService().obter(ticker, "5y")
+        dividends = hist['Dividends'][hist['Dividends'] > 0].tail(12)
         if dividends.empty:
             return None, "Sem histórico de dividendos"
         dividendo_anual_medio = dividends.mean() * 4
@@ -257,46 +234,8 @@ def calcular_preco_teto_bazin(ticker, dy_desejado=0.06):
         return None, str(e)
 
 def calcular_risco_retorno(tickers):
-    dados_risco = {}
-    for ticker in tickers:
-        try:
-            if ticker[-1].isdigit():
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            acao = yf.Ticker(ticker_yf)
-            hist = acao.history(period="1y")['Close']
-            if not hist.empty:
-                retornos = hist.pct_change().dropna()
-                dados_risco[ticker] = {
-                    'retorno_medio': retornos.mean() * 252 * 100,
-                    'volatilidade': retornos.std() * np.sqrt(252) * 100,
-                    'max_drawdown': (hist / hist.cummax() - 1).min() * 100
-                }
-        except:
-            continue
-    return dados_risco
-
-def calcular_evolucao_patrimonio(df_ativos):
-    dados_historicos = {}
-    for ticker in df_ativos['ticker']:
-        try:
-            if ticker[-1].isdigit():
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            acao = yf.Ticker(ticker_yf)
-            hist = acao.history(period="1mo")
-            if not hist.empty:
-                qtd = df_ativos[df_ativos['ticker'] == ticker]['qtd'].iloc[0]
-                dados_historicos[ticker] = hist['Close'] * qtd
-        except:
-            continue
-    if dados_historicos:
-        df_evolucao = pd.DataFrame(dados_historicos)
-        df_evolucao['Total'] = df_evolucao.sum(axis=1)
-        return df_evolucao
-    return None
+    """Métricas de risco por ativo (RiscoService.COLUNAS), calculadas de uma vez sobre a matriz de 1 ano."""
+    return RiscoService.metricas(RetornosService.obter(tickers, "1y"))
 
 def calcular_rebalanceamento(df_ativos, metas, valor_disponivel=0):
     if df_ativos.empty or not metas:
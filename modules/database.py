@@ -1,98 +1,45 @@
 # Modules/database.py
-import sqlite3
 import pandas as pd
 import streamlit as st
 from datetime import datetime
+from config.settings import settings
+from database.conexao import get_gerenciador
+from database.migracoes import adotar_banco_legado, aplicar_migracoes
+from database.repository import AtivoRepository, LoteInvalido, MetaRepository, TransacaoRepository
 
-DB_PATH = 'invest_v8.db'
+DB_PATH = settings.DB_PATH
+adotar_banco_legado(DB_PATH)
+banco = get_gerenciador(DB_PATH)
 
 def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    """Conexão reaproveitada da thread atual (não deve ser fechada)."""
+    return banco.conexao()
 
 def init_db():
-    """Cria as tabelas necessárias se não existirem."""
-    conn = get_connection()
-    c = conn.cursor()
-    # Tabela de usuários
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            nome TEXT NOT NULL,
-            senha_hash TEXT NOT NULL
-        )
-    ''')
-    # Tabela de ativos
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ativos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            ticker TEXT NOT NULL,
-            qtd REAL NOT NULL,
-            pm REAL NOT NULL,
-            setor TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES usuarios(id)
-        )
-    ''')
-    # Tabela de metas de alocação
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS metas_alocacao (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            classe TEXT NOT NULL,
-            percentual REAL NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES usuarios(id)
-        )
-    ''')
-    # Tabela de alertas
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS alertas (
-            id TEXT PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            ticker TEXT NOT NULL,
-            tipo TEXT NOT NULL,
-            preco REAL NOT NULL,
-            ativo BOOL NOT NULL,
-            criado_em TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES usuarios(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Cria ou atualiza o esquema do banco (migrações versionadas, uma vez por processo)."""
+    aplicar_migracoes(banco)
+
+ativos_repo = AtivoRepository(banco)
+metas_repo = MetaRepository(banco)
+transacoes_repo = TransacaoRepository(banco)
 
 # -------------------- Ativos --------------------
 def salvar_ativo(user_id, ticker, qtd, pm, setor):
-    if not ticker or len(ticker.strip()) < 2:
-        st.error("❌ Ticker inválido!")
-        return False
-    if qtd <= 0:
-        st.error("❌ Quantidade deve ser maior que zero!")
-        return False
-    if pm <= 0:
-        st.error("❌ Preço médio deve ser maior que zero!")
-        return False
+    # Ticker já cadastrado: as cotas somam à posição e o preço médio é reponderado
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO ativos (user_id, ticker, qtd, pm, setor) VALUES (?, ?, ?, ?, ?)",
-            (user_id, ticker.upper().strip(), float(qtd), float(pm), setor)
-        )
-        conn.commit()
-        conn.close()
+        ativos_repo.salvar_lote(user_id, pd.DataFrame([{'ticker': ticker, 'qtd': qtd, 'pm': pm, 'setor': setor}]))
         st.success(f"✅ {ticker.upper()} salvo!")
         return True
+    except LoteInvalido as e:
+        st.error(f"❌ {e.invalidos['motivo'].iloc[0].capitalize()}!")
+        return False
     except Exception as e:
         st.error(f"❌ Erro ao salvar: {str(e)}")
         return False
 
 def excluir_ativo(user_id, ticker):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM ativos WHERE user_id = ? AND ticker = ?", (user_id, ticker))
-        conn.commit()
-        conn.close()
+        transacoes_repo.excluir(user_id, ticker)
         st.success(f"✅ {ticker} excluído!")
         return True
     except Exception as e:
@@ -101,14 +48,7 @@ def excluir_ativo(user_id, ticker):
 
 def atualizar_ativo(user_id, ticker, qtd, pm, setor):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(
-            "UPDATE ativos SET qtd=?, pm=?, setor=? WHERE user_id=? AND ticker=?",
-            (float(qtd), float(pm), setor, user_id, ticker.upper().strip())
-        )
-        conn.commit()
-        conn.close()
+        transacoes_repo.redefinir(user_id, ticker, qtd, pm, setor)
         st.success(f"✅ {ticker} atualizado!")
         return True
     except Exception as e:
@@ -116,24 +56,13 @@ def atualizar_ativo(user_id, ticker, qtd, pm, setor):
         return False
 
 def carregar_ativos(user_id):
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM ativos WHERE user_id = ?", conn, params=(user_id,))
-    conn.close()
-    return df
+    # Posições zeradas continuam na tabela por causa do lucro realizado
+    return pd.read_sql_query("SELECT * FROM ativos WHERE user_id = ? AND qtd > 0", banco.conexao(), params=(user_id,))
 
 # -------------------- Metas --------------------
 def salvar_metas(user_id, metas):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM metas_alocacao WHERE user_id = ?", (user_id,))
-        for classe, percentual in metas.items():
-            c.execute(
-                "INSERT INTO metas_alocacao (user_id, classe, percentual) VALUES (?, ?, ?)",
-                (user_id, classe, percentual)
-            )
-        conn.commit()
-        conn.close()
+        metas_repo.salvar(user_id, metas)
         return True
     except Exception as e:
         st.error(f"❌ Erro ao salvar metas: {str(e)}")
@@ -141,9 +70,7 @@ def salvar_metas(user_id, metas):
 
 def carregar_metas(user_id):
     try:
-        conn = get_connection()
-        df = pd.read_sql_query("SELECT classe, percentual FROM metas_alocacao WHERE user_id = ?", conn, params=(user_id,))
-        conn.close()
+        df = pd.read_sql_query("SELECT classe, percentual FROM metas_alocacao WHERE user_id = ?", banco.conexao(), params=(user_id,))
         return dict(zip(df['classe'], df['percentual']))
     except:
         return {}
@@ -151,15 +78,11 @@ def carregar_metas(user_id):
 # -------------------- Alertas --------------------
 def salvar_alerta(user_id, ticker, tipo, preco):
     try:
-        conn = get_connection()
-        c = conn.cursor()
         alerta_id = f"{ticker}_{tipo}_{preco}_{datetime.now().timestamp()}"
-        c.execute(
+        banco.conexao().execute(
             "INSERT INTO alertas (id, user_id, ticker, tipo, preco, ativo, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (alerta_id, user_id, ticker, tipo, preco, 1, datetime.now().strftime('%d/%m/%Y %H:%M'))
         )
-        conn.commit()
-        conn.close()
         return True
     except Exception as e:
         st.error(f"❌ Erro ao salvar alerta: {str(e)}")
@@ -167,11 +90,9 @@ def salvar_alerta(user_id, ticker, tipo, preco):
 
 def carregar_alertas(user_id):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT id, ticker, tipo, preco, ativo, criado_em FROM alertas WHERE user_id = ? AND ativo = 1", (user_id,))
-        rows = c.fetchall()
-        conn.close()
+        rows = banco.conexao().execute(
+            "SELECT id, ticker, tipo, preco, ativo, criado_em FROM alertas WHERE user_id = ? AND ativo = 1", (user_id,)
+        ).fetchall()
         alertas = {}
         for r in rows:
             alertas[r[0]] = {
@@ -187,11 +108,7 @@ def carregar_alertas(user_id):
 
 def excluir_alerta(alerta_id):
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM alertas WHERE id = ?", (alerta_id,))
-        conn.commit()
-        conn.close()
+        banco.conexao().execute("DELETE FROM alertas WHERE id = ?", (alerta_id,))
         return True
     except:
         return False
@@ -201,26 +118,19 @@ def criar_usuario(username, nome, senha_plana):
     """Cria um novo usuário com senha criptografada."""
     from streamlit_authenticator import Hasher
     hashed = Hasher([senha_plana]).generate()[0]
-    conn = get_connection()
-    c = conn.cursor()
     try:
-        c.execute(
+        banco.conexao().execute(
             "INSERT INTO usuarios (username, nome, senha_hash) VALUES (?, ?, ?)",
             (username, nome, hashed)
         )
-        conn.commit()
-        conn.close()
         return True
     except Exception as e:
         print(f"Erro ao criar usuário: {e}")
         return False
 
 def buscar_usuario_por_username(username):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT id, username, nome, senha_hash FROM usuarios WHERE username = ?", (username,))
-    row = c.fetchone()
-    conn.close()
+    row = banco.conexao().execute(
+        "SELECT id, username, nome, senha_hash FROM usuarios WHERE username = ?", (username,)).fetchone()
     if row:
         return {'id': row[0], 'username': row[1], 'nome': row[2], 'senha_hash': row[3]}
     return None
@@ -1,4 +1,7 @@
 # services/analise_service.py
+from typing import List, Mapping, Tuple
+import numpy as np
+import pandas as pd
 from services.preco_service import DadosAtivo
 
 class AnaliseResultado:
@@ -37,6 +40,85 @@ class AnaliseService:
         'caro': '#FF4444'
     }
     
+    MENSAGENS = {
+        'oportunidade': "🔥 OPORTUNIDADE! Muito barato",
+        'barato': "👍 Barato - Bom momento",
+        'neutro': "⚖️ Preço justo",
+        'atencao': "⚠️ Atenção - Acima da média",
+        'caro': "❌ CARO! Evite comprar"
+    }
+
+    # Faixas de pontuação por sensibilidade do Scanner (Agressivo aceita descontos menores)
+    PERFIS = {
+        'Conservador': THRESHOLDS,
+        'Moderado': THRESHOLDS,
+        'Agressivo': {'oportunidade': -30, 'barato': -10, 'neutro': 0, 'atencao': 15},
+    }
+
+    # Métricas (colunas de DadosAtivo) usadas na pontuação
+    METRICAS = ['preco_atual', 'preco_medio_12m', 'percentil_20', 'percentil_80',
+                'minimo_5y', 'maximo_5y', 'variacao_anual']
+
+    @classmethod
+    def pontuar_lote(cls, metricas: pd.DataFrame) -> pd.DataFrame:
+        """
+        Pontua vários ativos de uma vez (uma linha por ticker, colunas de METRICAS).
+        Mesmas regras de `analisar`, avaliadas com operações vetorizadas; não monta
+        textos. Retorna DataFrame com o mesmo índice e as colunas pontuacao, status,
+        mensagem, cor, recomendacao e preco_ideal_compra.
+        """
+        p, m12, p20, p80, min5, max5, var_ano = (
+            metricas[c].to_numpy(dtype=float) for c in cls.METRICAS)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pos_rel = np.where(max5 > min5, (p - min5) / (max5 - min5) * 100, 50)
+
+        pontuacao = (
+            np.select([p < m12 * 0.85, p < m12 * 0.9, p < m12, p > m12 * 1.15, p > m12 * 1.1, p > m12],
+                      [-25, -20, -10, 25, 20, 10], 0)
+            + np.select([p < p20, p > p80], [-30, 30], 0)
+            + np.select([pos_rel < 15, pos_rel < 30, pos_rel > 85, pos_rel > 70], [-25, -15, 25, 15], 0)
+            + np.select([var_ano < -20, var_ano < -10, var_ano > 50, var_ano > 30], [-20, -10, 25, 15], 0)
+        )
+        return cls._rotular(pontuacao, cls.classificar(pontuacao), p, m12, metricas.index)
+
+    @classmethod
+    def reclassificar(cls, pontuados: pd.DataFrame, perfil: str) -> pd.DataFrame:
+        """
+        Aplica as faixas de um perfil de PERFIS a ativos já pontuados (colunas pontuacao,
+        preco_atual e preco_medio_12m), sem recalcular métricas nem pontuação.
+        Retorna cópia com status, mensagem, cor, recomendacao e preco_ideal_compra refeitos.
+        """
+        pontuacao = pontuados['pontuacao'].to_numpy()
+        rotulos = cls._rotular(pontuacao, cls.classificar(pontuacao, cls.PERFIS[perfil]),
+                               pontuados['preco_atual'].to_numpy(dtype=float),
+                               pontuados['preco_medio_12m'].to_numpy(dtype=float), pontuados.index)
+        resultado = pontuados.copy()
+        resultado[rotulos.columns] = rotulos
+        return resultado
+
+    @classmethod
+    def _rotular(cls, pontuacao: np.ndarray, status: np.ndarray, p: np.ndarray, m12: np.ndarray,
+                 indice: pd.Index) -> pd.DataFrame:
+        return pd.DataFrame({
+            'pontuacao': pontuacao,
+            'status': status,
+            'mensagem': pd.Series(status).map(cls.MENSAGENS).to_numpy(),
+            'cor': pd.Series(status).map(cls.CORES).to_numpy(),
+            'recomendacao': np.where(np.isin(status, ['oportunidade', 'barato']), "COMPRAR", "ESPERAR"),
+            'preco_ideal_compra': np.where(np.isin(status, ['atencao', 'caro']), m12 * 0.9, p)
+        }, index=indice)
+
+    @classmethod
+    def classificar(cls, pontuacao, limites: Mapping[str, float] = None) -> np.ndarray:
+        """Converte pontuações em status pelas faixas de THRESHOLDS (ou `limites`)."""
+        limites = limites or cls.THRESHOLDS
+        pontuacao = np.asarray(pontuacao)
+        return np.select(
+            [pontuacao <= limites['oportunidade'], pontuacao <= limites['barato'],
+             pontuacao <= limites['neutro'], pontuacao <= limites['atencao']],
+            ['oportunidade', 'barato', 'neutro', 'atencao'], 'caro')
+
     def analisar(self, dados: DadosAtivo) -> AnaliseResultado:
         """Executa análise completa baseada em dados históricos."""
         
@@ -52,95 +134,99 @@ class AnaliseService:
                 preco_teto=0
             )
         
-        p = dados.preco_atual
-        m12 = dados.preco_medio_12m
-        p20 = dados.percentil_20
-        p80 = dados.percentil_80
-        min5 = dados.minimo_5y
-        max5 = dados.maximo_5y
-        var_ano = dados.variacao_anual
+        metricas = {c: getattr(dados, c) for c in self.METRICAS}
+        linha = self.pontuar_lote(pd.DataFrame([metricas], dtype=float)).iloc[0]
         dy = dados.dividend_yield
+        p = dados.preco_atual
+        
+        return AnaliseResultado(
+            status=linha['status'],
+            mensagem=linha['mensagem'],
+            cor=linha['cor'],
+            explicacao=self.explicar({**metricas, 'dividend_yield': dy}, linha['status']),
+            pontuacao=int(linha['pontuacao']),
+            recomendacao=linha['recomendacao'],
+            preco_ideal_compra=float(linha['preco_ideal_compra']),
+            preco_teto=(dy * p) / 6 if dy else 0
+        )
+
+    @staticmethod
+    def motivos(metricas: Mapping[str, float]) -> Tuple[List[str], str]:
+        """Motivos da pontuação, em texto, e alerta de risco (vazio se não houver)."""
+        p = metricas['preco_atual']
+        m12 = metricas['preco_medio_12m']
+        p20 = metricas['percentil_20']
+        p80 = metricas['percentil_80']
+        min5 = metricas['minimo_5y']
+        max5 = metricas['maximo_5y']
+        var_ano = metricas['variacao_anual']
         
         # Posição relativa
         pos_rel = ((p - min5) / (max5 - min5)) * 100 if max5 > min5 else 50
         
-        pontuacao = 0
         motivos = []
         alerta_risco = ""
         
         # Comparação com média 12 meses
         if p < m12 * 0.85:
-            pontuacao -= 25
             motivos.append("📉 Preço 15% abaixo da média de 12 meses")
         elif p < m12 * 0.9:
-            pontuacao -= 20
             motivos.append("📉 Preço 10% abaixo da média de 12 meses")
         elif p < m12:
-            pontuacao -= 10
             motivos.append("📉 Preço abaixo da média de 12 meses")
         elif p > m12 * 1.15:
-            pontuacao += 25
             motivos.append("📈 Preço 15% acima da média de 12 meses")
         elif p > m12 * 1.1:
-            pontuacao += 20
             motivos.append("📈 Preço 10% acima da média de 12 meses")
         elif p > m12:
-            pontuacao += 10
             motivos.append("📈 Preço acima da média de 12 meses")
         
         # Percentis
         if p < p20:
-            pontuacao -= 30
             motivos.append("💰 Entre os 20% preços mais baixos dos últimos 5 anos")
         elif p > p80:
-            pontuacao += 30
             motivos.append("⚠️ Entre os 20% preços mais altos dos últimos 5 anos")
         
         # Posição na faixa
         if pos_rel < 15:
-            pontuacao -= 25
             motivos.append(f"🎯 Próximo da mínima histórica (R$ {min5:.2f})")
         elif pos_rel < 30:
-            pontuacao -= 15
             motivos.append("📊 Na faixa inferior da série histórica")
         elif pos_rel > 85:
-            pontuacao += 25
             motivos.append(f"🔴 Próximo da máxima histórica (R$ {max5:.2f})")
         elif pos_rel > 70:
-            pontuacao += 15
             motivos.append("📊 Na faixa superior da série histórica")
         
         # Variação anual
         if var_ano < -20:
-            pontuacao -= 20
             motivos.append(f"📉 Caiu {var_ano:.1f}% no último ano")
             if var_ano < -50:
                 alerta_risco = "\n\n⚠️ **ALERTA DE RISCO:** Queda superior a 50% no último ano. Verifique problemas fundamentais antes de investir."
         elif var_ano < -10:
-            pontuacao -= 10
             motivos.append(f"📉 Caiu {var_ano:.1f}% no último ano")
         elif var_ano > 50:
-            pontuacao += 25
             motivos.append(f"🚀 Subiu {var_ano:.1f}% no último ano")
         elif var_ano > 30:
-            pontuacao += 15
             motivos.append(f"🚀 Subiu {var_ano:.1f}% no último ano")
         
-        # Determinar status
-        status = "caro"
-        if pontuacao <= self.THRESHOLDS['oportunidade']:
-            status = "oportunidade"
-        elif pontuacao <= self.THRESHOLDS['barato']:
-            status = "barato"
-        elif pontuacao <= self.THRESHOLDS['neutro']:
-            status = "neutro"
-        elif pontuacao <= self.THRESHOLDS['atencao']:
-            status = "atencao"
+        return motivos, alerta_risco
+
+    @classmethod
+    def explicar(cls, metricas: Mapping[str, float], status: str) -> str:
+        """
+        Texto explicativo (markdown) de um ativo já pontuado. Separado da pontuação
+        para ser montado só quando o usuário abre o detalhe do ativo.
+        """
+        motivos, alerta_risco = cls.motivos(metricas)
+        p = metricas['preco_atual']
+        m12 = metricas['preco_medio_12m']
+        min5 = metricas['minimo_5y']
+        max5 = metricas['maximo_5y']
+        dy = metricas.get('dividend_yield')
+        if dy is not None and pd.isna(dy):
+            dy = None
         
-        # Construir explicação e mensagem
         if status == "oportunidade":
-            mensagem = "🔥 OPORTUNIDADE! Muito barato"
-            cor = self.CORES['oportunidade']
             explicacao = "### ✅ OPORTUNIDADE DE COMPRA!\n\n"
             explicacao += "**Este ativo está muito barato comparado à sua história:**\n\n"
             for m in motivos[:4]:
@@ -152,10 +238,7 @@ class AnaliseService:
             if dy:
                 explicacao += f"💰 **Dividend Yield:** {dy:.2f}%\n"
             explicacao += f"\n💡 **RECOMENDAÇÃO:** COMPRAR - Ótimo ponto de entrada!" + alerta_risco
-            preco_ideal = p
         elif status == "barato":
-            mensagem = "👍 Barato - Bom momento"
-            cor = self.CORES['barato']
             explicacao = "### ✅ PREÇO ATRATIVO\n\n"
             explicacao += "**Este ativo está abaixo da média histórica:**\n\n"
             for m in motivos[:3]:
@@ -165,10 +248,7 @@ class AnaliseService:
             if dy:
                 explicacao += f"💰 **Dividend Yield:** {dy:.2f}%\n"
             explicacao += f"\n💡 **RECOMENDAÇÃO:** Pode comprar - preço justo" + alerta_risco
-            preco_ideal = p
         elif status == "neutro":
-            mensagem = "⚖️ Preço justo"
-            cor = self.CORES['neutro']
             explicacao = "### ⚖️ PREÇO JUSTO\n\n"
             explicacao += "**Este ativo está dentro da faixa histórica normal:**\n\n"
             for m in motivos[:2]:
@@ -176,11 +256,7 @@ class AnaliseService:
             explicacao += f"\n📊 **Preço atual:** R$ {p:.2f}\n"
             explicacao += f"📊 **Média 12m:** R$ {m12:.2f}\n"
             explicacao += f"\n💡 **RECOMENDAÇÃO:** Compra neutra - nem barato nem caro" + alerta_risco
-            preco_ideal = p
         elif status == "atencao":
-            mensagem = "⚠️ Atenção - Acima da média"
-            cor = self.CORES['atencao']
-            preco_ideal = m12 * 0.9
             explicacao = "### ⚠️ PREÇO ELEVADO\n\n"
             explicacao += "**Este ativo está acima da média histórica:**\n\n"
             for m in motivos[:3]:
@@ -190,8 +266,6 @@ class AnaliseService:
             explicacao += f"📊 **Máxima 5 anos:** R$ {max5:.2f}\n"
             explicacao += f"\n💡 **RECOMENDAÇÃO:** Comprar só se necessário - preço salgado" + alerta_risco
         else:  # caro
-            mensagem = "❌ CARO! Evite comprar"
-            cor = self.CORES['caro']
             preco_ideal = m12 * 0.9
             explicacao = "### ❌ PREÇO CARO DEMAIS!\n\n"
             explicacao += "**Este ativo está muito caro comparado à sua história:**\n\n"
@@ -204,16 +278,4 @@ class AnaliseService:
                 explicacao += f"💰 **Dividend Yield:** {dy:.2f}%\n"
             explicacao += f"\n💡 **RECOMENDAÇÃO:** NÃO COMPRAR AGORA!\n   Espere o preço cair para pelo menos R$ {preco_ideal:.2f}" + alerta_risco
         
-        # Preço teto aproximado
-        preco_teto = (dy * p) / 6 if dy else 0
-        
-        return AnaliseResultado(
-            status=status,
-            mensagem=mensagem,
-            cor=cor,
-            explicacao=explicacao,
-            pontuacao=pontuacao,
-            recomendacao="COMPRAR" if status in ["oportunidade", "barato"] else "ESPERAR",
-            preco_ideal_compra=preco_ideal,
-            preco_teto=preco_teto
-        )
+        return explicacao
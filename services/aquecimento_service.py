@@ -0,0 +1,67 @@
+# services/aquecimento_service.py
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from config.settings import settings
+from services.historico_service import HistoricoService
+from services.preco_service import PrecoService
+from utils.concorrencia import executar_em_lote
+
+
+class AquecimentoService:
+    """
+    Atualiza periodicamente, em segundo plano, as cotações e o histórico dos tickers
+    em uso (carteiras e listas do scanner), para que as páginas leiam dados já quentes.
+    O intervalo padrão (AQUECIMENTO_INTERVALO) é menor que YF_CACHE_TTL, de modo que
+    nem o cache de cotações nem o armazém de histórico chegam a vencer.
+    """
+
+    def __init__(self, coletar_tickers: Callable[[], Iterable[str]], intervalo: int = None,
+                 periodo: str = "5y", ao_concluir: Optional[Callable[[], None]] = None):
+        self.coletar_tickers = coletar_tickers
+        # Chamado após cada ciclo, com as cotações já quentes (ex.: fotografia do patrimônio)
+        self.ao_concluir = ao_concluir
+        self.intervalo = intervalo or settings.AQUECIMENTO_INTERVALO
+        self.periodo = periodo
+        self.ultimo_ciclo: Optional[float] = None
+        self.ultimo_erro: Optional[str] = None
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self):
+        """Inicia a thread de aquecimento (idempotente)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="aquecimento_mercado", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def executar_ciclo(self) -> Dict[str, int]:
+        """Atualiza cotações (um download em lote) e histórico de todos os tickers coletados."""
+        tickers = self._tickers()
+        if not tickers:
+            return {'tickers': 0, 'historicos': 0}
+        PrecoService.atualizar_cotacoes(tickers)
+        historicos = executar_em_lote(lambda t: HistoricoService().obter(t, self.periodo), tickers)
+        self.ultimo_ciclo = time.time()
+        if self.ao_concluir is not None:
+            self.ao_concluir()
+        return {'tickers': len(tickers),
+                'historicos': sum(1 for h in historicos.values() if h is not None and not h.empty)}
+
+    def _tickers(self) -> List[str]:
+        return sorted(set(t.upper().strip() for t in self.coletar_tickers() if t and t.strip()))
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.executar_ciclo()
+                self.ultimo_erro = None
+            except Exception as e:
+                # Falha de um ciclo não derruba o aquecimento; tenta de novo no próximo
+                self.ultimo_erro = str(e)
+                print(f"Erro no aquecimento de cotações: {e}")
+            self._parar.wait(self.intervalo)
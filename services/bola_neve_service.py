@@ -0,0 +1,215 @@
+# services/bola_neve_service.py
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+import numpy as np
+import pandas as pd
+from services.retornos_service import RetornosService
+
+# Simulações estocásticas já feitas, pelos parâmetros (as mais recentes por último)
+_simulacoes: "OrderedDict[Tuple, ResultadoSimulacao]" = OrderedDict()
+_simulacoes_lock = threading.Lock()
+_MAX_SIMULACOES = 32
+
+
+@dataclass(frozen=True)
+class ResultadoSimulacao:
+    """
+    Resultado do modo estocástico: `faixas` tem o patrimônio nos percentis 10, 50 e 90
+    ao fim de cada ano (ano 0 = valor inicial) e `finais` o patrimônio final de cada caminho.
+    """
+    modelo: str
+    caminhos: int
+    meses: int
+    faixas: pd.DataFrame
+    finais: np.ndarray
+
+    def chance(self, meta: float) -> float:
+        """Fração dos caminhos que terminam com pelo menos `meta`."""
+        return float((self.finais >= meta).mean())
+
+
+class BolaNeveService:
+    """
+    Juros compostos com aportes mensais em forma fechada (valor futuro de uma série de
+    pagamentos): nenhum laço mês a mês, e qualquer combinação de parâmetros sai de uma
+    única operação NumPy com broadcasting.
+    """
+
+    @staticmethod
+    def taxa_mensal(taxa_anual):
+        """Taxa mensal equivalente a uma taxa anual (aceita arrays)."""
+        return np.power(1 + np.asarray(taxa_anual, dtype=float), 1 / 12) - 1
+
+    @classmethod
+    def valor_futuro(cls, valor_inicial, aporte_mensal, taxa_anual, meses):
+        """
+        Patrimônio após `meses` com aporte no fim de cada mês:
+        V0·(1+i)^n + A·((1+i)^n − 1)/i (e V0 + A·n quando i = 0).
+        Os argumentos podem ser escalares ou arrays que façam broadcast entre si.
+        """
+        i = cls.taxa_mensal(taxa_anual)
+        n = np.asarray(meses, dtype=float)
+        crescimento = n * np.log1p(i)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            anuidade = np.where(i != 0, np.expm1(crescimento) / i, n)
+        return valor_inicial * np.exp(crescimento) + aporte_mensal * anuidade
+
+    @classmethod
+    def projetar(cls, valor_inicial: float, aporte_mensal: float, taxa_anual: float, anos: int) -> pd.DataFrame:
+        """Evolução mensal (colunas Mês, Com reinvestimento, Sem reinvestimento)."""
+        meses = np.arange(1, anos * 12 + 1)
+        return pd.DataFrame({
+            'Mês': meses,
+            'Com reinvestimento': cls.valor_futuro(valor_inicial, aporte_mensal, taxa_anual, meses),
+            'Sem reinvestimento': valor_inicial + aporte_mensal * meses.astype(float),
+        })
+
+    @staticmethod
+    def tabela_anual(projecao: pd.DataFrame) -> pd.DataFrame:
+        """Posição no fim de cada ano da projeção mensal (uma linha a cada 12 meses)."""
+        anual = projecao.iloc[11::12, 1:].reset_index(drop=True)
+        anual.insert(0, 'Ano', np.arange(1, len(anual) + 1))
+        return anual
+
+    @classmethod
+    def varredura(cls, valor_inicial: float, taxas: Sequence[float], anos: Sequence[int],
+                  aportes: Sequence[float]) -> np.ndarray:
+        """
+        Patrimônio final de todas as combinações taxa anual × anos × aporte mensal,
+        como um array (len(taxas), len(anos), len(aportes)).
+        """
+        taxas = np.asarray(taxas, dtype=float)[:, None, None]
+        meses = np.asarray(anos, dtype=float)[None, :, None] * 12
+        aportes = np.asarray(aportes, dtype=float)[None, None, :]
+        return cls.valor_futuro(valor_inicial, aportes, taxas, meses)
+
+    # -------------------- Modo estocástico --------------------
+    MODELOS = ["Normal", "Histórico", "Regimes"]
+    BENCHMARKS = {"Ibovespa": "^BVSP", "BOVA11": "BOVA11", "IFIX": "IFIX.SA", "IVVB11 (S&P 500)": "IVVB11"}
+    # Regime de crise: log-retorno médio mensal, volatilidade relativa e probabilidades
+    # mensais de entrar e de sair dele
+    CRISE_RETORNO = -0.02
+    CRISE_VOLATILIDADE = 2.0
+    P_ENTRAR_CRISE = 0.02
+    P_SAIR_CRISE = 0.15
+
+    @classmethod
+    def simular(cls, valor_inicial: float, aporte_mensal: float, anos: int, modelo: str = "Normal",
+                taxa_anual: float = 0.10, volatilidade_anual: float = 0.20, benchmark: str = "^BVSP",
+                caminhos: int = 5000, semente: int = 42) -> ResultadoSimulacao:
+        """
+        Sorteia `caminhos` sequências de retornos mensais e acumula o patrimônio com os
+        aportes. Modelos: "Normal" (log-retornos normais com média `taxa_anual`),
+        "Histórico" (reamostra meses reais do `benchmark`) e "Regimes" (alterna entre
+        mercado normal e crise por uma cadeia de Markov, calibrada para que o patrimônio
+        esperado ao fim dos `anos` seja o da `taxa_anual`).
+        Resultados ficam em cache pelos parâmetros.
+        """
+        historico = cls.retornos_mensais(benchmark) if modelo == "Histórico" else None
+        chave = (valor_inicial, aporte_mensal, anos, modelo, caminhos, semente) + (
+            (benchmark, hash(historico.tobytes())) if historico is not None
+            else (taxa_anual, volatilidade_anual))
+        with _simulacoes_lock:
+            if chave in _simulacoes:
+                _simulacoes.move_to_end(chave)
+                return _simulacoes[chave]
+
+        meses = anos * 12
+        rng = np.random.default_rng(semente)
+        if modelo == "Histórico":
+            if historico is None or len(historico) == 0:
+                raise ValueError(f"Sem histórico mensal para {benchmark}")
+            fatores = (1 + historico.astype(np.float32))[rng.integers(0, len(historico), (meses, caminhos))]
+        else:
+            fatores = np.exp(cls._log_retornos(rng, modelo, meses, caminhos, taxa_anual, volatilidade_anual))
+
+        # V_t = G_t·(V0 + A·Σ_{k≤t} 1/G_k), com G_t o fator acumulado até o mês t
+        acumulado = np.cumprod(fatores, axis=0)
+        patrimonio = np.reciprocal(acumulado)
+        np.cumsum(patrimonio, axis=0, out=patrimonio)
+        patrimonio *= np.float32(aporte_mensal)
+        patrimonio += np.float32(valor_inicial)
+        patrimonio *= acumulado
+
+        anuais = patrimonio[11::12]
+        posicoes = [int(round(q * (caminhos - 1))) for q in (0.10, 0.50, 0.90)]
+        percentis = np.partition(anuais, posicoes, axis=1)[:, posicoes].astype(float)
+        faixas = pd.DataFrame(np.vstack([np.full(3, valor_inicial), percentis]), columns=['p10', 'p50', 'p90'],
+                              index=pd.RangeIndex(0, anos + 1, name='Ano'))
+        resultado = ResultadoSimulacao(modelo, caminhos, meses, faixas, patrimonio[-1].astype(float))
+        with _simulacoes_lock:
+            _simulacoes[chave] = resultado
+            while len(_simulacoes) > _MAX_SIMULACOES:
+                _simulacoes.popitem(last=False)
+        return resultado
+
+    @classmethod
+    def _log_retornos(cls, rng: np.random.Generator, modelo: str, meses: int, caminhos: int,
+                      taxa_anual: float, volatilidade_anual: float) -> np.ndarray:
+        """Log-retornos mensais (meses x caminhos, float32) dos modelos paramétricos."""
+        sigma = volatilidade_anual / np.sqrt(12)
+        # Média do log-retorno que dá retorno esperado igual à taxa (correção de Itô)
+        mu = np.log1p(cls.taxa_mensal(taxa_anual)) - sigma ** 2 / 2
+        choques = rng.standard_normal((meses, caminhos), dtype=np.float32)
+        if modelo != "Regimes":
+            return choques * np.float32(sigma) + np.float32(mu)
+
+        # Fração de longo prazo em crise; o regime normal compensa as crises para que o
+        # fator esperado ao fim do horizonte continue igual ao da taxa
+        em_crise = cls.P_ENTRAR_CRISE / (cls.P_ENTRAR_CRISE + cls.P_SAIR_CRISE)
+        sigma_crise = sigma * cls.CRISE_VOLATILIDADE
+        esperado_crise = np.exp(cls.CRISE_RETORNO + sigma_crise ** 2 / 2)
+        mu_normal = np.log(cls._esperado_normal(cls.taxa_mensal(taxa_anual), esperado_crise, meses)) - sigma ** 2 / 2
+        sorteios = rng.random((meses + 1, caminhos), dtype=np.float32)
+        entra = sorteios[1:] < cls.P_ENTRAR_CRISE
+        troca = entra ^ (sorteios[1:] >= cls.P_SAIR_CRISE)
+        # crise[t] = fica se crise[t-1], senão entra  ==  entra ^ (crise[t-1] & troca);
+        # a cadeia começa na distribuição de longo prazo
+        crise = np.empty((meses, caminhos), dtype=bool)
+        anterior = sorteios[0] < em_crise
+        for t in range(meses):
+            np.bitwise_and(anterior, troca[t], out=crise[t])
+            np.bitwise_xor(crise[t], entra[t], out=crise[t])
+            anterior = crise[t]
+        escala = np.where(crise, np.float32(sigma_crise), np.float32(sigma))
+        media = np.where(crise, np.float32(cls.CRISE_RETORNO), np.float32(mu_normal))
+        return choques * escala + media
+
+    @classmethod
+    def _esperado_normal(cls, taxa_mensal: float, esperado_crise: float, meses: int) -> float:
+        """
+        Retorno esperado do mês normal, E[G | normal], que faz E[G_1·…·G_n] = (1+i)^n.
+        Os regimes persistem, então os meses não são independentes e casar só a média
+        de um mês faz o acumulado derivar para cima da taxa. Com a cadeia começando na
+        distribuição de longo prazo π, E[∏G] = π·D·(P·D)^(n-1)·1 (P: transições,
+        D: diag dos retornos esperados), crescente no retorno normal: resolvido por
+        bisseção no logaritmo.
+        """
+        pe, ps = cls.P_ENTRAR_CRISE, cls.P_SAIR_CRISE
+        transicao = np.array([[1 - pe, pe], [ps, 1 - ps]])
+        inicial = np.array([ps, pe]) / (pe + ps)
+        alvo = meses * np.log1p(taxa_mensal)
+
+        def log_acumulado(log_normal: float) -> float:
+            d = np.diag([np.exp(log_normal), esperado_crise])
+            return float(np.log(inicial @ d @ np.linalg.matrix_power(transicao @ d, meses - 1) @ np.ones(2)))
+
+        baixo, alto = -1.0, 1.0
+        for _ in range(60):
+            meio = (baixo + alto) / 2
+            if log_acumulado(meio) < alvo:
+                baixo = meio
+            else:
+                alto = meio
+        return float(np.exp((baixo + alto) / 2))
+
+    @staticmethod
+    def retornos_mensais(ticker: str) -> np.ndarray:
+        """Retornos mensais de todo o histórico do ticker (preço ajustado no fim de cada mês)."""
+        precos = RetornosService.obter([ticker], "max").precos
+        if precos.empty:
+            return np.zeros(0)
+        mensal = precos.iloc[:, 0].dropna().resample('ME').last()
+        return mensal.pct_change().dropna().to_numpy()
@@ -0,0 +1,165 @@
+# services/cenario_service.py
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config.settings import settings
+from services.retornos_service import RetornosService
+
+# Biblioteca de cenários já lida: {arquivo: (mtime_ns, DataFrame)}
+_cenarios: Dict[str, Tuple[int, pd.DataFrame]] = {}
+_cenarios_lock = threading.Lock()
+
+
+@dataclass
+class ResultadoCenario:
+    """
+    Reprodução de um cenário de crise sobre a carteira atual. `por_classe` tem uma
+    linha por classe e uma linha "Carteira" (colunas de CenarioService.COLUNAS);
+    `trajetoria` é o valor em R$ de cada classe e da carteira nos pregões do cenário.
+    `proxies` diz qual índice substituiu cada ativo sem histórico na janela.
+    """
+    nome: str
+    inicio: pd.Timestamp
+    fim: pd.Timestamp
+    por_classe: pd.DataFrame
+    trajetoria: pd.DataFrame
+    proxies: Dict[str, str] = field(default_factory=dict)
+    sem_proxy: List[str] = field(default_factory=list)
+
+
+class CenarioService:
+    """
+    Replay de crises históricas (janelas de datas em CENARIOS_PATH) contra as posições
+    atuais: cada ativo segue o próprio preço ajustado na janela; quem não tinha
+    histórico na época segue o índice da sua classe (PROXIES). Tudo sai de uma única
+    matriz de preços do RetornosService, e quedas e recuperações são calculadas para
+    todas as classes de uma vez.
+    """
+
+    # Substitutos por classe, em ordem de preferência (o primeiro com histórico na janela)
+    PROXIES = {
+        "Ações": ["^BVSP", "BOVA11"],
+        "ETF": ["BOVA11", "^BVSP"],
+        "FII Papel": ["IFIX.SA", "^BVSP"],
+        "FII Tijolo": ["IFIX.SA", "^BVSP"],
+        "FIIs": ["IFIX.SA", "^BVSP"],
+        "BDR": ["^BVSP"],
+        "Internacional": ["^BVSP"],
+        "Renda Fixa": [],  # sem índice de preço: mantém o valor atual
+    }
+    PROXY_PADRAO = ["^BVSP", "BOVA11"]
+
+    COLUNAS = ['valor_inicial', 'perda_max', 'pico', 'vale', 'recuperacao', 'dias_recuperacao']
+
+    @staticmethod
+    def carregar_cenarios(caminho: str = None) -> pd.DataFrame:
+        """Cenários cadastrados (colunas nome, inicio, fim, descricao), relidos só se o arquivo mudar."""
+        arquivo = Path(caminho or settings.CENARIOS_PATH)
+        if not arquivo.exists():
+            return pd.DataFrame(columns=['nome', 'inicio', 'fim', 'descricao'])
+        versao = arquivo.stat().st_mtime_ns
+        with _cenarios_lock:
+            em_memoria = _cenarios.get(str(arquivo))
+            if em_memoria is None or em_memoria[0] != versao:
+                cenarios = pd.read_csv(arquivo, dtype=str).fillna("")
+                cenarios['inicio'] = pd.to_datetime(cenarios['inicio'])
+                cenarios['fim'] = pd.to_datetime(cenarios['fim'])
+                em_memoria = (versao, cenarios.sort_values('inicio').reset_index(drop=True))
+                _cenarios[str(arquivo)] = em_memoria
+        return em_memoria[1]
+
+    @classmethod
+    def reproduzir(cls, valores: pd.Series, classes: pd.Series, nome: str) -> Optional[ResultadoCenario]:
+        """
+        `valores`: patrimônio atual por ticker (R$); `classes`: classe/setor por ticker.
+        Devolve None se o cenário não existir ou não houver pregões na janela.
+        """
+        cenarios = cls.carregar_cenarios()
+        linha = cenarios[cenarios['nome'] == nome]
+        if linha.empty:
+            return None
+        inicio, fim = linha['inicio'].iloc[0], linha['fim'].iloc[0]
+
+        valores = valores.groupby(level=0).sum().astype(float)
+        valores = valores[valores > 0]
+        classes = classes.groupby(level=0).first().reindex(valores.index).fillna("Outros")
+        candidatos = {t: cls.PROXIES.get(classes[t], cls.PROXY_PADRAO) for t in valores.index}
+        indices = sorted({p for lista in candidatos.values() for p in lista})
+
+        # Uma matriz para ativos e índices; "max" porque a recuperação pode levar anos
+        precos = RetornosService.obter(list(valores.index) + indices, "max").precos
+        precos = precos[precos.index >= inicio]
+        if precos.empty or precos.index[0] > fim:
+            return None
+        cobertos = precos.iloc[0].notna()
+
+        fontes, proxies, sem_proxy = {}, {}, []
+        for ticker in valores.index:
+            if cobertos.get(ticker, False):
+                fontes[ticker] = ticker
+                continue
+            proxy = next((p for p in candidatos[ticker] if cobertos.get(p, False)), None)
+            if proxy is None:
+                sem_proxy.append(ticker)
+            else:
+                fontes[ticker] = proxies[ticker] = proxy
+
+        # Valor de cada posição em cada pregão: preço da fonte relativo ao 1º dia da janela
+        acompanhados = list(fontes)
+        relativos = precos[[fontes[t] for t in acompanhados]].to_numpy()
+        relativos = relativos / relativos[0]
+        nomes_classes = list(dict.fromkeys(classes))
+        por_classe = (classes[acompanhados].to_numpy()[:, None] == np.array(nomes_classes)[None, :]).astype(float)
+        parado = valores[sem_proxy].groupby(classes[sem_proxy]).sum().reindex(nomes_classes).fillna(0.0)
+        valor_classes = (relativos * valores[acompanhados].to_numpy()) @ por_classe + parado.to_numpy()
+        trajetorias = np.column_stack([valor_classes, valor_classes.sum(axis=1)])
+
+        colunas = nomes_classes + ["Carteira"]
+        dias_janela = int((precos.index <= fim).sum())
+        tabela = cls.quedas(trajetorias, dias_janela, precos.index)
+        tabela.index = pd.Index(colunas, name='classe')
+        return ResultadoCenario(
+            nome=nome,
+            inicio=inicio,
+            fim=fim,
+            por_classe=tabela,
+            trajetoria=pd.DataFrame(trajetorias[:dias_janela], index=precos.index[:dias_janela], columns=colunas),
+            proxies=proxies,
+            sem_proxy=sem_proxy,
+        )
+
+    @classmethod
+    def quedas(cls, trajetorias: np.ndarray, dias_janela: int, datas: pd.DatetimeIndex) -> pd.DataFrame:
+        """
+        Maior queda pico-vale dentro dos `dias_janela` primeiros pregões de cada coluna e
+        o tempo (em pregões, contados do vale) até voltar ao valor do pico, procurado até
+        o fim da série. Sem recuperação até hoje, recuperacao e dias_recuperacao ficam vazios.
+        """
+        janela = trajetorias[:dias_janela]
+        colunas = np.arange(trajetorias.shape[1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            queda = janela / np.maximum.accumulate(janela, axis=0) - 1
+        queda = np.nan_to_num(queda)
+        vale = np.argmin(queda, axis=0)
+        linhas = np.arange(len(trajetorias))[:, None]
+        pico = np.argmax(np.where(linhas[:dias_janela] <= vale, janela, -np.inf), axis=0)
+        valor_pico = janela[pico, colunas]
+
+        # Primeiro pregão depois do vale em que o valor alcança o pico de novo
+        alcancou = (linhas >= vale) & (trajetorias >= valor_pico)
+        recuperou = alcancou.any(axis=0)
+        recuperacao = np.argmax(alcancou, axis=0)
+
+        tabela = pd.DataFrame({
+            'valor_inicial': trajetorias[0],
+            'perda_max': queda[vale, colunas] * 100,
+            'pico': datas[pico],
+            'vale': datas[vale],
+            'recuperacao': datas[recuperacao],
+            'dias_recuperacao': pd.array(recuperacao - vale, dtype="Int64"),
+        }, columns=cls.COLUNAS)
+        tabela.loc[~recuperou, ['recuperacao', 'dias_recuperacao']] = [pd.NaT, pd.NA]
+        return tabela
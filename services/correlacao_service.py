@@ -0,0 +1,154 @@
+# services/correlacao_service.py
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config.settings import settings
+from services.retornos_service import MatrizRetornos, RetornosService, ao_descartar
+
+# Estado por matriz de retornos, do menos para o mais usado recentemente:
+# {(tickers, janela, coluna): _EstadoCorrelacao}. Sai junto com a matriz
+_estados: "OrderedDict[Tuple[Tuple[str, ...], str, str], _EstadoCorrelacao]" = OrderedDict()
+_estados_lock = threading.Lock()
+
+
+def _descartar(chave: Tuple[Tuple[str, ...], str, str]):
+    with _estados_lock:
+        _estados.pop(chave, None)
+
+
+ao_descartar(_descartar)
+
+
+class _Somas:
+    """
+    Somas suficientes da correlação de Pearson par a par (como `DataFrame.corr`, que
+    ignora NaN em cada par): contagem, somas, somas dos quadrados e produtos cruzados.
+    Somar ou retirar k dias custa O(k·n²); a correlação sai das somas em O(n²).
+    Os valores são deslocados por `centro` para não perder precisão nas diferenças.
+    """
+
+    def __init__(self, centro: np.ndarray):
+        n = len(centro)
+        self.centro = centro
+        self.contagem = np.zeros((n, n))
+        self.soma = np.zeros((n, n))        # soma[i, j]: soma de x_i nos dias em que i e j existem
+        self.quadrados = np.zeros((n, n))
+        self.produtos = np.zeros((n, n))
+
+    def acumular(self, valores: np.ndarray, sinal: int = 1):
+        if len(valores) == 0:
+            return
+        validos = ~np.isnan(valores)
+        m = validos.astype(float)
+        x = np.where(validos, valores - self.centro, 0.0)
+        self.contagem += sinal * (m.T @ m)
+        self.soma += sinal * (x.T @ m)
+        self.quadrados += sinal * ((x * x).T @ m)
+        self.produtos += sinal * (x.T @ x)
+
+    def correlacao(self) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n = self.contagem
+            media_i, media_j = self.soma / n, self.soma.T / n
+            cov = self.produtos / n - media_i * media_j
+            var_i = self.quadrados / n - media_i ** 2
+            var_j = self.quadrados.T / n - media_j ** 2
+            corr = cov / np.sqrt(var_i * var_j)
+        corr[n < 2] = np.nan
+        corr = np.clip(corr, -1.0, 1.0)
+        np.fill_diagonal(corr, np.where(np.diag(n) >= 2, 1.0, np.nan))
+        return corr
+
+
+class _EstadoCorrelacao:
+    def __init__(self, matriz: MatrizRetornos, retornos: pd.DataFrame, somas: _Somas):
+        self.versao = matriz.versao
+        self.retornos = retornos
+        self.somas = somas
+        self.correlacao = pd.DataFrame(somas.correlacao(), index=retornos.columns, columns=retornos.columns)
+
+
+class CorrelacaoService:
+    """
+    Correlação dos retornos diários de um conjunto de ativos, mantida por somas
+    incrementais sobre a matriz do RetornosService: quando a matriz ganha dias novos
+    (ou a janela descarta os antigos), só esses dias entram ou saem das somas.
+    """
+
+    @classmethod
+    def obter(cls, tickers: Iterable[str], janela: str = "1y") -> Optional[pd.DataFrame]:
+        """Matriz de correlação (None se menos de dois ativos tiverem histórico)."""
+        matriz = RetornosService.obter(tickers, janela)
+        if len(matriz.precos.columns) < 2:
+            return None
+        chave = (matriz.tickers, matriz.janela, matriz.coluna)
+        # As somas são atualizadas no lugar: uma atualização por vez (custa milissegundos)
+        with _estados_lock:
+            estado = _estados.get(chave)
+            if estado is None or estado.versao != matriz.versao:
+                estado = cls._atualizar(estado, matriz)
+                _estados[chave] = estado
+            _estados.move_to_end(chave)
+            while len(_estados) > settings.MAX_MATRIZES:
+                _estados.popitem(last=False)
+        return estado.correlacao
+
+    @staticmethod
+    def pares_extremos(correlacao: pd.DataFrame, k: int = 5) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Os k pares mais correlacionados e os k menos correlacionados (colunas ativo_1,
+        ativo_2 e correlacao), tirados do triângulo superior sem laço sobre os pares.
+        """
+        colunas = ['ativo_1', 'ativo_2', 'correlacao']
+        i, j = np.triu_indices(len(correlacao.columns), k=1)
+        valores = correlacao.to_numpy()[i, j]
+        validos = ~np.isnan(valores)
+        i, j, valores = i[validos], j[validos], valores[validos]
+        if len(valores) == 0 or k <= 0:
+            return pd.DataFrame(columns=colunas), pd.DataFrame(columns=colunas)
+        k = min(k, len(valores))
+        nomes = correlacao.columns.to_numpy()
+
+        def tabela(posicoes):
+            return pd.DataFrame({'ativo_1': nomes[i[posicoes]], 'ativo_2': nomes[j[posicoes]],
+                                 'correlacao': valores[posicoes]}, columns=colunas).reset_index(drop=True)
+
+        maiores = np.argpartition(-valores, k - 1)[:k]
+        menores = np.argpartition(valores, k - 1)[:k]
+        return (tabela(maiores[np.argsort(-valores[maiores])]),
+                tabela(menores[np.argsort(valores[menores])]))
+
+    @classmethod
+    def _atualizar(cls, estado: Optional[_EstadoCorrelacao], matriz: MatrizRetornos) -> _EstadoCorrelacao:
+        retornos = matriz.retornos
+        if estado is None or not estado.retornos.columns.equals(retornos.columns):
+            return cls._montar(matriz, retornos)
+
+        anteriores = estado.retornos
+        comuns = anteriores.index.intersection(retornos.index)
+        antes = anteriores.loc[comuns].to_numpy()
+        depois = retornos.loc[comuns].to_numpy()
+        alterados = comuns[~((antes == depois) | (np.isnan(antes) & np.isnan(depois))).all(axis=1)]
+        saem = anteriores.index.difference(comuns).union(alterados)
+        entram = retornos.index.difference(comuns).union(alterados)
+        if len(saem) + len(entram) > len(retornos) // 2:
+            # Mudou quase tudo (ex.: reajuste de proventos): mais barato recomeçar
+            return cls._montar(matriz, retornos)
+
+        somas = estado.somas
+        somas.acumular(anteriores.loc[saem].to_numpy(), sinal=-1)
+        somas.acumular(retornos.loc[entram].to_numpy())
+        return _EstadoCorrelacao(matriz, retornos, somas)
+
+    @staticmethod
+    def _montar(matriz: MatrizRetornos, retornos: pd.DataFrame) -> _EstadoCorrelacao:
+        valores = retornos.to_numpy()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # coluna sem nenhum retorno
+            centro = np.nan_to_num(np.nanmean(valores, axis=0)) if len(valores) else np.zeros(valores.shape[1])
+        somas = _Somas(centro)
+        somas.acumular(valores)
+        return _EstadoCorrelacao(matriz, retornos, somas)
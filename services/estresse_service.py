@@ -0,0 +1,154 @@
+# services/estresse_service.py
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from services.retornos_service import MatrizRetornos
+
+PERCENTIS = [1, 5, 10, 25, 50, 75, 90, 95, 99]
+
+
+@dataclass
+class ResultadoEstresse:
+    """
+    Distribuição simulada da carteira no horizonte. Retornos em % do valor inicial;
+    `contribuicao` traz, por classe, o valor inicial, o resultado médio e o resultado
+    médio nos piores `1 - nivel` cenários (quanto cada classe responde pela perda).
+    """
+    valor_inicial: float
+    caminhos: int
+    dias: int
+    percentis: pd.Series
+    prob_piso: Optional[float]
+    cvar: float
+    contribuicao: pd.DataFrame
+    faixas: pd.DataFrame
+    sem_historico: List[str] = field(default_factory=list)
+
+    @property
+    def vazio(self) -> bool:
+        """Nada foi simulado (carteira sem valor positivo, ex.: todas as cotações falharam)."""
+        return self.caminhos == 0
+
+
+class EstresseService:
+    """
+    Simulador de Monte Carlo da carteira: sorteia trajetórias diárias de log-retornos
+    correlacionados (normal multivariada com a média e a covariância históricas dos
+    ativos) e avalia a carteira em cada dia. Trabalha em blocos de caminhos para caber
+    na memória; cada bloco tem a própria semente derivada de `semente`, então o
+    resultado é o mesmo com ou sem processos extras.
+    """
+
+    BLOCO = 1000
+
+    @classmethod
+    def simular(cls, valores: pd.Series, classes: pd.Series, matriz: MatrizRetornos,
+                caminhos: int = 10_000, dias: int = 252, piso: float = None, nivel: float = 0.95,
+                semente: int = None, processos: int = 1) -> ResultadoEstresse:
+        """
+        `valores`: patrimônio atual por ticker (R$); `classes`: classe/setor por ticker;
+        `piso`: fração do valor inicial (ex.: 0.8) para a probabilidade de a carteira
+        ficar abaixo dele em algum dia do horizonte. Ativos sem histórico na matriz
+        (renda fixa, por exemplo) entram com retorno zero.
+        """
+        valores = valores.groupby(level=0).sum().astype(float)
+        valores = valores[valores > 0]
+        if valores.empty:
+            # Sem valor inicial não há retorno a medir (as contas dividiriam por zero)
+            return ResultadoEstresse(
+                valor_inicial=0.0, caminhos=0, dias=dias,
+                percentis=pd.Series(np.nan, index=PERCENTIS, name='retorno_pct'),
+                prob_piso=None, cvar=float('nan'),
+                contribuicao=pd.DataFrame(columns=['valor_inicial', 'resultado_medio', 'resultado_cauda',
+                                                   'participacao_perda'], index=pd.Index([], name='classe')),
+                faixas=pd.DataFrame(columns=['p5', 'p50', 'p95'], index=pd.RangeIndex(0, name='dia')),
+            )
+        com_historico = [t for t in valores.index if t in matriz.log_retornos.columns]
+        sem_historico = [t for t in valores.index if t not in com_historico]
+        media, fator = cls._parametros(matriz.log_retornos[com_historico])
+
+        # Agrupa os ativos por classe: só o valor de cada classe em cada dia importa
+        classes = classes.groupby(level=0).first().reindex(valores.index).fillna("Outros")
+        nomes_classes = list(dict.fromkeys(classes))
+        # Matriz ativo x classe (1 onde o ativo pertence à classe)
+        por_classe = (classes[com_historico].to_numpy()[:, None] == np.array(nomes_classes)[None, :]).astype(float)
+        parado = valores[sem_historico].groupby(classes[sem_historico]).sum().reindex(nomes_classes).fillna(0.0)
+
+        blocos = [min(cls.BLOCO, caminhos - i) for i in range(0, caminhos, cls.BLOCO)]
+        sementes = np.random.SeedSequence(semente).spawn(len(blocos))
+        tarefas = [(n, dias, media, fator, valores[com_historico].to_numpy(), por_classe,
+                    float(parado.sum()), s) for n, s in zip(blocos, sementes)]
+        if processos and processos > 1 and len(tarefas) > 1:
+            with ProcessPoolExecutor(max_workers=processos) as pool:
+                partes = list(pool.map(_simular_bloco, tarefas))
+        else:
+            partes = [_simular_bloco(t) for t in tarefas]
+
+        finais_classe = np.vstack([p[0] for p in partes]) + parado.to_numpy()
+        minimos = np.concatenate([p[1] for p in partes])
+        trajetorias = np.vstack([p[2] for p in partes])
+
+        inicial = float(valores.sum())
+        finais = finais_classe.sum(axis=1)
+        retorno = (finais / inicial - 1) * 100
+        limite = np.percentile(retorno, (1 - nivel) * 100)
+        cauda = retorno <= limite
+
+        valor_classe = valores.groupby(classes).sum().reindex(nomes_classes).to_numpy()
+        resultado_classe = finais_classe - valor_classe
+        contribuicao = pd.DataFrame({
+            'valor_inicial': valor_classe,
+            'resultado_medio': resultado_classe.mean(axis=0),
+            'resultado_cauda': resultado_classe[cauda].mean(axis=0),
+        }, index=pd.Index(nomes_classes, name='classe'))
+        perda_cauda = contribuicao['resultado_cauda'].sum()
+        contribuicao['participacao_perda'] = (contribuicao['resultado_cauda'] / perda_cauda * 100
+                                              if perda_cauda < 0 else 0.0)
+
+        faixas = pd.DataFrame(np.percentile(trajetorias, [5, 50, 95], axis=0).T * inicial,
+                              columns=['p5', 'p50', 'p95'], index=pd.RangeIndex(1, dias + 1, name='dia'))
+        return ResultadoEstresse(
+            valor_inicial=inicial,
+            caminhos=caminhos,
+            dias=dias,
+            percentis=pd.Series(np.percentile(retorno, PERCENTIS), index=PERCENTIS, name='retorno_pct'),
+            prob_piso=float((minimos < piso).mean()) if piso is not None else None,
+            cvar=float(-retorno[cauda].mean()),
+            contribuicao=contribuicao,
+            faixas=faixas,
+            sem_historico=sem_historico,
+        )
+
+    @staticmethod
+    def _parametros(log_retornos: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Média diária e fator L (L·Lᵀ = covariância), com a covariância forçada a PSD."""
+        if log_retornos.shape[1] == 0:
+            return np.zeros(0), np.zeros((0, 0))
+        media = log_retornos.mean().fillna(0.0).to_numpy()
+        # Pares com históricos de tamanhos diferentes podem gerar covariância não PSD
+        cov = log_retornos.cov().fillna(0.0).to_numpy()
+        autovalores, autovetores = np.linalg.eigh(cov)
+        fator = autovetores * np.sqrt(np.clip(autovalores, 0.0, None))
+        return media, fator
+
+
+def _simular_bloco(tarefa) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Um bloco de caminhos. Devolve o valor final de cada classe (caminhos x classes, só
+    dos ativos com histórico), o menor valor relativo da carteira em cada caminho e a
+    trajetória relativa diária. Fica no nível do módulo para poder rodar em outro processo.
+    """
+    n, dias, media, fator, valores, por_classe, parado, semente = tarefa
+    rng = np.random.default_rng(semente)
+    inicial = valores.sum() + parado
+    if len(valores) == 0:
+        return np.zeros((n, por_classe.shape[1])), np.ones(n), np.ones((n, dias))
+
+    choques = rng.standard_normal((n, dias, fator.shape[1]), dtype=np.float32)
+    log_acumulado = np.cumsum(choques @ fator.T.astype(np.float32) + media.astype(np.float32), axis=1)
+    # Valor de cada ativo em cada dia (a partir da posição atual)
+    posicoes = np.exp(log_acumulado) * valores.astype(np.float32)
+    carteira = (posicoes.sum(axis=2, dtype=np.float64) + parado) / inicial
+    return posicoes[:, -1, :].astype(np.float64) @ por_classe, carteira.min(axis=1), carteira
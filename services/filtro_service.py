@@ -0,0 +1,196 @@
+# services/filtro_service.py
+import ast
+import operator
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, List, Tuple
+import numpy as np
+import pandas as pd
+
+# Resultado já calculado de cada filtro: {(expressão, classe, calculado_em): tickers},
+# do menos para o mais usado recentemente
+_aplicados: "OrderedDict[Tuple[str, str, pd.Timestamp], List[str]]" = OrderedDict()
+_aplicados_lock = threading.Lock()
+_MAX_APLICADOS = 512
+
+
+class FiltroInvalido(ValueError):
+    """Expressão de filtro com sintaxe, variável ou operação não permitida."""
+
+
+class FiltroService:
+    """
+    Filtros do Scanner escritos pelo usuário, ex.: "dy > 8 and variacao_anual < -10".
+    A expressão é validada contra VARIAVEIS (métricas de `buscar_dados_historicos`) e
+    compilada uma vez em uma função vetorizada sobre o resultado da varredura
+    (ScannerService); nada é buscado por ticker.
+    """
+
+    # Nome usado na expressão -> coluna do resultado do Scanner
+    VARIAVEIS = {
+        'preco': 'preco_atual',
+        'preco_atual': 'preco_atual',
+        'preco_medio_12m': 'preco_medio_12m',
+        'preco_medio_5y': 'preco_medio_5y',
+        'percentil_20': 'percentil_20',
+        'percentil_80': 'percentil_80',
+        'minimo_5y': 'minimo_5y',
+        'maximo_5y': 'maximo_5y',
+        'variacao_anual': 'variacao_anual',
+        'dy': 'dividend_yield',
+        'dividend_yield': 'dividend_yield',
+        'pontuacao': 'pontuacao',
+    }
+
+    COMPARACOES = {
+        ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt,
+        ast.GtE: operator.ge, ast.Eq: operator.eq, ast.NotEq: operator.ne,
+    }
+    ARITMETICA = {
+        ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    }
+
+    TAMANHO_MAXIMO = 500
+    # Expressões compiladas mantidas em memória (as menos usadas recentemente saem primeiro)
+    MAXIMO_COMPILADOS = 256
+
+    @classmethod
+    def compilar(cls, expressao: str) -> Callable[[pd.DataFrame], np.ndarray]:
+        """
+        Valida a expressão e devolve uma função (resultado do Scanner -> máscara booleana).
+        Aceita and/or/not entre condições, comparações (inclusive encadeadas), + - * /,
+        números e as variáveis de VARIAVEIS. Levanta FiltroInvalido para qualquer outra coisa.
+        """
+        return cls._compilar(cls.normalizar(expressao))
+
+    @classmethod
+    @lru_cache(maxsize=MAXIMO_COMPILADOS)
+    def _compilar(cls, expressao: str) -> Callable[[pd.DataFrame], np.ndarray]:
+        if not expressao:
+            raise FiltroInvalido("Expressão vazia")
+        if len(expressao) > cls.TAMANHO_MAXIMO:
+            raise FiltroInvalido(f"Expressão longa demais (máximo {cls.TAMANHO_MAXIMO} caracteres)")
+        try:
+            arvore = ast.parse(expressao, mode='eval')
+        except SyntaxError as e:
+            raise FiltroInvalido(f"Expressão inválida: {e.msg}") from e
+        avaliar = cls._compilar_no(arvore.body)
+
+        def filtro(resultados: pd.DataFrame) -> np.ndarray:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mascara = avaliar(resultados)
+            if np.ndim(mascara) == 0 or np.asarray(mascara).dtype != bool:
+                raise FiltroInvalido("A expressão precisa ser uma condição (ex.: dy > 8)")
+            return np.asarray(mascara)
+
+        return filtro
+
+    @classmethod
+    def validar(cls, expressao: str) -> str:
+        """Compila a expressão (levanta FiltroInvalido se não for aceita) e a devolve normalizada."""
+        cls.compilar(expressao)(pd.DataFrame({c: [1.0] for c in set(cls.VARIAVEIS.values())}))
+        return cls.normalizar(expressao)
+
+    @staticmethod
+    def normalizar(expressao: str) -> str:
+        return " ".join((expressao or "").split())
+
+    @classmethod
+    def aplicar(cls, expressao: str, resultados: pd.DataFrame) -> pd.DataFrame:
+        """
+        Linhas do resultado do Scanner que passam no filtro. O conjunto aprovado é guardado
+        por classe e `calculado_em`: quando a varredura é atualizada, só as classes
+        recalculadas são avaliadas de novo.
+        """
+        if resultados.empty:
+            return resultados
+        expressao = cls.normalizar(expressao)
+        filtro = cls.compilar(expressao)
+        aprovados = []
+        for (classe, calculado_em), grupo in resultados.groupby(['classe', 'calculado_em'], sort=False):
+            chave = (expressao, classe, calculado_em)
+            with _aplicados_lock:
+                tickers = _aplicados.get(chave)
+                if tickers is not None:
+                    _aplicados.move_to_end(chave)
+            if tickers is None:
+                tickers = grupo['ticker'][filtro(grupo)].tolist()
+                with _aplicados_lock:
+                    # Versões anteriores da mesma classe não serão mais consultadas
+                    for antiga in [k for k in _aplicados if k[:2] == chave[:2]]:
+                        del _aplicados[antiga]
+                    _aplicados[chave] = tickers
+                    while len(_aplicados) > _MAX_APLICADOS:
+                        _aplicados.popitem(last=False)
+            aprovados.extend(tickers)
+        return resultados[resultados['ticker'].isin(aprovados)]
+
+    # -------------------- Compilação --------------------
+    @staticmethod
+    def _condicao(no: ast.AST) -> bool:
+        """O nó produz uma máscara booleana (comparação, and/or/not)?"""
+        return (isinstance(no, (ast.Compare, ast.BoolOp))
+                or (isinstance(no, ast.UnaryOp) and isinstance(no.op, ast.Not)))
+
+    @classmethod
+    def _compilar_no(cls, no: ast.AST) -> Callable[[pd.DataFrame], object]:
+        if isinstance(no, ast.BoolOp):
+            for valor in no.values:
+                if not cls._condicao(valor):
+                    raise FiltroInvalido(
+                        f"'{type(no.op).__name__.lower()}' só junta condições: {ast.unparse(valor)}")
+            partes = [cls._compilar_no(v) for v in no.values]
+            juntar = np.logical_and if isinstance(no.op, ast.And) else np.logical_or
+
+            def bool_op(df):
+                mascara = partes[0](df)
+                for parte in partes[1:]:
+                    mascara = juntar(mascara, parte(df))
+                return mascara
+            return bool_op
+
+        if isinstance(no, ast.UnaryOp):
+            if isinstance(no.op, ast.Not) and not cls._condicao(no.operand):
+                raise FiltroInvalido(f"'not' só se aplica a condições: {ast.unparse(no.operand)}")
+            operando = cls._compilar_no(no.operand)
+            if isinstance(no.op, ast.Not):
+                return lambda df: np.logical_not(operando(df))
+            if isinstance(no.op, ast.USub):
+                return lambda df: -operando(df)
+            if isinstance(no.op, ast.UAdd):
+                return operando
+
+        if isinstance(no, ast.Compare):
+            termos = [cls._compilar_no(no.left)] + [cls._compilar_no(c) for c in no.comparators]
+            ops = []
+            for op in no.ops:
+                if type(op) not in cls.COMPARACOES:
+                    raise FiltroInvalido(f"Comparação não permitida: {type(op).__name__}")
+                ops.append(cls.COMPARACOES[type(op)])
+
+            def comparar(df):
+                valores = [termo(df) for termo in termos]
+                mascara = ops[0](valores[0], valores[1])
+                for i, op in enumerate(ops[1:], start=1):
+                    mascara = np.logical_and(mascara, op(valores[i], valores[i + 1]))
+                return mascara
+            return comparar
+
+        if isinstance(no, ast.BinOp) and type(no.op) in cls.ARITMETICA:
+            esquerda, direita = cls._compilar_no(no.left), cls._compilar_no(no.right)
+            op = cls.ARITMETICA[type(no.op)]
+            return lambda df: op(esquerda(df), direita(df))
+
+        if isinstance(no, ast.Name):
+            if no.id not in cls.VARIAVEIS:
+                raise FiltroInvalido(
+                    f"Variável desconhecida: {no.id}. Use: {', '.join(sorted(cls.VARIAVEIS))}")
+            coluna = cls.VARIAVEIS[no.id]
+            return lambda df: df[coluna].to_numpy(dtype=float)
+
+        if isinstance(no, ast.Constant) and isinstance(no.value, (int, float)) and not isinstance(no.value, bool):
+            valor = float(no.value)
+            return lambda df: valor
+
+        raise FiltroInvalido(f"Trecho não permitido na expressão: {ast.unparse(no)}")
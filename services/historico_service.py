@@ -0,0 +1,258 @@
+# services/historico_service.py
+import os
+import re
+import threading
+import time
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from config.settings import settings
+from utils.formatters import formatar_ticker_yf
+from utils.validators import simbolo_consultavel
+from utils.concorrencia import CircuitoAberto, SingleFlight, get_circuito, mapear_concorrente
+from services.provedor_mercado import COLUNAS, TickerSemDados, get_provedor
+
+# Buscas em andamento, compartilhadas por todas as sessões do processo
+_voos = SingleFlight()
+
+# Cache negativo: {ticker_yf: instante} dos tickers que não retornaram histórico
+_sem_dados: Dict[str, float] = {}
+
+
+class HistoricoService:
+    """
+    Armazém persistente de histórico OHLCV (um arquivo Parquet por ticker).
+    Na atualização, baixa apenas as barras posteriores à última armazenada.
+    """
+
+    COLUNAS = COLUNAS
+
+    def __init__(self, diretorio: str = None):
+        self.diretorio = Path(diretorio or settings.CACHE_DIR) / "historico"
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+
+    # -------------------- Leitura --------------------
+    def obter(self, ticker: str, periodo: str = "5y") -> pd.DataFrame:
+        """Retorna o histórico do período, completando o armazém só com o que falta."""
+        chave = (str(self.diretorio), formatar_ticker_yf(ticker), periodo)
+        return _voos.executar(chave, self._obter, ticker, periodo)
+
+    def _obter(self, ticker: str, periodo: str) -> pd.DataFrame:
+        inicio = self._inicio_periodo(periodo)
+        local = self.carregar(ticker)
+
+        if local.empty:
+            if self._sem_dados_recente(ticker):
+                return local
+            local = self._baixar(ticker, period=periodo)
+            cobertura = inicio
+            if local.empty and periodo != "max":
+                local = self._baixar(ticker, period="max")
+                cobertura = None
+            if local.empty:
+                _sem_dados[formatar_ticker_yf(ticker)] = time.monotonic()
+                return local
+            self._salvar(ticker, local, cobertura)
+        else:
+            cobertura = self._cobertura(local)
+            try:
+                if cobertura is not None and (inicio is None or inicio < cobertura):
+                    # Pedido maior que o armazenado: completa só o início da série
+                    anterior = self._baixar(ticker, period="max") if inicio is None else \
+                        self._baixar(ticker, start=inicio.date(), end=local.index[0].date())
+                    local = self._mesclar(anterior, local)
+                    cobertura = inicio
+                    self._salvar(ticker, local, cobertura)
+                if self._desatualizado(ticker):
+                    local = self._atualizar_final(ticker, local, cobertura)
+            except CircuitoAberto:
+                # Provedor indisponível: serve o que já está armazenado
+                pass
+
+        if inicio is not None:
+            return local[local.index >= self._alinhar_tz(inicio, local.index)]
+        return local
+
+    def obter_lote(self, tickers: Iterable[str], periodo: str = "5y") -> Dict[str, pd.DataFrame]:
+        """
+        Histórico de muitos tickers. Os que ainda não estão no armazém chegam em
+        downloads em lote (DOWNLOAD_LOTE tickers por requisição); depois todos passam
+        por `obter`, que só completa o que falta. Tickers sem dados ficam de fora.
+        """
+        return {t: h for t, h, _ in self.obter_progressivo(tickers, periodo) if h is not None and not h.empty}
+
+    def obter_progressivo(self, tickers: Iterable[str], periodo: str = "5y"
+                          ) -> Iterator[Tuple[str, Optional[pd.DataFrame], Optional[str]]]:
+        """
+        Como `obter_lote`, mas produz (ticker, histórico, erro) à medida que cada ticker
+        fica pronto. Os que já estão no armazém saem primeiro; os novos vêm em seguida,
+        um download em lote por vez.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        novos = [t for t in tickers if not self._arquivo(t).exists() and not self._sem_dados_recente(t)]
+        pendentes = set(novos)
+        locais = [t for t in tickers if t not in pendentes]
+        lotes = [locais] + [novos[i:i + settings.DOWNLOAD_LOTE]
+                            for i in range(0, len(novos), settings.DOWNLOAD_LOTE)]
+        circuito_aberto = False
+        for n, lote in enumerate(lotes):
+            if n > 0 and not circuito_aberto:
+                try:
+                    self._importar_lote(lote, periodo)
+                except CircuitoAberto:
+                    circuito_aberto = True
+            yield from mapear_concorrente(lambda t: self.obter(t, periodo), lote)
+
+    def carregar(self, ticker: str) -> pd.DataFrame:
+        """Lê o histórico armazenado localmente (sem acessar a rede)."""
+        arquivo = self._arquivo(ticker)
+        if not arquivo.exists():
+            return pd.DataFrame(columns=self.COLUNAS)
+        try:
+            return pd.read_parquet(arquivo)
+        except Exception:
+            return pd.DataFrame(columns=self.COLUNAS)
+
+    def ultima_barra(self, ticker: str) -> Optional[pd.Timestamp]:
+        """Data da última barra armazenada para o ticker."""
+        local = self.carregar(ticker)
+        return local.index[-1] if not local.empty else None
+
+    # -------------------- Atualização --------------------
+    def _atualizar_final(self, ticker: str, local: pd.DataFrame,
+                         cobertura: Optional[pd.Timestamp]) -> pd.DataFrame:
+        """Baixa as barras a partir da última armazenada (inclusive, para fechar o pregão)."""
+        ultima = local.index[-1]
+        novo = self._baixar(ticker, start=ultima.date())
+        if novo.empty:
+            self._arquivo(ticker).touch()
+            return local
+        if self._ajuste_mudou(local, novo, ultima):
+            # Proventos/desdobramentos reajustam toda a série: rebaixa o período coberto
+            if cobertura is None:
+                completo = self._baixar(ticker, period="max")
+            else:
+                completo = self._baixar(ticker, start=cobertura.date())
+            if not completo.empty:
+                self._salvar(ticker, completo, cobertura)
+                return completo
+        local = self._mesclar(local, novo)
+        self._salvar(ticker, local, cobertura)
+        return local
+
+    @staticmethod
+    def _ajuste_mudou(local: pd.DataFrame, novo: pd.DataFrame, data: pd.Timestamp) -> bool:
+        """Compara o fator Adj Close / Close da barra em comum."""
+        if data not in novo.index:
+            return False
+        antigo = local.loc[data, 'Adj Close'] / local.loc[data, 'Close']
+        atual = novo.loc[data, 'Adj Close'] / novo.loc[data, 'Close']
+        return pd.notna(antigo) and pd.notna(atual) and abs(atual / antigo - 1) > 1e-6
+
+    def _desatualizado(self, ticker: str) -> bool:
+        """Indica se o arquivo não é verificado há mais que o TTL de cotações."""
+        arquivo = self._arquivo(ticker)
+        return time.time() - arquivo.stat().st_mtime > settings.YF_CACHE_TTL
+
+    def _importar_lote(self, tickers: List[str], periodo: str):
+        """Baixa vários tickers em uma requisição e grava cada série no armazém."""
+        provedor = get_provedor()
+        mapa_yf = {t: formatar_ticker_yf(t) for t in tickers}
+        try:
+            dados = get_circuito(provedor.nome).chamar(provedor.cotacoes, list(mapa_yf.values()), period=periodo)
+        except CircuitoAberto:
+            raise
+        except Exception:
+            return
+        if dados is None or dados.empty or not isinstance(dados.columns, pd.MultiIndex):
+            return
+        disponiveis = set(dados.columns.get_level_values(0))
+        cobertura = self._inicio_periodo(periodo)
+        for ticker, ticker_yf in mapa_yf.items():
+            if ticker_yf not in disponiveis:
+                continue
+            hist = dados[ticker_yf].dropna(subset=['Close']).reindex(columns=self.COLUNAS)
+            if hist.empty:
+                continue
+            hist[['Dividends', 'Stock Splits']] = hist[['Dividends', 'Stock Splits']].fillna(0.0)
+            if hist.index.tz is None:
+                # Download em lote vem sem fuso; alinha com o de `history` (barra à meia-noite local)
+                hist.index = hist.index.tz_localize(self._fuso(ticker_yf))
+            self._salvar(ticker, hist, cobertura)
+
+    @staticmethod
+    def _fuso(ticker_yf: str) -> str:
+        return "America/Sao_Paulo" if ticker_yf.endswith(".SA") else "America/New_York"
+
+    @staticmethod
+    def _sem_dados_recente(ticker: str) -> bool:
+        """Ticker inválido ou que falhou há menos de YF_NEGATIVE_TTL segundos."""
+        if not simbolo_consultavel(ticker):
+            return True
+        instante = _sem_dados.get(formatar_ticker_yf(ticker))
+        return instante is not None and time.monotonic() - instante < settings.YF_NEGATIVE_TTL
+
+    def _baixar(self, ticker: str, **kwargs) -> pd.DataFrame:
+        """Baixa do provedor sob o seu disjuntor (levanta CircuitoAberto se aberto)."""
+        provedor = get_provedor()
+        try:
+            hist = get_circuito(provedor.nome).chamar(
+                provedor.historico, formatar_ticker_yf(ticker), ignorar=(TickerSemDados,), **kwargs)
+        except CircuitoAberto:
+            raise
+        except Exception:
+            return pd.DataFrame(columns=self.COLUNAS)
+        return hist.reindex(columns=self.COLUNAS)
+
+    # -------------------- Persistência --------------------
+    def _salvar(self, ticker: str, df: pd.DataFrame, cobertura: Optional[pd.Timestamp]):
+        """Grava de forma atômica, registrando desde quando a série está completa."""
+        df = df.copy()
+        df.attrs = {'cobertura': cobertura.isoformat() if cobertura is not None else "max"}
+        arquivo = self._arquivo(ticker)
+        temporario = arquivo.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        df.to_parquet(temporario)
+        os.replace(temporario, arquivo)
+
+    def _arquivo(self, ticker: str) -> Path:
+        nome = re.sub(r'[^A-Z0-9.=^-]', '_', formatar_ticker_yf(ticker))
+        return self.diretorio / f"{nome}.parquet"
+
+    @staticmethod
+    def _cobertura(df: pd.DataFrame) -> Optional[pd.Timestamp]:
+        valor = df.attrs.get('cobertura', "max")
+        return None if valor == "max" else pd.Timestamp(valor)
+
+    @staticmethod
+    def _mesclar(anterior: pd.DataFrame, posterior: pd.DataFrame) -> pd.DataFrame:
+        if anterior.empty:
+            return posterior
+        if posterior.empty:
+            return anterior
+        if anterior.index.tz is not None and posterior.index.tz is None:
+            posterior = posterior.tz_localize(anterior.index.tz)
+        elif anterior.index.tz is None and posterior.index.tz is not None:
+            anterior = anterior.tz_localize(posterior.index.tz)
+        elif anterior.index.tz is not None and str(anterior.index.tz) != str(posterior.index.tz):
+            posterior = posterior.tz_convert(anterior.index.tz)
+        df = pd.concat([anterior, posterior])
+        return df[~df.index.duplicated(keep='last')].sort_index()
+
+    @staticmethod
+    def _inicio_periodo(periodo: str) -> Optional[pd.Timestamp]:
+        """Converte períodos do yfinance ("2d", "1mo", "5y", "max") em data inicial."""
+        if periodo == "max":
+            return None
+        m = re.fullmatch(r'(\d+)(d|wk|mo|y)', periodo)
+        if not m:
+            raise ValueError(f"Período inválido: {periodo}")
+        n, unidade = int(m.group(1)), m.group(2)
+        offset = {'d': pd.DateOffset(days=n), 'wk': pd.DateOffset(weeks=n),
+                  'mo': pd.DateOffset(months=n), 'y': pd.DateOffset(years=n)}[unidade]
+        return pd.Timestamp.now().normalize() - offset
+
+    @staticmethod
+    def _alinhar_tz(data: pd.Timestamp, indice: pd.DatetimeIndex) -> pd.Timestamp:
+        if indice.tz is not None and data.tz is None:
+            return data.tz_localize(indice.tz)
+        return data
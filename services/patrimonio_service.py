@@ -0,0 +1,214 @@
+# services/patrimonio_service.py
+import sys
+from datetime import date
+from typing import Dict, Iterable, Optional
+import numpy as np
+import pandas as pd
+from database.conexao import GerenciadorConexoes
+from database.repository import PatrimonioRepository, banco_padrao, Transacao, TransacaoRepository
+from services.historico_service import HistoricoService
+from services.preco_service import PrecoService
+
+
+class PatrimonioService:
+    """
+    Alimenta `patrimonio_diario`, de onde a página de Evolução lê a série pronta.
+    `fotografar` grava o dia a partir das posições materializadas e das cotações em
+    cache (roda a cada ciclo do aquecimento: a última gravação do dia fica como
+    fechamento). `reconstruir` refaz dias passados a partir do livro de transações e
+    do histórico armazenado localmente, sem acessar a rede.
+    """
+
+    def __init__(self, banco: GerenciadorConexoes = None, historico: HistoricoService = None):
+        self.banco = banco or banco_padrao()
+        self.repo = PatrimonioRepository(self.banco)
+        self.historico = historico or HistoricoService()
+
+    @staticmethod
+    def ultimo_pregao(dia: date = None) -> date:
+        """O próprio dia, se útil; senão a sexta-feira anterior."""
+        return pd.offsets.BDay().rollback(pd.Timestamp(dia or date.today())).date()
+
+    def fotografar(self, usuarios: Iterable[int] = None, data: date = None,
+                   cotacoes: Dict[str, float] = None) -> int:
+        """
+        Grava o patrimônio de todos os usuários com posição, ou só dos `usuarios`, no
+        dia `data`. Sem `data`, o dia é o pregão mais recente das cotações buscadas
+        (fins de semana e feriados não geram linha). Ativos sem cotação entram pelo
+        custo. Devolve quantas linhas foram gravadas.
+        """
+        sql = "SELECT user_id, ticker, qtd, pm, setor FROM ativos WHERE qtd > 0"
+        parametros: tuple = ()
+        if usuarios is not None:
+            usuarios = list(usuarios)
+            if not usuarios:
+                return 0
+            sql += f" AND user_id IN ({','.join('?' * len(usuarios))})"
+            parametros = tuple(usuarios)
+        posicoes = pd.read_sql_query(sql, self.banco.conexao(), params=parametros)
+        if posicoes.empty:
+            return 0
+        if cotacoes is None:
+            dados = {t: d for t, d in PrecoService.buscar_precos_batch(sorted(posicoes['ticker'].unique())).items()
+                     if d.status != "erro" and d.preco_atual > 0}
+            cotacoes = {t: d.preco_atual for t, d in dados.items()}
+            if data is None:
+                pregoes = [d.ultima_data for d in dados.values() if d.ultima_data is not None]
+                data = max(pregoes) if pregoes else None
+        data = self.ultimo_pregao(data)
+
+        posicoes['custo'] = posicoes['qtd'] * posicoes['pm']
+        posicoes['valor'] = posicoes['qtd'] * posicoes['ticker'].map(cotacoes).fillna(posicoes['pm'])
+        totais = posicoes.groupby('user_id')[['valor', 'custo']].sum()
+        por_classe = posicoes.pivot_table(index='user_id', columns='setor', values='valor', aggfunc='sum')
+        fotos = pd.DataFrame({
+            'user_id': totais.index,
+            'data': pd.Timestamp(data),
+            'patrimonio': totais['valor'].to_numpy(),
+            'custo': totais['custo'].to_numpy(),
+            'classes': [{c: v for c, v in linha.items() if pd.notna(v)}
+                        for linha in por_classe.reindex(totais.index).to_dict('records')],
+        })
+        return self.repo.salvar(fotos)
+
+    def atualizar(self, user_id: int) -> int:
+        """
+        Completa a série do usuário: reconstrói do livro tudo o que falta antes do
+        último pregão (a série inteira, se ainda não houver nada antes dele) e
+        fotografa o pregão se ele ainda não tiver linha. Devolve os dias gravados.
+        """
+        pregao = self.ultimo_pregao()
+        vespera = (pd.Timestamp(pregao) - pd.offsets.BDay()).date()
+        anterior = self.repo.ultima_data(user_id, antes=pregao)
+        com_pregao = self.repo.ultima_data(user_id) == pregao
+        gravados = 0
+        if anterior is None or anterior < vespera:
+            # A fotografia do pregão, se já existe, veio de cotações ao vivo: fica como está
+            gravados += self.reconstruir(user_id, anterior, vespera if com_pregao else pregao)
+        if not com_pregao and self.repo.ultima_data(user_id) != pregao:
+            gravados += self.fotografar([user_id])
+        return gravados
+
+    def refazer(self, user_id: int, desde: date = None) -> int:
+        """
+        Depois de uma mudança no livro com data `desde` (o histórico inteiro, se
+        omitida): apaga as fotografias a partir dela e as reconstrói.
+        """
+        self.repo.apagar(user_id, desde)
+        return self.reconstruir(user_id, desde)
+
+    def reconstruir(self, user_id: int, inicio: date = None, fim: date = None) -> int:
+        """
+        Refaz os pregões de `inicio` (padrão: primeira transação) a `fim` (padrão:
+        hoje) repassando o livro e valorizando cada dia pelo fechamento armazenado.
+        Os pregões são os dias úteis com barra no histórico local (dias úteis sem
+        nenhuma barra, como feriados, ficam de fora). Os fechamentos vêm ajustados
+        por desdobramentos, então as cotas de antes de um desdobramento são
+        convertidas pelo fator dos eventos posteriores. Devolve quantos dias gravou.
+        """
+        livro = pd.read_sql_query(
+            "SELECT ticker, tipo, data, qtd, preco, taxas FROM transacoes WHERE user_id = ? ORDER BY data, id",
+            self.banco.conexao(), params=(user_id,))
+        if livro.empty:
+            return 0
+        setores = dict(self.banco.conexao().execute(
+            "SELECT ticker, setor FROM ativos WHERE user_id = ?", (user_id,)).fetchall())
+        livro['data'] = pd.to_datetime(livro['data'])
+        fechamentos = {ticker: self._fechamentos(ticker) for ticker in livro['ticker'].unique()}
+        dias = self._pregoes(livro['data'].iloc[0], pd.Timestamp(fim or date.today()), fechamentos.values())
+        if inicio is not None:
+            dias = dias[dias >= pd.Timestamp(inicio)]
+        if dias.empty:
+            return 0
+
+        patrimonio = np.zeros(len(dias))
+        custo = np.zeros(len(dias))
+        classes: Dict[str, np.ndarray] = {}
+        for ticker, lancamentos in livro.groupby('ticker', sort=False):
+            qtd, valor_custo = self._posicao_diaria(ticker, lancamentos, dias)
+            fechamento = fechamentos[ticker].reindex(dias, method='ffill').to_numpy()
+            valor = np.where(np.isnan(fechamento), valor_custo, qtd * fechamento)
+            patrimonio += valor
+            custo += valor_custo
+            classe = setores.get(ticker, "Outros")
+            classes[classe] = classes.get(classe, 0.0) + valor
+
+        por_classe = pd.DataFrame(classes, index=dias)
+        fotos = pd.DataFrame({
+            'user_id': user_id,
+            'data': dias,
+            'patrimonio': patrimonio,
+            'custo': custo,
+            # Classes sem valor no dia (posição ainda não aberta ou já zerada) ficam de fora
+            'classes': [{c: v for c, v in linha.items() if v != 0} for linha in por_classe.to_dict('records')],
+        })
+        return self.repo.salvar(fotos)
+
+    @staticmethod
+    def _pregoes(inicio: pd.Timestamp, fim: pd.Timestamp, fechamentos: Iterable[pd.Series]) -> pd.DatetimeIndex:
+        """
+        Dias úteis de `inicio` a `fim`; no trecho coberto pelo histórico local, só os
+        que têm barra em algum dos ativos.
+        """
+        dias = pd.bdate_range(inicio, fim, name='data')
+        barras = [f.index for f in fechamentos if not f.empty]
+        if not barras:
+            return dias
+        com_barra = pd.DatetimeIndex(np.unique(np.concatenate([b.to_numpy() for b in barras])))
+        coberto = (dias >= com_barra[0]) & (dias <= com_barra[-1])
+        return dias[~coberto | dias.isin(com_barra)]
+
+    @staticmethod
+    def _posicao_diaria(ticker: str, lancamentos: pd.DataFrame, dias: pd.DatetimeIndex):
+        """
+        Cotas (convertidas para depois de todos os desdobramentos) e custo ao fim de
+        cada dia de `dias`, repassando os lançamentos do ticker.
+        """
+        qtd = pm = 0.0
+        estados = []
+        for t in lancamentos.itertuples(index=False):
+            qtd, pm, _, _ = TransacaoRepository.aplicar(qtd, pm, Transacao(t.tipo, ticker, t.qtd, t.preco, None, t.taxas))
+            estados.append((qtd, pm))
+        estados = pd.DataFrame(estados, columns=['qtd', 'pm'], index=lancamentos['data'])
+        # Fator dos desdobramentos posteriores a cada lançamento (1 depois do último)
+        fatores = lancamentos['qtd'].where(lancamentos['tipo'] == "desdobramento", 1.0).to_numpy()
+        posteriores = np.append(np.cumprod(fatores[::-1])[::-1][1:], 1.0)
+        estados['qtd_ajustada'] = estados['qtd'].to_numpy() * posteriores
+
+        diarios = estados[~estados.index.duplicated(keep='last')].reindex(dias, method='ffill').fillna(0.0)
+        return diarios['qtd_ajustada'].to_numpy(), (diarios['qtd'] * diarios['pm']).to_numpy()
+
+    def _fechamentos(self, ticker: str) -> pd.Series:
+        """Fechamentos armazenados do ticker, indexados pela data (sem fuso)."""
+        historico = self.historico.carregar(ticker)
+        if historico.empty or 'Close' not in historico:
+            return pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+        fechamentos = historico['Close'].dropna()
+        indice = fechamentos.index
+        if getattr(indice, 'tz', None) is not None:
+            indice = indice.tz_localize(None)
+        fechamentos = pd.Series(fechamentos.to_numpy(dtype=float), index=indice.normalize())
+        return fechamentos[~fechamentos.index.duplicated(keep='last')]
+
+    def reconstruir_todos(self, inicio: date = None) -> int:
+        """Backfill de todos os usuários com transações. Devolve o total de dias gravados."""
+        usuarios = [linha[0] for linha in self.banco.conexao().execute(
+            "SELECT DISTINCT user_id FROM transacoes").fetchall()]
+        return sum(self.reconstruir(u, inicio) for u in usuarios)
+
+
+def main(argumentos):
+    """
+    Uso: python -m services.patrimonio_service [--reconstruir [AAAA-MM-DD]]
+    Sem argumentos grava a fotografia de hoje (para agendar no fim do pregão).
+    """
+    servico = PatrimonioService()
+    if argumentos and argumentos[0] == "--reconstruir":
+        inicio: Optional[date] = date.fromisoformat(argumentos[1]) if len(argumentos) > 1 else None
+        print(f"{servico.reconstruir_todos(inicio):,} dias reconstruídos")
+    else:
+        print(f"{servico.fotografar():,} usuários fotografados")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
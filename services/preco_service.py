@@ -1,6 +1,51 @@
+import threading
+import time
 import streamlit as st
 import pandas as pd
-import yfinance as ticker_data # Exemplo usando yfinance
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from config.settings import settings
+from utils.formatters import formatar_ticker_yf
+from services.historico_service import HistoricoService
+from services.provedor_mercado import get_provedor
+from utils.validators import simbolo_consultavel
+from utils.concorrencia import CircuitoAberto, SingleFlight, get_circuito, get_executor
+
+# Downloads de cotações em andamento, compartilhados entre sessões
+_voos = SingleFlight()
+
+# Cache de cotações do processo: {ticker: (DadosAtivo, instante da busca)}.
+# Compartilhado por todas as sessões e mantido quente pelo AquecimentoService.
+_cotacoes: Dict[str, Tuple["DadosAtivo", float]] = {}
+_cotacoes_lock = threading.Lock()
+# Tickers com revalidação em segundo plano já agendada
+_revalidando: set = set()
+
+
+@dataclass
+class DadosAtivo:
+    """Cotação (e métricas históricas, quando disponíveis) de um ativo.
+
+    `status` segue a convenção de `pegar_preco`: "ok" (cotação do dia),
+    "aviso" (último pregão disponível) ou "erro" (sem dados).
+    """
+    ticker: str
+    status: str
+    mensagem: str = ""
+    preco_atual: float = 0.0
+    ultima_data: Optional[date] = None
+    preco_medio_12m: Optional[float] = None
+    preco_medio_5y: Optional[float] = None
+    percentil_20: Optional[float] = None
+    percentil_80: Optional[float] = None
+    minimo_5y: Optional[float] = None
+    maximo_5y: Optional[float] = None
+    variacao_anual: float = 0.0
+    dividend_yield: Optional[float] = None
+    historico: pd.DataFrame = field(default_factory=pd.DataFrame)
+    atualizado_em: Optional[datetime] = None
+
 
 class PrecoService:
     @staticmethod
@@ -8,9 +53,8 @@ class PrecoService:
     def buscar_cotacao_atual(ticker):
         """Busca o preço atual de um ativo com proteção de cache."""
         try:
-            stock = ticker_data.Ticker(f"{ticker}.SA")
-            info = stock.fast_info
-            return info['last_price']
+            fechamentos = get_provedor().fechamentos([formatar_ticker_yf(ticker)], period="5d")
+            return float(fechamentos.iloc[:, 0].dropna().iloc[-1])
         except Exception as e:
             st.error(f"Erro ao buscar cotação de {ticker}: {e}")
             return 0.0
@@ -18,6 +62,198 @@ class PrecoService:
     @staticmethod
     @st.cache_data(ttl=3600) # Cache de 1 hora para dados históricos
     def buscar_historico(ticker, period="1y"):
-        stock = ticker_data.Ticker(f"{ticker}.SA")
-        return stock.history(period=period)
-        
+        return get_provedor().historico(formatar_ticker_yf(ticker), period=period)
+
+    @staticmethod
+    def buscar_precos_batch(tickers: List[str]) -> Dict[str, DadosAtivo]:
+        """
+        Busca a cotação de vários ativos em uma única requisição ao provedor de mercado.
+        Stale-while-revalidate: cotações em cache são devolvidas na hora, e as com mais
+        de YF_CACHE_TTL segundos são revalidadas em segundo plano; só os tickers que
+        nunca foram buscados esperam pela rede. Falhas ficam em cache por YF_NEGATIVE_TTL.
+        Retorna {ticker: DadosAtivo} com status "ok", "aviso" ou "erro".
+        """
+        tickers = list(dict.fromkeys(t for t in tickers if t and t.strip()))
+        if not tickers:
+            return {}
+        agora = time.time()
+        with _cotacoes_lock:
+            em_cache = {t: _cotacoes[t] for t in tickers if t in _cotacoes}
+        resultados = {t: dados for t, (dados, _) in em_cache.items()}
+        vencidos = [t for t, (dados, instante) in em_cache.items()
+                    if agora - instante >= PrecoService._validade(dados)]
+        if vencidos:
+            PrecoService.revalidar_cotacoes(vencidos)
+        faltantes = [t for t in tickers if t not in resultados]
+        if faltantes:
+            resultados.update(PrecoService.atualizar_cotacoes(faltantes))
+        return {t: resultados[t] for t in tickers}
+
+    @staticmethod
+    def revalidar_cotacoes(tickers: Iterable[str]):
+        """
+        Agenda, no pool compartilhado, a atualização das cotações informadas.
+        Enquanto isso os valores antigos continuam sendo servidos; tickers que já
+        estão sendo revalidados não geram nova requisição.
+        """
+        with _cotacoes_lock:
+            novos = sorted(set(t for t in tickers if t and t.strip()) - _revalidando)
+            _revalidando.update(novos)
+        if not novos:
+            return
+
+        def tarefa():
+            try:
+                PrecoService.atualizar_cotacoes(novos)
+            finally:
+                with _cotacoes_lock:
+                    _revalidando.difference_update(novos)
+        # Pool próprio: revalidações não ocupam os workers que as páginas aguardam
+        get_executor("revalidacao", 2).submit(tarefa)
+
+    @staticmethod
+    def revalidando(tickers: Iterable[str]) -> bool:
+        """Indica se algum dos tickers tem revalidação em andamento."""
+        with _cotacoes_lock:
+            return any(t in _revalidando for t in tickers)
+
+    @staticmethod
+    def atualizar_cotacoes(tickers: Iterable[str]) -> Dict[str, DadosAtivo]:
+        """
+        Baixa as cotações (ignorando o cache) e grava o resultado no cache compartilhado.
+        Textos que não são símbolos de mercado ("Tesouro Selic") nem vão à rede. Se o
+        provedor estiver falhando (ou com o circuito aberto), devolve "erro" sem gravar em
+        cache, para não marcar como inválidos tickers que estão corretos.
+        """
+        tickers = sorted(set(t for t in tickers if t and t.strip()))
+        if not tickers:
+            return {}
+        resultados = {t: DadosAtivo(ticker=t, status="erro", mensagem="Ticker inválido",
+                                    atualizado_em=datetime.now())
+                      for t in tickers if not simbolo_consultavel(t)}
+        consultaveis = [t for t in tickers if t not in resultados]
+        if consultaveis:
+            # Cada ticker entra em voo sozinho: só os que ninguém está buscando vão à
+            # rede (num único download) e os demais esperam as buscas em andamento
+            try:
+                baixados = _voos.executar_lote(consultaveis, PrecoService._baixar_cotacoes)
+                resultados.update({t: d for t, d in baixados.items() if d is not None})
+            except Exception as e:
+                falhas = {t: DadosAtivo(ticker=t, status="erro", mensagem=str(e)) for t in consultaveis}
+                PrecoService._gravar_cache(resultados)
+                return {**resultados, **falhas}
+        PrecoService._gravar_cache(resultados)
+        return resultados
+
+    @staticmethod
+    def _validade(dados: DadosAtivo) -> int:
+        """Segundos em que uma cotação em cache é considerada atual."""
+        return settings.YF_NEGATIVE_TTL if dados.status == "erro" else settings.YF_CACHE_TTL
+
+    @staticmethod
+    def _gravar_cache(resultados: Dict[str, DadosAtivo]):
+        agora = time.time()
+        with _cotacoes_lock:
+            for ticker, dados in resultados.items():
+                _cotacoes[ticker] = (dados, agora)
+
+    @staticmethod
+    def _baixar_cotacoes(tickers: List[str]) -> Dict[str, DadosAtivo]:
+        """
+        Download em lote das cotações (uma requisição para todos os tickers), sob o
+        disjuntor do provedor. Levanta exceção quando a falha é do provedor.
+        """
+        mapa_yf = {t: formatar_ticker_yf(t) for t in tickers}
+        provedor = get_provedor()
+        circuito = get_circuito(provedor.nome)
+        if not circuito.permitir():
+            raise CircuitoAberto("Provedor de cotações indisponível; usando cotações em cache")
+
+        try:
+            # Janela de 5 dias cobre fins de semana e feriados em um só download
+            dados = provedor.cotacoes(list(set(mapa_yf.values())), period="5d")
+        except Exception:
+            circuito.registrar_falha()
+            raise
+        # O download engole erros por ticker; lote inteiro vazio indica bloqueio/instabilidade
+        if len(set(mapa_yf.values())) > 1 and all(
+                PrecoService._extrair_fechamentos(dados, t).empty for t in set(mapa_yf.values())):
+            circuito.registrar_falha()
+            raise RuntimeError("O provedor não retornou cotações para nenhum ativo do lote")
+        circuito.registrar_sucesso()
+
+        agora = datetime.now()
+        hoje = agora.date()
+        resultados = {}
+        for ticker, ticker_yf in mapa_yf.items():
+            fechamentos = PrecoService._extrair_fechamentos(dados, ticker_yf)
+            if fechamentos.empty:
+                resultados[ticker] = DadosAtivo(ticker=ticker, status="erro", mensagem="Sem dados disponíveis",
+                                                atualizado_em=agora)
+                continue
+            ultima_data = fechamentos.index[-1].date()
+            if ultima_data == hoje:
+                status, mensagem = "ok", "Atualizado"
+            else:
+                status, mensagem = "aviso", f"Último: {ultima_data.strftime('%d/%m')}"
+            resultados[ticker] = DadosAtivo(
+                ticker=ticker,
+                status=status,
+                mensagem=mensagem,
+                preco_atual=float(fechamentos.iloc[-1]),
+                ultima_data=ultima_data,
+                atualizado_em=agora
+            )
+        return resultados
+
+    @staticmethod
+    @st.cache_data(ttl=3600)
+    def _buscar_dados_single(ticker: str, periodo: str = "5y") -> DadosAtivo:
+        """Histórico (do armazém local, atualizado incrementalmente) e métricas de um ativo."""
+        try:
+            hist = HistoricoService().obter(ticker, periodo)
+        except Exception as e:
+            return DadosAtivo(ticker=ticker, status="erro", mensagem=str(e))
+        if hist.empty:
+            return DadosAtivo(ticker=ticker, status="erro", mensagem="Sem dados históricos")
+
+        adj_close = hist['Adj Close']
+        preco_atual = float(hist['Close'].iloc[-1])
+        preco_medio_12m = adj_close.tail(252).mean() if len(hist) >= 252 else adj_close.mean()
+        variacao_anual = (adj_close.iloc[-1] / adj_close.iloc[-252] - 1) * 100 if len(hist) > 252 else 0.0
+
+        dy = None
+        dividends = hist['Dividends'][hist['Dividends'] > 0].tail(24)
+        if not dividends.empty and preco_atual > 0:
+            dividends_12m = dividends.tail(12).sum() if len(dividends) >= 12 else dividends.mean() * 12
+            dy = (dividends_12m / preco_atual) * 100
+
+        return DadosAtivo(
+            ticker=ticker,
+            status="ok",
+            mensagem="Atualizado",
+            preco_atual=preco_atual,
+            ultima_data=hist.index[-1].date(),
+            preco_medio_12m=float(preco_medio_12m),
+            preco_medio_5y=float(adj_close.mean()),
+            percentil_20=float(adj_close.quantile(0.20)),
+            percentil_80=float(adj_close.quantile(0.80)),
+            minimo_5y=float(adj_close.min()),
+            maximo_5y=float(adj_close.max()),
+            variacao_anual=float(variacao_anual),
+            dividend_yield=dy,
+            historico=hist
+        )
+
+    @staticmethod
+    def _extrair_fechamentos(dados: pd.DataFrame, ticker_yf: str) -> pd.Series:
+        """Extrai a série de fechamentos de um ticker do retorno de `download`."""
+        if dados is None or dados.empty:
+            return pd.Series(dtype=float)
+        if isinstance(dados.columns, pd.MultiIndex):
+            if ticker_yf not in dados.columns.get_level_values(0):
+                return pd.Series(dtype=float)
+            dados = dados[ticker_yf]
+        if 'Close' not in dados.columns:
+            return pd.Series(dtype=float)
+        return dados['Close'].dropna()
@@ -0,0 +1,203 @@
+# services/provedor_mercado.py
+import re
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import pandas as pd
+import yfinance as yf
+from yfinance.exceptions import YFInvalidPeriodError, YFTickerMissingError
+from config.settings import settings
+
+COLUNAS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume', 'Dividends', 'Stock Splits']
+
+
+class TickerSemDados(Exception):
+    """O provedor respondeu, mas o ativo não existe ou não tem dados no período."""
+
+
+class MarketDataProvider(ABC):
+    """
+    Fonte de dados de mercado usada por toda a aplicação (cotações, histórico,
+    dividendos e câmbio). Os tickers já vêm no formato do provedor (ex.: "PETR4.SA").
+    """
+
+    nome: str = ""
+
+    @abstractmethod
+    def historico(self, ticker: str, period: str = None, start=None, end=None) -> pd.DataFrame:
+        """Barras diárias com as colunas de COLUNAS. Levanta TickerSemDados se não houver."""
+
+    @abstractmethod
+    def cotacoes(self, tickers: List[str], period: str = "5d") -> pd.DataFrame:
+        """Barras recentes de vários ativos, colunas MultiIndex (ticker, campo)."""
+
+    def dividendos(self, ticker: str) -> pd.Series:
+        """Proventos pagos (valor por data)."""
+        hist = self.historico(ticker, period="max")
+        return hist['Dividends'][hist['Dividends'] > 0]
+
+    def cambio(self, par: str = "USDBRL=X") -> float:
+        """Última cotação de um par de moedas."""
+        fechamentos = self.historico(par, period="5d")['Close'].dropna()
+        if fechamentos.empty:
+            raise TickerSemDados(par)
+        return float(fechamentos.iloc[-1])
+
+    def fechamentos(self, tickers: Iterable[str], period: str = "1y", coluna: str = "Close") -> pd.DataFrame:
+        """Matriz datas x tickers com a coluna pedida (ativos sem dados ficam de fora)."""
+        dados = self.cotacoes(list(dict.fromkeys(tickers)), period=period)
+        series = {t: dados[t][coluna] for t in dados.columns.get_level_values(0).unique()
+                  if coluna in dados[t].columns and not dados[t][coluna].dropna().empty}
+        return pd.DataFrame(series)
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Dados do Yahoo Finance via yfinance."""
+
+    nome = "yahoo"
+
+    def historico(self, ticker: str, period: str = None, start=None, end=None) -> pd.DataFrame:
+        kwargs = {k: v for k, v in {'period': period, 'start': start, 'end': end}.items() if v is not None}
+        try:
+            hist = yf.Ticker(ticker).history(auto_adjust=False, timeout=settings.YF_TIMEOUT,
+                                             raise_errors=True, **kwargs)
+        except (YFTickerMissingError, YFInvalidPeriodError) as e:
+            raise TickerSemDados(str(e)) from e
+        if hist.empty:
+            raise TickerSemDados(ticker)
+        return hist.reindex(columns=COLUNAS)
+
+    def cotacoes(self, tickers: List[str], period: str = "5d") -> pd.DataFrame:
+        return yf.download(tickers, period=period, group_by="ticker", auto_adjust=False, actions=True,
+                           progress=False, threads=True, timeout=settings.YF_TIMEOUT)
+
+    def dividendos(self, ticker: str) -> pd.Series:
+        # Ticker.dividends não aceita timeout; o histórico com eventos traz os mesmos valores
+        hist = yf.Ticker(ticker).history(period="max", auto_adjust=False, actions=True,
+                                         timeout=settings.YF_TIMEOUT)
+        if hist.empty or 'Dividends' not in hist:
+            return pd.Series(dtype=float)
+        return hist['Dividends'][hist['Dividends'] > 0]
+
+
+class ArquivoProvider(MarketDataProvider):
+    """
+    Séries gravadas em disco (RAW_DIR, padrão data/raw), um arquivo por ticker
+    (<TICKER>.parquet ou <TICKER>.csv com índice de datas). Não acessa a rede: serve
+    para rodar benchmarks e testes de carga de forma reprodutível. Períodos ("1y", "5d")
+    são contados a partir da última barra gravada, não da data de hoje.
+    """
+
+    nome = "arquivo"
+
+    def __init__(self, diretorio: str = None):
+        self.diretorio = Path(diretorio or settings.RAW_DIR)
+
+    def historico(self, ticker: str, period: str = None, start=None, end=None) -> pd.DataFrame:
+        hist = self._ler(ticker)
+        if period and period != "max":
+            hist = hist[hist.index >= hist.index[-1] - self._offset(period)]
+        if start is not None:
+            hist = hist[hist.index >= self._alinhar(pd.Timestamp(start), hist.index)]
+        if end is not None:
+            hist = hist[hist.index < self._alinhar(pd.Timestamp(end), hist.index)]
+        if hist.empty:
+            raise TickerSemDados(ticker)
+        return hist
+
+    def cotacoes(self, tickers: List[str], period: str = "5d") -> pd.DataFrame:
+        quadros = {}
+        for ticker in tickers:
+            try:
+                quadros[ticker] = self.historico(ticker, period=period)
+            except TickerSemDados:
+                continue
+        if not quadros:
+            return pd.DataFrame()
+        return pd.concat(quadros, axis=1, names=['Ticker', 'Price'])
+
+    def gravar(self, ticker: str, hist: pd.DataFrame):
+        """Grava uma série (ex.: baixada do Yahoo) para uso offline."""
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        hist.reindex(columns=COLUNAS).to_parquet(self._arquivo(ticker, ".parquet"))
+
+    def _ler(self, ticker: str) -> pd.DataFrame:
+        parquet, csv = self._arquivo(ticker, ".parquet"), self._arquivo(ticker, ".csv")
+        if parquet.exists():
+            hist = pd.read_parquet(parquet)
+        elif csv.exists():
+            hist = pd.read_csv(csv, index_col=0)
+            hist.index = pd.to_datetime(hist.index, utc=True).tz_convert(None)
+        else:
+            raise TickerSemDados(ticker)
+        hist = hist.reindex(columns=COLUNAS).sort_index()
+        hist[['Dividends', 'Stock Splits']] = hist[['Dividends', 'Stock Splits']].fillna(0.0)
+        hist['Adj Close'] = hist['Adj Close'].fillna(hist['Close'])
+        return hist
+
+    def _arquivo(self, ticker: str, extensao: str) -> Path:
+        nome = re.sub(r'[^A-Z0-9.=^-]', '_', ticker.upper())
+        return self.diretorio / f"{nome}{extensao}"
+
+    @staticmethod
+    def _offset(period: str) -> pd.DateOffset:
+        m = re.fullmatch(r'(\d+)(d|wk|mo|y)', period)
+        if not m:
+            raise ValueError(f"Período inválido: {period}")
+        n, unidade = int(m.group(1)), m.group(2)
+        return {'d': pd.DateOffset(days=n), 'wk': pd.DateOffset(weeks=n),
+                'mo': pd.DateOffset(months=n), 'y': pd.DateOffset(years=n)}[unidade]
+
+    @staticmethod
+    def _alinhar(data: pd.Timestamp, indice: pd.DatetimeIndex) -> pd.Timestamp:
+        if indice.tz is not None and data.tz is None:
+            return data.tz_localize(indice.tz)
+        if indice.tz is None and data.tz is not None:
+            return data.tz_convert(None)
+        return data
+
+
+PROVEDORES = {
+    YFinanceProvider.nome: YFinanceProvider,
+    "yfinance": YFinanceProvider,
+    ArquivoProvider.nome: ArquivoProvider,
+}
+
+_provedor: Optional[MarketDataProvider] = None
+_provedor_lock = threading.Lock()
+
+
+def get_provedor() -> MarketDataProvider:
+    """Provedor configurado em settings.MARKET_PROVIDER ("yfinance" ou "arquivo")."""
+    global _provedor
+    if _provedor is None:
+        with _provedor_lock:
+            if _provedor is None:
+                nome = settings.MARKET_PROVIDER.lower()
+                if nome not in PROVEDORES:
+                    raise ValueError(f"Provedor de mercado desconhecido: {settings.MARKET_PROVIDER}")
+                _provedor = PROVEDORES[nome]()
+    return _provedor
+
+
+def definir_provedor(provedor: MarketDataProvider):
+    """Troca o provedor em uso (ex.: ArquivoProvider em benchmarks)."""
+    global _provedor
+    with _provedor_lock:
+        _provedor = provedor
+
+
+def gravar_series(tickers: Iterable[str], periodo: str = "5y", origem: MarketDataProvider = None,
+                  destino: ArquivoProvider = None) -> Dict[str, bool]:
+    """Grava em RAW_DIR o histórico dos tickers, para rodar depois com MARKET_PROVIDER=arquivo."""
+    origem = origem or YFinanceProvider()
+    destino = destino or ArquivoProvider()
+    gravados = {}
+    for ticker in tickers:
+        try:
+            destino.gravar(ticker, origem.historico(ticker, period=periodo))
+            gravados[ticker] = True
+        except Exception:
+            gravados[ticker] = False
+    return gravados
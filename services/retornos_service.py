@@ -0,0 +1,152 @@
+# services/retornos_service.py
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Tuple
+import numpy as np
+import pandas as pd
+from config.settings import settings
+from services.historico_service import HistoricoService
+from utils.concorrencia import SingleFlight, executar_em_lote
+
+# Matrizes montadas, compartilhadas por todas as páginas e sessões, da menos para a mais
+# usada recentemente (no máximo settings.MAX_MATRIZES): {(tickers, janela, coluna): MatrizRetornos}
+_matrizes: "OrderedDict[Tuple[Tuple[str, ...], str, str], MatrizRetornos]" = OrderedDict()
+_matrizes_lock = threading.Lock()
+_voos = SingleFlight()
+# Caches derivados das matrizes, avisados com a chave de cada matriz descartada
+_ao_descartar: List[Callable[[Tuple[Tuple[str, ...], str, str]], None]] = []
+
+
+def ao_descartar(funcao: Callable[[Tuple[Tuple[str, ...], str, str]], None]):
+    """Registra `funcao(chave)`, chamada quando a matriz da chave sai do cache."""
+    _ao_descartar.append(funcao)
+
+
+@dataclass(frozen=True)
+class MatrizRetornos:
+    """
+    Preços e log-retornos (datas x tickers, float64) de um conjunto de ativos em um
+    calendário único: a união dos pregões, com o último preço repetido nos feriados de
+    cada bolsa. `versao` muda sempre que a matriz recebe novas barras, e serve de
+    chave para caches de quem a consome.
+    """
+    tickers: Tuple[str, ...]
+    janela: str
+    coluna: str
+    precos: pd.DataFrame
+    log_retornos: pd.DataFrame
+    versao: int
+    verificado_em: float
+
+    @property
+    def retornos(self) -> pd.DataFrame:
+        """Retornos simples (equivalentes a `precos.pct_change()`)."""
+        return np.expm1(self.log_retornos)
+
+    @property
+    def vazia(self) -> bool:
+        return self.precos.empty
+
+
+class RetornosService:
+    """
+    Fonte única de séries alinhadas para correlação, risco, evolução e backtest.
+    A matriz de cada (tickers, janela, coluna) é montada uma vez a partir do
+    HistoricoService e, a cada YF_CACHE_TTL segundos, só recebe as barras novas.
+    """
+
+    @classmethod
+    def obter(cls, tickers: Iterable[str], janela: str = "1y", coluna: str = "Adj Close") -> MatrizRetornos:
+        chave = (tuple(sorted(set(t for t in tickers if t and t.strip()))), janela, coluna)
+        with _matrizes_lock:
+            matriz = _matrizes.get(chave)
+            if matriz is not None:
+                _matrizes.move_to_end(chave)
+        if matriz is None:
+            matriz = _voos.executar(chave, cls._montar, chave)
+        elif time.time() - matriz.verificado_em >= settings.YF_CACHE_TTL:
+            matriz = _voos.executar(chave, cls._estender, matriz)
+        return matriz
+
+    @staticmethod
+    def alinhar(series: Dict[str, pd.Series]) -> pd.DataFrame:
+        """Junta séries de preço em um calendário único (datas sem fuso, feriados preenchidos)."""
+        if not series:
+            return pd.DataFrame(dtype=float)
+        normalizadas = {}
+        for ticker, serie in series.items():
+            datas = (serie.index.tz_localize(None) if serie.index.tz is not None else serie.index).normalize()
+            serie = serie.set_axis(datas)
+            normalizadas[ticker] = serie[~datas.duplicated(keep='last')]
+        precos = pd.DataFrame(normalizadas).sort_index().astype('float64')
+        # Feriado em uma bolsa repete o último preço; antes da primeira barra fica NaN
+        return precos.ffill()
+
+    # -------------------- Montagem --------------------
+    @classmethod
+    def _series(cls, tickers: Iterable[str], janela: str, coluna: str) -> Dict[str, pd.Series]:
+        historicos = executar_em_lote(lambda t: HistoricoService().obter(t, janela), tickers)
+        return {t: h[coluna].dropna() for t, h in historicos.items()
+                if h is not None and not h.empty and not h[coluna].dropna().empty}
+
+    @classmethod
+    def _montar(cls, chave, versao: int = 1) -> MatrizRetornos:
+        tickers, janela, coluna = chave
+        series = cls._series(tickers, janela, coluna)
+        precos = cls.alinhar(series)[[t for t in tickers if t in series]] if series else pd.DataFrame(dtype=float)
+        return cls._guardar(chave, precos, np.log(precos).diff().iloc[1:], versao)
+
+    @classmethod
+    def _estender(cls, matriz: MatrizRetornos) -> MatrizRetornos:
+        """
+        Acrescenta as barras a partir da última data da matriz (inclusive, para fechar o
+        pregão em andamento) e recalcula só os log-retornos desse trecho. Se o trecho já
+        montado mudou (provento reajustando o Adj Close, desdobramento) ou mudou o
+        conjunto de ativos com dados, remonta a matriz inteira.
+        """
+        chave = (matriz.tickers, matriz.janela, matriz.coluna)
+        if matriz.vazia:
+            return cls._montar(chave, matriz.versao + 1)
+        atuais = cls.alinhar(cls._series(*chave))
+        colunas, ultima = matriz.precos.columns, matriz.precos.index[-1]
+        if set(atuais.columns) != set(colunas) or ultima not in atuais.index:
+            return cls._montar(chave, matriz.versao + 1)
+        if len(matriz.precos) > 1:
+            # O reajuste de proventos muda toda a série; basta conferir um pregão fechado
+            fechado = matriz.precos.index[-2]
+            if fechado not in atuais.index or not np.allclose(
+                    atuais.loc[fechado, colunas].to_numpy(), matriz.precos.loc[fechado].to_numpy(),
+                    rtol=1e-9, equal_nan=True):
+                return cls._montar(chave, matriz.versao + 1)
+
+        novas = atuais.loc[ultima:, colunas]
+        if len(novas) == 1 and np.allclose(novas.iloc[0].to_numpy(), matriz.precos.iloc[-1].to_numpy(),
+                                           rtol=0, atol=0, equal_nan=True):
+            return cls._guardar(chave, matriz.precos, matriz.log_retornos, matriz.versao)
+
+        precos = pd.concat([matriz.precos.iloc[:-1], novas])
+        trecho = precos.iloc[max(len(matriz.precos) - 2, 0):]
+        log_retornos = pd.concat([matriz.log_retornos[matriz.log_retornos.index < ultima],
+                                  np.log(trecho).diff().iloc[1:]])
+        inicio = HistoricoService._inicio_periodo(matriz.janela)
+        if inicio is not None:
+            precos = precos[precos.index >= inicio]
+            log_retornos = log_retornos[log_retornos.index > precos.index[0]]
+        return cls._guardar(chave, precos, log_retornos, matriz.versao + 1)
+
+    @staticmethod
+    def _guardar(chave, precos: pd.DataFrame, log_retornos: pd.DataFrame, versao: int) -> MatrizRetornos:
+        tickers, janela, coluna = chave
+        matriz = MatrizRetornos(tickers=tickers, janela=janela, coluna=coluna, precos=precos,
+                                log_retornos=log_retornos, versao=versao, verificado_em=time.time())
+        with _matrizes_lock:
+            _matrizes[chave] = matriz
+            _matrizes.move_to_end(chave)
+            descartadas = [_matrizes.popitem(last=False)[0]
+                           for _ in range(len(_matrizes) - settings.MAX_MATRIZES)]
+        for antiga in descartadas:
+            for funcao in _ao_descartar:
+                funcao(antiga)
+        return matriz
@@ -0,0 +1,126 @@
+# services/risco_service.py
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from config.settings import settings
+from services.retornos_service import MatrizRetornos, ao_descartar
+
+# Última tabela calculada de cada matriz, da menos para a mais usada recentemente:
+# {(tickers, janela, coluna): (chave de versão, tabela)}. Sai junto com a matriz
+_tabelas: "OrderedDict[Tuple, Tuple[Tuple, pd.DataFrame]]" = OrderedDict()
+_tabelas_lock = threading.Lock()
+
+
+def _descartar(chave: Tuple):
+    with _tabelas_lock:
+        _tabelas.pop(chave, None)
+
+
+ao_descartar(_descartar)
+
+
+class RiscoService:
+    """
+    Métricas de risco de todos os ativos de uma matriz de retornos em uma passada
+    vetorizada (NumPy, uma coluna por ativo). O resultado fica em cache pela versão
+    da matriz, então reruns da tela não recalculam nada.
+    """
+
+    DIAS_UTEIS = 252
+
+    COLUNAS = ['retorno_anual', 'volatilidade', 'downside', 'sharpe', 'sortino', 'var', 'cvar',
+               'max_drawdown', 'pico', 'vale', 'observacoes']
+
+    @classmethod
+    def metricas(cls, matriz: MatrizRetornos, taxa_livre: float = None, nivel: float = 0.95) -> pd.DataFrame:
+        """
+        Uma linha por ativo (colunas de COLUNAS). Percentuais: retorno_anual, volatilidade,
+        downside, var, cvar e max_drawdown; var/cvar são perdas diárias históricas no
+        `nivel` de confiança; pico e vale são as datas do máximo drawdown.
+        """
+        taxa_livre = settings.TAXA_LIVRE_RISCO if taxa_livre is None else taxa_livre
+        chave = (matriz.tickers, matriz.janela, matriz.coluna)
+        versao = (matriz.versao, taxa_livre, nivel)
+        with _tabelas_lock:
+            em_cache = _tabelas.get(chave)
+            if em_cache is not None:
+                _tabelas.move_to_end(chave)
+        if em_cache is not None and em_cache[0] == versao:
+            return em_cache[1]
+        tabela = cls.calcular(matriz.precos, matriz.retornos, taxa_livre, nivel)
+        with _tabelas_lock:
+            _tabelas[chave] = (versao, tabela)
+            _tabelas.move_to_end(chave)
+            while len(_tabelas) > settings.MAX_MATRIZES:
+                _tabelas.popitem(last=False)
+        return tabela
+
+    @classmethod
+    def calcular(cls, precos: pd.DataFrame, retornos: pd.DataFrame, taxa_livre: float = 0.0,
+                 nivel: float = 0.95) -> pd.DataFrame:
+        """Núcleo do cálculo: preços e retornos simples diários alinhados (datas x ativos)."""
+        if precos.empty or retornos.empty:
+            return pd.DataFrame(columns=cls.COLUNAS)
+        r = retornos.to_numpy(dtype=float)
+        p = precos.to_numpy(dtype=float)
+        d = cls.DIAS_UTEIS
+        livre_diaria = (1 + taxa_livre) ** (1 / d) - 1
+
+        with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+            warnings.simplefilter("ignore", RuntimeWarning)  # ativos sem retornos suficientes
+            validos = ~np.isnan(r)
+            obs = validos.sum(axis=0)
+            media = np.nanmean(r, axis=0)
+            retorno_anual = media * d
+            volatilidade = np.nanstd(r, axis=0, ddof=1) * np.sqrt(d)
+            abaixo = np.where(validos, np.minimum(r - livre_diaria, 0.0), np.nan)
+            downside = np.sqrt(np.nanmean(abaixo ** 2, axis=0)) * np.sqrt(d)
+            excesso = retorno_anual - taxa_livre
+            sharpe = np.where(volatilidade > 0, excesso / volatilidade, np.nan)
+            sortino = np.where(downside > 0, excesso / downside, np.nan)
+
+            limite = cls._quantil(r, obs, 1 - nivel)
+            cauda = np.where(r <= limite, r, np.nan)
+            var = -limite
+            cvar = -np.nanmean(cauda, axis=0)
+
+            # Drawdown: máximo acumulado ignora o NaN anterior à primeira barra
+            topo = np.fmax.accumulate(p, axis=0)
+            queda = p / topo - 1
+            sem_precos = np.isnan(queda).all(axis=0)
+            vale = np.nanargmin(np.where(sem_precos, 0.0, queda), axis=0)
+            linhas = np.arange(len(p))[:, None]
+            ate_vale = np.where((linhas <= vale) & ~np.isnan(p), p, -np.inf)
+            pico = np.argmax(ate_vale, axis=0)
+            max_drawdown = queda[vale, np.arange(p.shape[1])]
+
+        datas = precos.index
+        tabela = pd.DataFrame({
+            'retorno_anual': retorno_anual * 100,
+            'volatilidade': volatilidade * 100,
+            'downside': downside * 100,
+            'sharpe': sharpe,
+            'sortino': sortino,
+            'var': var * 100,
+            'cvar': cvar * 100,
+            'max_drawdown': np.where(sem_precos, np.nan, max_drawdown * 100),
+            'pico': pd.DatetimeIndex(np.where(sem_precos, pd.NaT, datas[pico])),
+            'vale': pd.DatetimeIndex(np.where(sem_precos, pd.NaT, datas[vale])),
+            'observacoes': obs,
+        }, index=retornos.columns)
+        return tabela.reindex(precos.columns)
+
+    @staticmethod
+    def _quantil(valores: np.ndarray, obs: np.ndarray, q: float) -> np.ndarray:
+        """Quantil por coluna ignorando NaN (interpolação linear, como `np.nanquantile`)."""
+        ordenados = np.sort(valores, axis=0)  # NaN vão para o fim de cada coluna
+        posicao = (np.maximum(obs, 1) - 1) * q
+        abaixo = np.floor(posicao).astype(int)
+        acima = np.minimum(abaixo + 1, np.maximum(obs - 1, 0))
+        colunas = np.arange(valores.shape[1])
+        inferior, superior = ordenados[abaixo, colunas], ordenados[acima, colunas]
+        quantil = inferior + (posicao - abaixo) * (superior - inferior)
+        return np.where(obs > 0, quantil, np.nan)
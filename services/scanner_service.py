@@ -0,0 +1,194 @@
+# services/scanner_service.py
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+from config.settings import settings
+from services.analise_service import AnaliseService
+from services.historico_service import HistoricoService
+
+# Resultados salvos já lidos: {arquivo: (mtime_ns, DataFrame)}
+_resultados: Dict[str, Tuple[int, pd.DataFrame]] = {}
+
+
+class ScannerService:
+    """
+    Varredura do universo de ativos (arquivo UNIVERSO_PATH): histórico em lote,
+    métricas e pontuação vetorizadas e resultado persistido em PROCESSED_DIR, com
+    o instante do cálculo. A tela só filtra e ordena o resultado salvo.
+    """
+
+    CLASSES = ["FIIs", "Ações", "ETFs Nacionais", "BDRs", "Internacional"]
+
+    COLUNAS_METRICAS = AnaliseService.METRICAS + ['preco_medio_5y', 'dividend_yield']
+
+    _lock = threading.RLock()
+
+    def __init__(self, universo_path: str = None, diretorio: str = None):
+        self.universo_path = Path(universo_path or settings.UNIVERSO_PATH)
+        self.arquivo_resultados = Path(diretorio or settings.PROCESSED_DIR) / "scanner_resultados.parquet"
+
+    # -------------------- Universo --------------------
+    def carregar_universo(self, classe: str = None) -> pd.DataFrame:
+        """Tickers do universo (colunas ticker, classe), opcionalmente de uma classe."""
+        universo = pd.read_csv(self.universo_path, dtype=str)
+        universo['ticker'] = universo['ticker'].str.upper().str.strip()
+        universo = universo.drop_duplicates('ticker')
+        if classe:
+            universo = universo[universo['classe'] == classe]
+        return universo.reset_index(drop=True)
+
+    # -------------------- Varredura --------------------
+    def varrer(self, classe: str = None, periodo: str = "5y") -> pd.DataFrame:
+        """Baixa (em lote) o histórico do universo, pontua e grava o resultado."""
+        universo = self.carregar_universo(classe)
+        historicos = HistoricoService().obter_lote(universo['ticker'], periodo)
+        resultado = self.pontuar(universo, self.calcular_metricas(historicos))
+        self.salvar_resultados(resultado, classe)
+        return resultado
+
+    def varrer_progressivo(self, classe: str = None, periodo: str = "5y", intervalo: float = 0.25
+                           ) -> Iterator[Tuple[List[str], pd.DataFrame]]:
+        """
+        Versão incremental de `varrer`: produz (tickers concluídos, linhas do resultado)
+        conforme os históricos ficam prontos. Os concluídos são pontuados juntos a cada
+        `intervalo` segundos (pontuar ticker a ticker custaria mais que a leitura);
+        tickers sem dados não geram linha. Ao final grava o resultado completo.
+        """
+        universo = self.carregar_universo(classe)
+        por_ticker = universo.set_index('ticker')
+        linhas: List[pd.DataFrame] = []
+        concluidos: List[str] = []
+        historicos: Dict[str, pd.DataFrame] = {}
+        ultima_entrega = float('-inf')  # o primeiro ticker pronto sai na hora
+
+        def entregar():
+            lote = self.pontuar(por_ticker.loc[list(historicos)].reset_index(),
+                                self.calcular_metricas(historicos))
+            linhas.append(lote)
+            return list(concluidos), lote
+
+        for ticker, hist, _ in HistoricoService().obter_progressivo(universo['ticker'], periodo):
+            concluidos.append(ticker)
+            if hist is not None and not hist.empty:
+                historicos[ticker] = hist
+            if time.monotonic() - ultima_entrega >= intervalo:
+                yield entregar()
+                concluidos.clear()
+                historicos.clear()
+                ultima_entrega = time.monotonic()
+        if concluidos:
+            yield entregar()
+
+        resultado = pd.concat(linhas, ignore_index=True) if linhas else pd.DataFrame()
+        if not resultado.empty:
+            resultado['calculado_em'] = pd.Timestamp(datetime.now())
+            self.salvar_resultados(resultado, classe)
+
+    @classmethod
+    def pontuar(cls, universo: pd.DataFrame, metricas: pd.DataFrame) -> pd.DataFrame:
+        """Junta universo, métricas e pontuação em uma linha por ticker com dados."""
+        metricas = metricas.reindex(columns=cls.COLUNAS_METRICAS)
+        pontos = AnaliseService.pontuar_lote(metricas)
+        resultado = universo.set_index('ticker').join(metricas.join(pontos), how='inner')
+        resultado['calculado_em'] = pd.Timestamp(datetime.now())
+        return resultado.reset_index()
+
+    @staticmethod
+    def calcular_metricas(historicos: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Métricas de `buscar_dados_historicos` para todos os tickers de uma vez: as séries
+        são alinhadas em matrizes datas x tickers e cada estatística é calculada por coluna.
+        "Últimas N barras" de cada ticker usam a contagem de barras válidas a partir do fim.
+        """
+        if not historicos:
+            return pd.DataFrame(columns=ScannerService.COLUNAS_METRICAS)
+
+        quadros = {}
+        for ticker, hist in historicos.items():
+            hist = hist[['Adj Close', 'Close', 'Dividends']]
+            # Índice por data (sem fuso), para alinhar pregões de bolsas diferentes
+            datas = (hist.index.tz_localize(None) if hist.index.tz is not None else hist.index).normalize()
+            hist = hist.set_axis(datas)
+            if datas.has_duplicates:
+                hist = hist.groupby(level=0).last()
+            quadros[ticker] = hist
+        alinhado = pd.concat(quadros, axis=1).sort_index()
+
+        def contagem_do_fim(df: pd.DataFrame) -> pd.DataFrame:
+            validos = df.notna()
+            return validos[::-1].cumsum()[::-1].where(validos)
+
+        # Uma matriz float contínua por campo (bloco único: where/cumsum vetorizados de fato)
+        adj, close, div = (
+            pd.DataFrame(alinhado.xs(c, axis=1, level=1).to_numpy(dtype=float),
+                         index=alinhado.index, columns=list(quadros))
+            for c in ('Adj Close', 'Close', 'Dividends'))
+
+        fim_adj = contagem_do_fim(adj)
+        n = adj.notna().sum()
+        preco_atual = close.where(contagem_do_fim(close) == 1).max()
+        ultimo_adj = adj.where(fim_adj == 1).max()
+        adj_252 = adj.where(fim_adj == 252).max()
+        variacao = ((ultimo_adj / adj_252 - 1) * 100).where(n > 252, 0.0)
+
+        proventos = div.where(div > 0)
+        fim_div = contagem_do_fim(proventos)
+        n_div = proventos.notna().sum()
+        dividendos_12m = proventos.where(fim_div <= 12).sum().where(
+            n_div >= 12, proventos.where(fim_div <= 24).mean() * 12)
+        dy = (dividendos_12m / preco_atual * 100).where((n_div > 0) & (preco_atual > 0))
+
+        return pd.DataFrame({
+            'preco_atual': preco_atual,
+            'preco_medio_12m': adj.where(fim_adj <= 252).mean(),
+            'percentil_20': adj.quantile(0.20),
+            'percentil_80': adj.quantile(0.80),
+            'minimo_5y': adj.min(),
+            'maximo_5y': adj.max(),
+            'variacao_anual': variacao,
+            'preco_medio_5y': adj.mean(),
+            'dividend_yield': dy,
+        }).dropna(subset=['preco_atual'])
+
+    # -------------------- Persistência --------------------
+    def carregar_resultados(self, classe: str = None) -> pd.DataFrame:
+        """
+        Último resultado salvo (vazio se ainda não houve varredura). Fica em memória,
+        compartilhado entre sessões, até o arquivo mudar: trocar filtro ou sensibilidade
+        na tela não relê o disco.
+        """
+        try:
+            versao = self.arquivo_resultados.stat().st_mtime_ns
+        except FileNotFoundError:
+            return pd.DataFrame()
+        chave = str(self.arquivo_resultados)
+        with self._lock:
+            em_memoria = _resultados.get(chave)
+        if em_memoria is None or em_memoria[0] != versao:
+            em_memoria = (versao, pd.read_parquet(self.arquivo_resultados))
+            with self._lock:
+                _resultados[chave] = em_memoria
+        resultados = em_memoria[1]
+        if classe:
+            return resultados[resultados['classe'] == classe].reset_index(drop=True)
+        return resultados.copy()
+
+    def calculado_em(self, classe: str = None) -> Optional[pd.Timestamp]:
+        resultados = self.carregar_resultados(classe)
+        return resultados['calculado_em'].max() if not resultados.empty else None
+
+    def salvar_resultados(self, resultado: pd.DataFrame, classe: str = None):
+        """Substitui as linhas da classe varrida (ou tudo, se `classe` for None)."""
+        with self._lock:
+            anteriores = self.carregar_resultados()
+            if classe and not anteriores.empty:
+                resultado = pd.concat([anteriores[anteriores['classe'] != classe], resultado],
+                                      ignore_index=True)
+            self.arquivo_resultados.parent.mkdir(parents=True, exist_ok=True)
+            temporario = self.arquivo_resultados.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            resultado.to_parquet(temporario, index=False)
+            os.replace(temporario, self.arquivo_resultados)
@@ -1,9 +1,8 @@
 # services/teto_service.py
-import yfinance as yf
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
-from config.settings import settings
-from services.preco_service import session
+from typing import Dict, Optional, Tuple
+from services.historico_service import HistoricoService
+from utils.concorrencia import executar_em_lote
 
 class PrecoTetoService:
     """Serviço para cálculo de preço teto pelo método Bazin."""
@@ -15,21 +14,17 @@ class PrecoTetoService:
         Retorna (preco_teto, mensagem).
         """
         try:
-            # Formatar ticker
-            if ticker[-1].isdigit() and len(ticker) >= 5:
-                ticker_yf = f"{ticker}.SA"
-            else:
-                ticker_yf = ticker
-            
-            acao = yf.Ticker(ticker_yf, session=session)
-            dividends = acao.dividends
+            hist = HistoricoService().obter(ticker, "5y")
+            if hist.empty:
+                return None, "Sem histórico de dividendos"
+            dividends = hist['Dividends'][hist['Dividends'] > 0]
             
             if dividends.empty:
                 return None, "Sem histórico de dividendos"
             
             # Últimos 12 meses
             um_ano_atras = datetime.now() - timedelta(days=365)
-            dividends_12m = dividends[dividends.index >= um_ano_atras].sum()
+            dividends_12m = dividends[dividends.index.tz_localize(None) >= um_ano_atras].sum()
             
             if dividends_12m <= 0:
                 # Tenta usar os últimos 4 trimestres como fallback
@@ -43,3 +38,9 @@ class PrecoTetoService:
         
         except Exception as e:
             return None, str(e)
+    
+    @staticmethod
+    def calcular_bazin_lote(tickers, dy_desejado: float = 0.06) -> Dict[str, Tuple[Optional[float], str]]:
+        """Calcula o preço teto de vários ativos em paralelo (pool compartilhado)."""
+        resultados = executar_em_lote(lambda t: PrecoTetoService.calcular_bazin(t, dy_desejado), tickers)
+        return {t: r if r is not None else (None, "Tempo esgotado") for t, r in resultados.items()}
@@ -1,6 +1,6 @@
-import yfinance as yf
 import pandas as pd
 import streamlit as st
+from services.retornos_service import RetornosService
 
 def run_backtest(df_carteira):
     """Compara o desempenho da carteira com o Ibovespa no último ano."""
@@ -8,8 +8,8 @@ def run_backtest(df_carteira):
     
     try:
         # Busca dados do último ano
-        data = yf.download(tickers + ["^BVSP"], period="1y", interval="1d")['Close']
-        retornos = data.pct_change().dropna()
+        # Matriz compartilhada com as demais análises (calendário B3/EUA já alinhado)
+        retornos = RetornosService.obter(tickers + ["^BVSP"], "1y", coluna="Close").retornos.dropna()
         acumulado = (1 + retornos).cumprod()
         
         # Performance da Carteira (Média ponderada simplificada dos ativos)
@@ -1,6 +1,6 @@
 import pandas as pd
-import yfinance as yf
 import streamlit as st
+from services.provedor_mercado import get_provedor
 
 @st.cache_data(ttl=600)
 def fetch_data():
@@ -18,16 +18,11 @@ def fetch_data():
 def sync_prices(df):
     try:
         tickers = df['Ativo'].unique().tolist()
-        data = yf.download(tickers, period="1d", progress=False)['Close']
+        data = get_provedor().fechamentos(tickers, period="1d")
         
         p_dict = {}
         for t in tickers:
-            # Tratamento para um ou vários ativos
-            if len(tickers) > 1:
-                val = data[t].iloc[-1]
-            else:
-                val = data.iloc[-1]
-            p_dict[t] = float(val)
+            p_dict[t] = float(data[t].dropna().iloc[-1])
             
         df['Preço Atual'] = df['Ativo'].map(p_dict)
         df['Patrimônio'] = df['QTD'] * df['Preço Atual']
@@ -0,0 +1,11 @@
+# tests/conftest.py
+import pytest
+from database.conexao import GerenciadorConexoes
+
+
+@pytest.fixture
+def banco(tmp_path):
+    """Banco SQLite vazio em arquivo temporário, fechado ao fim do teste."""
+    gerenciador = GerenciadorConexoes(str(tmp_path / "teste.db"))
+    yield gerenciador
+    gerenciador.fechar_todas()
@@ -0,0 +1,52 @@
+# tests/unit/test_analise_service.py
+import numpy as np
+import pandas as pd
+import pytest
+from modules.analise import analisar_preco_ativo
+from services.analise_service import AnaliseService
+
+
+def _metricas_aleatorias(n: int, semente: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(semente)
+    minimo = rng.uniform(5, 50, n)
+    maximo = minimo * rng.uniform(1.0, 4.0, n)
+    maximo[::17] = minimo[::17]  # série sem amplitude: posição relativa = 50
+    return pd.DataFrame({
+        'preco_atual': rng.uniform(minimo, maximo),
+        'preco_medio_12m': rng.uniform(minimo, maximo),
+        'percentil_20': minimo + (maximo - minimo) * 0.2,
+        'percentil_80': minimo + (maximo - minimo) * 0.8,
+        'minimo_5y': minimo,
+        'maximo_5y': maximo,
+        'variacao_anual': rng.uniform(-70, 80, n),
+        'dividend_yield': rng.uniform(0, 12, n),
+    }, index=[f"T{i}" for i in range(n)])
+
+
+def test_pontuar_lote_igual_a_analise_escalar():
+    metricas = _metricas_aleatorias(500)
+    # Valores exatamente nas fronteiras das faixas
+    metricas.iloc[0, :7] = [85.0, 100.0, 80.0, 120.0, 50.0, 150.0, -20.0]
+    metricas.iloc[1, :7] = [110.0, 100.0, 80.0, 120.0, 50.0, 150.0, 30.0]
+
+    lote = AnaliseService.pontuar_lote(metricas)
+
+    for ticker, linha in metricas.iterrows():
+        status, mensagem, _, _, pontuacao = analisar_preco_ativo(ticker, linha.to_dict())
+        assert lote.loc[ticker, 'pontuacao'] == pontuacao, ticker
+        assert lote.loc[ticker, 'status'] == status, ticker
+        assert lote.loc[ticker, 'mensagem'] == mensagem, ticker
+
+
+def test_reclassificar_moderado_preserva_o_lote():
+    metricas = _metricas_aleatorias(100)
+    pontuados = AnaliseService.pontuar_lote(metricas).join(metricas[['preco_atual', 'preco_medio_12m']])
+
+    pd.testing.assert_frame_equal(AnaliseService.reclassificar(pontuados, "Moderado"), pontuados)
+
+
+@pytest.mark.parametrize("pontuacao, esperado", [
+    (-30, "oportunidade"), (-29, "barato"), (-10, "barato"), (0, "neutro"), (15, "atencao"), (16, "caro"),
+])
+def test_classificar_perfil_agressivo(pontuacao, esperado):
+    assert AnaliseService.classificar([pontuacao], AnaliseService.PERFIS["Agressivo"])[0] == esperado
@@ -0,0 +1,43 @@
+# tests/unit/test_bola_neve_service.py
+import itertools
+import numpy as np
+import pytest
+from services.bola_neve_service import BolaNeveService
+
+
+def _acumulado_exato(normal: float, crise: float, meses: int) -> float:
+    """E[G_1·…·G_n] somando todas as sequências de regimes da cadeia."""
+    pe, ps = BolaNeveService.P_ENTRAR_CRISE, BolaNeveService.P_SAIR_CRISE
+    transicao = {(0, 0): 1 - pe, (0, 1): pe, (1, 0): ps, (1, 1): 1 - ps}
+    inicial = {0: ps / (pe + ps), 1: pe / (pe + ps)}
+    fatores = {0: normal, 1: crise}
+    total = 0.0
+    for regimes in itertools.product((0, 1), repeat=meses):
+        probabilidade = inicial[regimes[0]]
+        for anterior, atual in zip(regimes, regimes[1:]):
+            probabilidade *= transicao[anterior, atual]
+        total += probabilidade * np.prod([fatores[r] for r in regimes])
+    return total
+
+
+@pytest.mark.parametrize("meses", [1, 2, 6, 10])
+def test_regime_normal_calibrado_para_o_horizonte(meses):
+    i, crise = float(BolaNeveService.taxa_mensal(0.10)), 0.97
+
+    normal = BolaNeveService._esperado_normal(i, crise, meses)
+
+    assert _acumulado_exato(normal, crise, meses) == pytest.approx((1 + i) ** meses, rel=1e-10)
+
+
+def test_um_mes_igual_a_media_ponderada_dos_regimes():
+    i, crise = float(BolaNeveService.taxa_mensal(0.10)), 0.97
+    em_crise = BolaNeveService.P_ENTRAR_CRISE / (BolaNeveService.P_ENTRAR_CRISE + BolaNeveService.P_SAIR_CRISE)
+
+    assert BolaNeveService._esperado_normal(i, crise, 1) == pytest.approx((1 + i - em_crise * crise) / (1 - em_crise))
+
+
+def test_media_simulada_dos_regimes_segue_a_taxa():
+    resultado = BolaNeveService.simular(100, 0, 10, "Regimes", taxa_anual=0.10, caminhos=40000, semente=3)
+
+    esperado = BolaNeveService.valor_futuro(100, 0, 0.10, 120)
+    assert resultado.finais.mean() == pytest.approx(esperado, rel=0.015)
@@ -0,0 +1,218 @@
+# tests/unit/test_concorrencia.py
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from config.settings import settings
+from utils import concorrencia
+from utils.concorrencia import (CircuitBreaker, CircuitoAberto, SingleFlight, executar_em_lote,
+                                mapear_concorrente)
+
+
+@pytest.fixture
+def pool_pequeno(monkeypatch):
+    """Pool de busca novo, com só dois workers."""
+    monkeypatch.setattr(settings, "MAX_WORKERS", 2)
+    monkeypatch.setattr(concorrencia, "_executores", {})
+    yield
+    for executor in concorrencia._executores.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _em_thread(funcao, prazo: float = 10.0):
+    """Roda `funcao` em outra thread e devolve o resultado; falha se não terminar no prazo."""
+    saida = {}
+    thread = threading.Thread(target=lambda: saida.update(resultado=funcao()), daemon=True)
+    thread.start()
+    thread.join(prazo)
+    assert not thread.is_alive(), "travou"
+    return saida['resultado']
+
+
+# -------------------- mapear_concorrente --------------------
+def test_chamadas_aninhadas_rodam_na_thread_da_tarefa(pool_pequeno):
+    threads = {}
+
+    def interna(item):
+        threads.setdefault(item[0], set()).add(threading.current_thread().name)
+        return item[1] * 10
+
+    def externa(grupo):
+        threads.setdefault(grupo, set()).add(threading.current_thread().name)
+        return executar_em_lote(interna, [(grupo, i) for i in range(3)])
+
+    # Quatro tarefas externas, cada uma esperando três internas, com só dois workers
+    resultados = _em_thread(lambda: executar_em_lote(externa, "abcd"))
+
+    assert resultados == {g: {(g, i): i * 10 for i in range(3)} for g in "abcd"}
+    assert all(len(nomes) == 1 for nomes in threads.values())
+
+
+def test_chamada_que_estoura_o_prazo_vira_timeout(pool_pequeno):
+    liberar = threading.Event()
+
+    def funcao(item):
+        if item == "lento":
+            liberar.wait(5)
+        return item.upper()
+
+    inicio = time.monotonic()
+    try:
+        saida = {item: (resultado, erro) for item, resultado, erro in
+                 mapear_concorrente(funcao, ["a", "lento", "b"], timeout=0.3)}
+    finally:
+        liberar.set()
+
+    assert time.monotonic() - inicio < 3
+    assert saida == {"a": ("A", None), "b": ("B", None), "lento": (None, "timeout")}
+
+
+def test_excecoes_viram_erro_sem_interromper_os_demais(pool_pequeno):
+    def funcao(item):
+        if item == 2:
+            raise ValueError("falhou")
+        return item
+
+    saida = {item: (resultado, erro) for item, resultado, erro in mapear_concorrente(funcao, [1, 2, 3, 1])}
+
+    assert saida == {1: (1, None), 2: (None, "falhou"), 3: (3, None)}
+
+
+# -------------------- SingleFlight --------------------
+def test_lote_so_busca_as_chaves_que_ninguem_esta_buscando():
+    voos = SingleFlight()
+    entrou, liberar = threading.Event(), threading.Event()
+    pedidos = []
+
+    def lider(chaves):
+        pedidos.append(list(chaves))
+        entrou.set()
+        liberar.wait(5)
+        return {c: c.upper() for c in chaves}
+
+    def seguidor(chaves):
+        pedidos.append(list(chaves))
+        return {c: c * 2 for c in chaves}
+
+    primeira = threading.Thread(target=lambda: voos.executar_lote(["a", "b"], lider), daemon=True)
+    primeira.start()
+    entrou.wait(5)
+    segunda = {}
+    thread = threading.Thread(target=lambda: segunda.update(voos.executar_lote(["b", "c", "c"], seguidor)),
+                              daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    assert not segunda  # "b" ainda está em voo
+    liberar.set()
+    primeira.join(5)
+    thread.join(5)
+
+    assert pedidos == [["a", "b"], ["c"]]
+    assert segunda == {"b": "B", "c": "cc"}
+    assert voos.em_voo() == 0
+
+
+def test_excecao_do_lote_chega_a_quem_espera():
+    voos = SingleFlight()
+    entrou, liberar = threading.Event(), threading.Event()
+    erros = []
+
+    def lider(chaves):
+        entrou.set()
+        liberar.wait(5)
+        raise ConnectionError("provedor fora")
+
+    def esperar(funcao, chaves):
+        try:
+            voos.executar_lote(chaves, funcao)
+        except ConnectionError as e:
+            erros.append(str(e))
+
+    primeira = threading.Thread(target=esperar, args=(lider, ["a"]), daemon=True)
+    primeira.start()
+    entrou.wait(5)
+    segunda = threading.Thread(target=esperar, args=(lambda chaves: {}, ["a"]), daemon=True)
+    segunda.start()
+    time.sleep(0.1)
+    liberar.set()
+    primeira.join(5)
+    segunda.join(5)
+
+    assert erros == ["provedor fora", "provedor fora"]
+    assert voos.em_voo() == 0
+
+
+
+# -------------------- CircuitBreaker --------------------
+@pytest.fixture
+def relogio(monkeypatch):
+    """Relógio falso do módulo: avance com `relogio.agora += segundos`."""
+    falso = SimpleNamespace(agora=1000.0)
+    falso.monotonic = lambda: falso.agora
+    monkeypatch.setattr(concorrencia, "time", falso)
+    return falso
+
+
+def _falhar():
+    raise ConnectionError("fora do ar")
+
+
+def test_abre_apos_falhas_seguidas_e_recusa_sem_chamar(relogio):
+    circuito = CircuitBreaker("teste", limite_falhas=3, espera=10)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            circuito.chamar(_falhar)
+    assert circuito.estado == "fechado"
+
+    with pytest.raises(ConnectionError):
+        circuito.chamar(_falhar)
+    assert circuito.estado == "aberto"
+    chamadas = []
+    with pytest.raises(CircuitoAberto):
+        circuito.chamar(lambda: chamadas.append(1))
+    assert chamadas == []
+
+
+def test_meio_aberto_libera_uma_unica_tentativa_que_fecha_o_circuito(relogio):
+    circuito = CircuitBreaker("teste", limite_falhas=1, espera=10)
+    with pytest.raises(ConnectionError):
+        circuito.chamar(_falhar)
+    relogio.agora += 9.9
+    assert circuito.estado == "aberto"
+
+    relogio.agora += 0.1
+    assert circuito.estado == "meio-aberto"
+    assert circuito.permitir()
+    assert not circuito.permitir()  # só uma tentativa de teste por vez
+    circuito.registrar_sucesso()
+
+    assert circuito.estado == "fechado"
+    assert circuito.chamar(lambda: "ok") == "ok"
+
+
+def test_tentativa_que_falha_reabre_por_mais_uma_espera(relogio):
+    circuito = CircuitBreaker("teste", limite_falhas=2, espera=10)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            circuito.chamar(_falhar)
+    relogio.agora += 10
+
+    with pytest.raises(ConnectionError):
+        circuito.chamar(_falhar)  # a tentativa de teste
+
+    assert circuito.estado == "aberto"
+    relogio.agora += 9
+    with pytest.raises(CircuitoAberto):
+        circuito.chamar(lambda: "ok")
+    relogio.agora += 1
+    assert circuito.chamar(lambda: "ok") == "ok"
+    assert circuito.estado == "fechado"
+
+
+def test_excecoes_ignoradas_nao_contam_como_falha(relogio):
+    circuito = CircuitBreaker("teste", limite_falhas=1, espera=10)
+
+    with pytest.raises(KeyError):
+        circuito.chamar(lambda: {}["x"], ignorar=(KeyError,))
+
+    assert circuito.estado == "fechado"
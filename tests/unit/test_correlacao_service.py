@@ -0,0 +1,68 @@
+# tests/unit/test_correlacao_service.py
+import numpy as np
+import pandas as pd
+import pytest
+from services.correlacao_service import CorrelacaoService
+from services.retornos_service import MatrizRetornos
+
+TICKERS = ('AAA', 'BBB', 'CCC', 'DDD')
+
+
+def _precos(dias: int, semente: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(semente)
+    comum = rng.normal(0, 0.01, (dias, 1))
+    log_retornos = comum + rng.normal(0, 0.01, (dias, len(TICKERS)))
+    precos = pd.DataFrame(100 * np.exp(np.cumsum(log_retornos, axis=0)),
+                          index=pd.bdate_range("2022-01-03", periods=dias), columns=list(TICKERS))
+    precos.iloc[5:40, 3] = np.nan  # ativo listado depois dos demais
+    precos.iloc[100:103, 2] = np.nan
+    return precos
+
+
+def _matriz(precos: pd.DataFrame, versao: int) -> MatrizRetornos:
+    return MatrizRetornos(tickers=TICKERS, janela="1y", coluna="Close", precos=precos,
+                          log_retornos=np.log(precos / precos.shift(1)).iloc[1:], versao=versao,
+                          verificado_em=0.0)
+
+
+def _comparar(estado, matriz):
+    esperado = matriz.retornos.corr()
+    pd.testing.assert_frame_equal(estado.correlacao, esperado, atol=1e-9, rtol=0)
+
+
+def test_montagem_igual_a_dataframe_corr():
+    matriz = _matriz(_precos(300)[:250], 1)
+    _comparar(CorrelacaoService._atualizar(None, matriz), matriz)
+
+
+def test_janela_deslizante_igual_a_dataframe_corr():
+    precos = _precos(300)
+    estado = CorrelacaoService._atualizar(None, _matriz(precos[:250], 1))
+    somas = estado.somas
+
+    for versao, fim in enumerate(range(251, 300, 7), start=2):
+        matriz = _matriz(precos[fim - 250:fim], versao)
+        estado = CorrelacaoService._atualizar(estado, matriz)
+        _comparar(estado, matriz)
+    # Só dias entraram e saíram: as somas foram atualizadas no lugar
+    assert estado.somas is somas
+
+
+def test_barra_revisada_entra_de_novo_nas_somas():
+    precos = _precos(260)
+    estado = CorrelacaoService._atualizar(None, _matriz(precos[:250], 1))
+
+    revisados = precos[1:251].copy()
+    revisados.iloc[-1, 0] *= 1.05  # fechamento do último pregão corrigido
+    matriz = _matriz(revisados, 2)
+    _comparar(CorrelacaoService._atualizar(estado, matriz), matriz)
+
+
+def test_pares_extremos():
+    correlacao = pd.DataFrame([[1.0, 0.9, -0.2], [0.9, 1.0, 0.1], [-0.2, 0.1, 1.0]],
+                              index=['A', 'B', 'C'], columns=['A', 'B', 'C'])
+
+    maiores, menores = CorrelacaoService.pares_extremos(correlacao, k=2)
+
+    assert maiores[['ativo_1', 'ativo_2']].values.tolist() == [['A', 'B'], ['B', 'C']]
+    assert menores['correlacao'].tolist() == pytest.approx([-0.2, 0.1])
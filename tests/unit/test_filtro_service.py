@@ -0,0 +1,81 @@
+# tests/unit/test_filtro_service.py
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+from services import filtro_service
+from services.filtro_service import FiltroInvalido, FiltroService
+
+
+@pytest.fixture
+def resultados():
+    return pd.DataFrame({
+        'ticker': ['A', 'B', 'C', 'D'],
+        'classe': ['Ações'] * 4,
+        'calculado_em': pd.Timestamp("2024-05-01"),
+        'preco_atual': [10.0, 20.0, 30.0, 40.0],
+        'preco_medio_12m': [12.0, 18.0, 30.0, 50.0],
+        'percentil_20': 0.0, 'percentil_80': 0.0, 'minimo_5y': 0.0, 'maximo_5y': 0.0,
+        'preco_medio_5y': 0.0,
+        'variacao_anual': [-15.0, 5.0, 40.0, -30.0],
+        'dividend_yield': [9.0, 4.0, np.nan, 12.0],
+        'pontuacao': [-40, 0, 30, -50],
+    })
+
+
+@pytest.mark.parametrize("expressao, aprovados", [
+    ("dy > 8", ['A', 'D']),
+    ("dy > 8 and variacao_anual < -20", ['D']),
+    ("dy > 8 or variacao_anual > 30", ['A', 'C', 'D']),
+    ("not dy > 8", ['B', 'C']),
+    ("-50 <= pontuacao < 0", ['A', 'D']),
+    ("preco / preco_medio_12m < 0.9", ['A', 'D']),
+    ("  preco   <   25 ", ['A', 'B']),
+])
+def test_aceita_expressoes(resultados, expressao, aprovados):
+    assert FiltroService.aplicar(expressao, resultados)['ticker'].tolist() == aprovados
+
+
+@pytest.mark.parametrize("expressao", [
+    "",
+    "dy >",
+    "lucro > 1",
+    "__import__('os').system('ls') > 0",
+    "dy ** 2 > 4",
+    "dy in (1, 2)",
+    "dy > True",
+    "preco + 1",
+    "not dy",
+    "not (dy + 1)",
+    "dy and preco > 1",
+    "preco > 1 or pontuacao",
+    "x" * (FiltroService.TAMANHO_MAXIMO + 1),
+])
+def test_rejeita_expressoes(expressao):
+    with pytest.raises(FiltroInvalido):
+        FiltroService.validar(expressao)
+
+
+def test_validar_devolve_a_expressao_normalizada():
+    assert FiltroService.validar("dy  >\t8") == "dy > 8"
+
+
+def test_cache_de_compilados_limitado():
+    assert FiltroService.compilar("dy > 1") is FiltroService.compilar("dy  > 1")
+    assert FiltroService._compilar.cache_info().maxsize == FiltroService.MAXIMO_COMPILADOS
+    for i in range(FiltroService.MAXIMO_COMPILADOS + 10):
+        FiltroService.compilar(f"dy > {i}")
+    assert FiltroService._compilar.cache_info().currsize <= FiltroService.MAXIMO_COMPILADOS
+
+
+def test_resultados_aplicados_limitados(resultados, monkeypatch):
+    monkeypatch.setattr(filtro_service, "_aplicados", OrderedDict())
+    monkeypatch.setattr(filtro_service, "_MAX_APLICADOS", 5)
+
+    FiltroService.aplicar("dy > 0", resultados)
+    for i in range(10):
+        FiltroService.aplicar(f"preco > {i}", resultados)
+        FiltroService.aplicar("dy > 0", resultados)  # o mais usado continua guardado
+
+    assert len(filtro_service._aplicados) == 5
+    assert ("dy > 0", "Ações", pd.Timestamp("2024-05-01")) in filtro_service._aplicados
@@ -0,0 +1,97 @@
+# tests/unit/test_historico_service.py
+import numpy as np
+import pandas as pd
+import pytest
+from config.settings import settings
+from services import provedor_mercado
+from services.historico_service import HistoricoService
+from services.provedor_mercado import ArquivoProvider, definir_provedor
+
+TICKER = "PETR4"
+
+
+class ProvedorEspiao(ArquivoProvider):
+    """ArquivoProvider que registra os argumentos de cada download."""
+
+    def __init__(self, diretorio):
+        super().__init__(diretorio)
+        self.chamadas = []
+
+    def historico(self, ticker, period=None, start=None, end=None):
+        self.chamadas.append({'period': period, 'start': start, 'end': end})
+        return super().historico(ticker, period=period, start=start, end=end)
+
+
+def _serie(dias: int) -> pd.DataFrame:
+    indice = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=dias)
+    fechamento = 30 + np.cumsum(np.random.default_rng(1).normal(0, 0.3, dias))
+    return pd.DataFrame({'Open': fechamento, 'High': fechamento, 'Low': fechamento, 'Close': fechamento,
+                         'Adj Close': fechamento, 'Volume': 1000.0, 'Dividends': 0.0,
+                         'Stock Splits': 0.0}, index=indice)
+
+
+@pytest.fixture
+def provedor(tmp_path, monkeypatch):
+    # monkeypatch devolve o provedor anterior ao fim do teste
+    monkeypatch.setattr(provedor_mercado, "_provedor", None)
+    espiao = ProvedorEspiao(str(tmp_path / "raw"))
+    definir_provedor(espiao)
+    return espiao
+
+
+@pytest.fixture
+def historico(tmp_path):
+    return HistoricoService(str(tmp_path / "cache"))
+
+
+def test_atualizacao_baixa_so_as_barras_novas(provedor, historico, monkeypatch):
+    completa = _serie(800)
+    provedor.gravar("PETR4.SA", completa.iloc[:-5])
+    historico.obter(TICKER, "1y")
+    assert provedor.chamadas == [{'period': "1y", 'start': None, 'end': None}]
+
+    provedor.gravar("PETR4.SA", completa)
+    monkeypatch.setattr(settings, "YF_CACHE_TTL", -1)
+    provedor.chamadas.clear()
+    historico.obter(TICKER, "1y")
+
+    assert provedor.chamadas == [{'period': None, 'start': completa.index[-6].date(), 'end': None}]
+    armazenado = historico.carregar(TICKER)
+    assert armazenado.index[-1] == completa.index[-1]
+    assert armazenado.index.is_unique and armazenado.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(armazenado, completa.loc[armazenado.index[0]:], check_freq=False)
+
+
+def test_periodo_maior_completa_so_o_inicio_e_registra_a_cobertura(provedor, historico):
+    completa = _serie(800)
+    provedor.gravar("PETR4.SA", completa)
+    historico.obter(TICKER, "1y")
+    um_ano = HistoricoService._cobertura(historico.carregar(TICKER))
+    primeira = historico.carregar(TICKER).index[0]
+    assert um_ano == HistoricoService._inicio_periodo("1y")
+
+    provedor.chamadas.clear()
+    dois_anos = historico.obter(TICKER, "2y")
+
+    inicio = HistoricoService._inicio_periodo("2y")
+    assert provedor.chamadas == [{'period': None, 'start': inicio.date(), 'end': primeira.date()}]
+    armazenado = historico.carregar(TICKER)
+    assert HistoricoService._cobertura(armazenado) == inicio
+    pd.testing.assert_frame_equal(armazenado, completa.loc[inicio:], check_freq=False)
+    pd.testing.assert_frame_equal(dois_anos, armazenado, check_freq=False)
+
+    historico.obter(TICKER, "max")
+    armazenado = historico.carregar(TICKER)
+    assert HistoricoService._cobertura(armazenado) is None
+    pd.testing.assert_frame_equal(armazenado, completa, check_freq=False)
+
+
+def test_pedido_menor_que_a_cobertura_nao_acessa_o_provedor(provedor, historico):
+    provedor.gravar("PETR4.SA", _serie(800))
+    historico.obter(TICKER, "2y")
+    provedor.chamadas.clear()
+
+    seis_meses = historico.obter(TICKER, "6mo")
+
+    assert provedor.chamadas == []
+    assert seis_meses.index[0] >= HistoricoService._inicio_periodo("6mo")
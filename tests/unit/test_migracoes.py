@@ -0,0 +1,102 @@
+# tests/unit/test_migracoes.py
+import sqlite3
+import pytest
+from database.migracoes import MIGRACOES, adotar_banco_legado, aplicar_migracoes, versao_atual
+
+
+@pytest.fixture
+def banco_legado(banco):
+    """Banco criado pelo app.py antigo: sem ultimo_login, sem schema_versao e com posições duplicadas."""
+    conn = sqlite3.connect(banco.caminho)
+    conn.executescript('''
+        CREATE TABLE usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            nome TEXT NOT NULL,
+            senha_hash TEXT NOT NULL
+        );
+        CREATE TABLE ativos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            qtd REAL NOT NULL,
+            pm REAL NOT NULL,
+            setor TEXT NOT NULL
+        );
+        INSERT INTO usuarios (username, nome, senha_hash) VALUES ('ana', 'Ana', 'x');
+        INSERT INTO ativos (user_id, ticker, qtd, pm, setor) VALUES
+            (1, 'PETR4', 100, 10.0, 'Ações'),
+            (1, 'PETR4', 300, 14.0, 'Ações'),
+            (1, 'HGLG11', 10, 160.0, 'FIIs'),
+            (1, 'VALE3', 0, 60.0, 'Ações'),
+            (1, 'VALE3', 0, 70.0, 'Ações');
+    ''')
+    conn.commit()
+    conn.close()
+    return banco
+
+
+def _colunas(conn, tabela):
+    return {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})").fetchall()}
+
+
+def test_migra_banco_legado_ate_a_ultima_versao(banco_legado):
+    aplicadas = aplicar_migracoes(banco_legado)
+
+    conn = banco_legado.conexao()
+    assert aplicadas == [versao for versao, _, _ in MIGRACOES]
+    assert versao_atual(banco_legado) == MIGRACOES[-1][0]
+    assert 'ultimo_login' in _colunas(conn, 'usuarios')
+    assert {'lucro_realizado', 'proventos'} <= _colunas(conn, 'ativos')
+    assert conn.execute("SELECT nome FROM usuarios").fetchone()[0] == 'Ana'
+
+
+def test_duplicatas_viram_uma_posicao_com_preco_medio_ponderado(banco_legado):
+    aplicar_migracoes(banco_legado)
+
+    conn = banco_legado.conexao()
+    posicoes = dict((t, (q, pm)) for t, q, pm in conn.execute("SELECT ticker, qtd, pm FROM ativos").fetchall())
+    assert posicoes['PETR4'] == (400, pytest.approx((100 * 10 + 300 * 14) / 400))
+    assert posicoes['HGLG11'] == (10, 160.0)
+    # Grupo com quantidade total zero: sem divisão por zero, pm continua preenchido
+    assert posicoes['VALE3'] == (0, 70.0)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO ativos (user_id, ticker, qtd, pm, setor) VALUES (1, 'PETR4', 1, 1, 'Ações')")
+    # Cada posição entra no livro como uma compra pelo preço médio
+    livro = conn.execute("SELECT ticker, tipo, qtd, preco FROM transacoes ORDER BY ticker").fetchall()
+    assert [tuple(linha) for linha in livro] == [('HGLG11', 'compra', 10, 160.0),
+                                                 ('PETR4', 'compra', 400, pytest.approx(13.0))]
+
+
+def test_migracoes_em_etapas_e_idempotentes(banco_legado):
+    assert aplicar_migracoes(banco_legado, ate=3) == [1, 2, 3]
+    assert versao_atual(banco_legado) == 3
+
+    assert aplicar_migracoes(banco_legado) == [versao for versao, _, _ in MIGRACOES if versao > 3]
+    assert aplicar_migracoes(banco_legado) == []
+    assert aplicar_migracoes(banco_legado, ate=MIGRACOES[-1][0]) == []
+
+
+def test_adota_o_banco_legado_quando_o_configurado_nao_existe(tmp_path):
+    legado, novo = tmp_path / "invest_v8.db", tmp_path / "dados" / "invest_v8_secure.db"
+    conn = sqlite3.connect(legado)
+    conn.execute("CREATE TABLE usuarios (id INTEGER PRIMARY KEY, username TEXT)")
+    conn.execute("INSERT INTO usuarios (username) VALUES ('ana')")
+    conn.commit()
+    conn.close()
+
+    assert adotar_banco_legado(str(novo), str(legado))
+
+    copia = sqlite3.connect(novo)
+    assert copia.execute("SELECT username FROM usuarios").fetchall() == [('ana',)]
+    copia.close()
+    assert legado.exists()
+    # Com o banco novo já criado, nada é copiado de novo
+    assert not adotar_banco_legado(str(novo), str(legado))
+
+
+def test_sem_banco_legado_nada_e_criado(tmp_path):
+    novo = tmp_path / "invest_v8_secure.db"
+
+    assert not adotar_banco_legado(str(novo), str(tmp_path / "invest_v8.db"))
+    assert not novo.exists()
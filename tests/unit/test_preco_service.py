@@ -0,0 +1,112 @@
+# tests/unit/test_preco_service.py
+import threading
+import time
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from config.settings import settings
+from services import preco_service, provedor_mercado
+from services.preco_service import PrecoService
+from utils import concorrencia
+from utils.concorrencia import SingleFlight
+
+
+class ProvedorFalso:
+    """Provedor de cotações em memória: conta os downloads e pode segurá-los."""
+
+    nome = "falso"
+
+    def __init__(self, precos):
+        self.precos = dict(precos)
+        self.pedidos = []
+        self.liberado = threading.Event()
+        self.liberado.set()
+
+    def cotacoes(self, tickers, period="5d"):
+        self.pedidos.append(sorted(tickers))
+        self.liberado.wait(5)
+        hoje = pd.Timestamp.now().normalize()
+        return pd.concat({t: pd.DataFrame({'Close': [self.precos[t]]}, index=[hoje])
+                          for t in tickers if t in self.precos}, axis=1)
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Relógio falso do cache de cotações: avance com `relogio.agora += segundos`."""
+    falso = SimpleNamespace(agora=1_000_000.0)
+    falso.time = lambda: falso.agora
+    monkeypatch.setattr(preco_service, "time", falso)
+    return falso
+
+
+@pytest.fixture
+def provedor(monkeypatch, relogio):
+    falso = ProvedorFalso({"PETR4.SA": 30.0, "VALE3.SA": 60.0})
+    monkeypatch.setattr(provedor_mercado, "_provedor", falso)
+    monkeypatch.setattr(preco_service, "_cotacoes", {})
+    monkeypatch.setattr(preco_service, "_revalidando", set())
+    monkeypatch.setattr(preco_service, "_voos", SingleFlight())
+    monkeypatch.setattr(concorrencia, "_circuitos", {})
+    return falso
+
+
+def _esperar_revalidacao(tickers, prazo: float = 5.0):
+    limite = time.monotonic() + prazo
+    while PrecoService.revalidando(tickers):
+        assert time.monotonic() < limite, "revalidação não terminou"
+        time.sleep(0.01)
+
+
+def test_primeira_busca_espera_a_rede_e_as_seguintes_saem_do_cache(provedor):
+    dados = PrecoService.buscar_precos_batch(["PETR4", "VALE3", "PETR4"])
+
+    assert {t: d.preco_atual for t, d in dados.items()} == {"PETR4": 30.0, "VALE3": 60.0}
+    assert dados["PETR4"].status == "ok"
+    PrecoService.buscar_precos_batch(["VALE3", "PETR4"])
+    assert provedor.pedidos == [["PETR4.SA", "VALE3.SA"]]
+
+
+def test_cotacao_vencida_sai_na_hora_e_revalida_em_segundo_plano(provedor, relogio):
+    PrecoService.buscar_precos_batch(["PETR4", "VALE3"])
+    provedor.precos["PETR4.SA"] = 31.0
+    provedor.liberado.clear()
+    relogio.agora += settings.YF_CACHE_TTL
+
+    inicio = time.monotonic()
+    dados = PrecoService.buscar_precos_batch(["PETR4", "VALE3"])
+    # O download de revalidação está preso: a página recebe o valor antigo sem esperar
+    assert time.monotonic() - inicio < 1
+    assert dados["PETR4"].preco_atual == 30.0
+    assert PrecoService.revalidando(["PETR4"])
+    PrecoService.buscar_precos_batch(["PETR4", "VALE3"])  # não agenda uma segunda revalidação
+
+    provedor.liberado.set()
+    _esperar_revalidacao(["PETR4", "VALE3"])
+
+    assert provedor.pedidos == [["PETR4.SA", "VALE3.SA"]] * 2
+    assert PrecoService.buscar_precos_batch(["PETR4"])["PETR4"].preco_atual == 31.0
+    assert len(provedor.pedidos) == 2
+
+
+def test_cotacao_dentro_da_validade_nao_revalida(provedor, relogio):
+    PrecoService.buscar_precos_batch(["PETR4"])
+    relogio.agora += settings.YF_CACHE_TTL - 1
+
+    PrecoService.buscar_precos_batch(["PETR4"])
+
+    assert not PrecoService.revalidando(["PETR4"])
+    assert len(provedor.pedidos) == 1
+
+
+def test_falha_do_provedor_nao_fica_em_cache(provedor):
+    def fora_do_ar(tickers, period="5d"):
+        provedor.pedidos.append(sorted(tickers))
+        raise ConnectionError("fora do ar")
+    provedor.cotacoes = fora_do_ar
+
+    dados = PrecoService.buscar_precos_batch(["PETR4", "Tesouro Selic"])
+
+    assert dados["PETR4"].status == "erro"
+    assert dados["Tesouro Selic"].mensagem == "Ticker inválido"
+    assert provedor.pedidos == [["PETR4.SA"]]
+    assert "PETR4" not in preco_service._cotacoes
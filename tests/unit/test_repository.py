@@ -0,0 +1,18 @@
+# tests/unit/test_repository.py
+from config.settings import settings
+from database.migracoes import MIGRACOES, versao_atual
+from database.repository import DatabaseManager
+
+
+def test_database_manager_sem_argumentos_usa_o_banco_das_configuracoes(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "padrao.db")
+    monkeypatch.setattr(settings, "DB_PATH", caminho)
+
+    manager = DatabaseManager()
+
+    assert manager.db_path == caminho
+    assert manager.banco.caminho == caminho
+    assert versao_atual(manager.banco) == MIGRACOES[-1][0]
+    with manager.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0] == 0
+    manager.banco.fechar_todas()
@@ -0,0 +1,56 @@
+# tests/unit/test_retornos_service.py
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+from config.settings import settings
+from services import correlacao_service, retornos_service, risco_service
+from services.correlacao_service import CorrelacaoService
+from services.retornos_service import RetornosService
+from services.risco_service import RiscoService
+
+
+def _series_falsas(tickers, janela, coluna):
+    indice = pd.bdate_range("2024-01-02", periods=60)
+    return {t: pd.Series(50 * np.exp(np.cumsum(np.random.default_rng(len(t) + i).normal(0, 0.01, 60))),
+                         index=indice)
+            for i, t in enumerate(tickers)}
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_MATRIZES", 2)
+    monkeypatch.setattr(retornos_service, "_matrizes", OrderedDict())
+    monkeypatch.setattr(correlacao_service, "_estados", OrderedDict())
+    monkeypatch.setattr(risco_service, "_tabelas", OrderedDict())
+    monkeypatch.setattr(RetornosService, "_series", classmethod(lambda cls, *chave: _series_falsas(*chave)))
+
+
+def _usar(tickers):
+    matriz = RetornosService.obter(tickers)
+    CorrelacaoService.obter(tickers)
+    RiscoService.metricas(matriz)
+    return (matriz.tickers, matriz.janela, matriz.coluna)
+
+
+def test_matrizes_descartadas_levam_junto_correlacao_e_risco(caches):
+    ab = _usar(['A', 'B'])
+    cd = _usar(['C', 'D'])
+    assert _usar(['B', 'A']) == ab  # mesma matriz, agora a mais recente
+    ef = _usar(['E', 'F'])
+
+    for cache in (retornos_service._matrizes, correlacao_service._estados, risco_service._tabelas):
+        assert list(cache) == [ab, ef]
+    assert cd not in correlacao_service._estados
+
+
+def test_matriz_descartada_e_remontada_no_proximo_uso(caches):
+    primeira = RetornosService.obter(['A', 'B'])
+    RetornosService.obter(['C', 'D'])
+    RetornosService.obter(['E', 'F'])
+
+    remontada = RetornosService.obter(['A', 'B'])
+
+    assert remontada is not primeira
+    pd.testing.assert_frame_equal(remontada.precos, primeira.precos)
+    assert len(retornos_service._matrizes) == 2
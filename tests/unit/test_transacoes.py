@@ -0,0 +1,79 @@
+# tests/unit/test_transacoes.py
+import pytest
+from database.repository import Transacao, TransacaoInvalida, TransacaoRepository
+
+
+def _posicao(banco, ticker):
+    return tuple(banco.conexao().execute(
+        "SELECT qtd, pm, lucro_realizado, proventos FROM ativos WHERE user_id = 1 AND ticker = ?",
+        (ticker,)).fetchone())
+
+
+def test_compras_somam_custo_e_taxas_ao_preco_medio(banco):
+    repo = TransacaoRepository(banco)
+    repo.registrar(1, [Transacao("compra", "petr4", 100, 10.0, "2024-01-10", taxas=5.0, setor="Ações"),
+                       Transacao("compra", "PETR4", 100, 12.0, "2024-02-10")])
+
+    qtd, pm, lucro, _ = _posicao(banco, "PETR4")
+    assert qtd == 200
+    assert pm == pytest.approx((100 * 10 + 5 + 100 * 12) / 200)
+    assert lucro == 0
+
+
+def test_venda_apura_lucro_sem_mudar_o_preco_medio(banco):
+    repo = TransacaoRepository(banco)
+    repo.registrar(1, [Transacao("compra", "VALE3", 200, 11.0, "2024-01-10", setor="Ações"),
+                       Transacao("venda", "VALE3", 50, 15.0, "2024-03-01", taxas=2.0)])
+
+    qtd, pm, lucro, _ = _posicao(banco, "VALE3")
+    assert (qtd, pm) == (150, 11.0)
+    assert lucro == pytest.approx(50 * (15.0 - 11.0) - 2.0)
+
+    repo.registrar(1, [Transacao("venda", "VALE3", 150, 9.0, "2024-04-01")])
+    qtd, pm, lucro, _ = _posicao(banco, "VALE3")
+    assert (qtd, pm) == (0, 0)
+    assert lucro == pytest.approx(198.0 + 150 * (9.0 - 11.0))
+
+
+def test_lancamento_retroativo_refaz_o_ticker(banco):
+    repo = TransacaoRepository(banco)
+    repo.registrar(1, [Transacao("compra", "ITSA4", 100, 10.0, "2024-01-10", setor="Ações"),
+                       Transacao("venda", "ITSA4", 50, 20.0, "2024-03-01")])
+    assert _posicao(banco, "ITSA4")[2] == pytest.approx(500.0)
+
+    repo.registrar(1, [Transacao("compra", "ITSA4", 100, 16.0, "2024-02-01")])
+
+    qtd, pm, lucro, _ = _posicao(banco, "ITSA4")
+    assert qtd == 150
+    assert pm == pytest.approx(13.0)
+    assert lucro == pytest.approx(50 * (20.0 - 13.0))
+    venda = repo.extrato(1, "ITSA4").query("tipo == 'venda'").iloc[0]
+    assert venda['resultado'] == pytest.approx(350.0)
+
+
+def test_venda_maior_que_a_posicao_nao_grava_nada(banco):
+    repo = TransacaoRepository(banco)
+    repo.registrar(1, [Transacao("compra", "BBAS3", 10, 30.0, "2024-01-10", setor="Ações")])
+
+    with pytest.raises(TransacaoInvalida):
+        repo.registrar(1, [Transacao("compra", "BBAS3", 5, 31.0, "2024-01-11"),
+                           Transacao("venda", "BBAS3", 50, 35.0, "2024-01-12")])
+
+    assert _posicao(banco, "BBAS3")[:2] == (10, 30.0)
+    assert len(repo.extrato(1, "BBAS3")) == 1
+
+
+def test_desdobramento_e_proventos(banco):
+    repo = TransacaoRepository(banco)
+    repo.registrar(1, [Transacao("compra", "TAEE11", 100, 40.0, "2024-01-10", setor="Ações"),
+                       Transacao("desdobramento", "TAEE11", 2, 0.0, "2024-02-01"),
+                       Transacao("dividendo", "TAEE11", 0, 0.5, "2024-03-01", taxas=10.0)])
+
+    qtd, pm, _, proventos = _posicao(banco, "TAEE11")
+    assert (qtd, pm) == (200, 20.0)
+    assert proventos == pytest.approx(200 * 0.5 - 10.0)
+
+
+def test_primeira_compra_exige_classe(banco):
+    with pytest.raises(TransacaoInvalida):
+        TransacaoRepository(banco).registrar(1, [Transacao("compra", "WEGE3", 1, 40.0, "2024-01-10")])
@@ -0,0 +1,251 @@
+# utils/concorrencia.py
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+from config.settings import settings
+
+# Pools por nome, compartilhados por todas as sessões
+_executores: Dict[str, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+# Marca as threads que estão executando uma tarefa de mapear_concorrente
+_local = threading.local()
+
+
+def get_executor(nome: str = "busca_mercado", max_workers: int = None) -> ThreadPoolExecutor:
+    """
+    Pool de threads compartilhado por todas as sessões. O padrão ("busca_mercado",
+    settings.MAX_WORKERS) atende `mapear_concorrente`; tarefas de fundo que não são
+    aguardadas usam um pool com outro nome para não ocupar os workers das buscas.
+    """
+    with _executor_lock:
+        executor = _executores.get(nome)
+        if executor is None:
+            executor = _executores[nome] = ThreadPoolExecutor(max_workers=max_workers or settings.MAX_WORKERS,
+                                                              thread_name_prefix=nome)
+        return executor
+
+
+def _com_contexto(funcao: Callable) -> Callable:
+    """Propaga o contexto do Streamlit para a thread do pool (cache e widgets)."""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return funcao
+    if ctx is None:
+        return funcao
+
+    def executar(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return funcao(*args, **kwargs)
+    return executar
+
+
+def mapear_concorrente(funcao: Callable[[Hashable], Any], itens: Iterable[Hashable],
+                       timeout: float = None) -> Iterator[Tuple[Hashable, Any, Optional[str]]]:
+    """
+    Executa `funcao(item)` no pool e produz (item, resultado, erro) na ordem de conclusão.
+    Cada chamada tem prazo de `timeout` segundos (settings.YF_TIMEOUT) contado a partir
+    do início da execução; chamadas que estouram o prazo são abandonadas com erro
+    "timeout". Abandonar não interrompe a thread: quem libera o worker é o timeout que
+    o provedor aplica a cada requisição (também settings.YF_TIMEOUT).
+    """
+    if getattr(_local, "em_tarefa", False):
+        # Chamada de dentro de uma tarefa do pool: reenviar ao mesmo pool trava quando
+        # todos os workers estão esperando por subtarefas, então roda na própria thread
+        # (o prazo fica a cargo do timeout das chamadas ao provedor)
+        for item in dict.fromkeys(itens):
+            try:
+                yield item, funcao(item), None
+            except Exception as e:
+                yield item, None, str(e)
+        return
+
+    timeout = timeout or settings.YF_TIMEOUT
+    funcao = _com_contexto(funcao)
+    inicios: Dict[Hashable, float] = {}
+
+    def tarefa(item):
+        inicios[item] = time.monotonic()
+        _local.em_tarefa = True
+        try:
+            return funcao(item)
+        finally:
+            _local.em_tarefa = False
+
+    executor = get_executor()
+    futuros = {executor.submit(tarefa, item): item for item in dict.fromkeys(itens)}
+    pendentes = set(futuros)
+    while pendentes:
+        concluidos, pendentes = wait(pendentes, timeout=0.25, return_when=FIRST_COMPLETED)
+        for futuro in concluidos:
+            item = futuros[futuro]
+            try:
+                yield item, futuro.result(), None
+            except Exception as e:
+                yield item, None, str(e)
+        agora = time.monotonic()
+        expirados = {f for f in pendentes
+                     if futuros[f] in inicios and agora - inicios[futuros[f]] > timeout}
+        for futuro in expirados:
+            futuro.cancel()
+            yield futuros[futuro], None, "timeout"
+        pendentes -= expirados
+
+
+def executar_em_lote(funcao: Callable[[Hashable], Any], itens: Iterable[Hashable],
+                     timeout: float = None) -> Dict[Hashable, Any]:
+    """Executa `funcao` para todos os itens em paralelo. Falhas e timeouts viram None."""
+    return {item: resultado for item, resultado, _ in mapear_concorrente(funcao, itens, timeout)}
+
+
+class SingleFlight:
+    """
+    Coalesce chamadas concorrentes com a mesma chave: só a primeira executa a busca,
+    as demais aguardam e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo: Dict[Hashable, Future] = {}
+
+    def executar(self, chave: Hashable, funcao: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            futuro = self._em_voo.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_voo[chave] = futuro
+        if not lider:
+            return futuro.result()
+        try:
+            resultado = funcao(*args, **kwargs)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+
+    def executar_lote(self, chaves: Iterable[Hashable],
+                      funcao: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """
+        Versão em lote: cada chave entra em voo separadamente. `funcao` recebe só as
+        chaves que ninguém está buscando (uma chamada para todas) e devolve
+        {chave: resultado}; as chaves já em voo aguardam as buscas em andamento.
+        """
+        chaves = list(dict.fromkeys(chaves))
+        with self._lock:
+            alheias = {c: self._em_voo[c] for c in chaves if c in self._em_voo}
+            minhas = {c: Future() for c in chaves if c not in alheias}
+            self._em_voo.update(minhas)
+        resultados: Dict[Hashable, Any] = {}
+        if minhas:
+            try:
+                resultados = dict(funcao(list(minhas)))
+            except BaseException as e:
+                for futuro in minhas.values():
+                    futuro.set_exception(e)
+                raise
+            else:
+                for chave, futuro in minhas.items():
+                    futuro.set_result(resultados.get(chave))
+            finally:
+                with self._lock:
+                    for chave, futuro in minhas.items():
+                        if self._em_voo.get(chave) is futuro:
+                            del self._em_voo[chave]
+        for chave, futuro in alheias.items():
+            resultados[chave] = futuro.result()
+        return resultados
+
+    def em_voo(self) -> int:
+        """Quantidade de buscas em andamento."""
+        with self._lock:
+            return len(self._em_voo)
+
+
+class CircuitoAberto(Exception):
+    """Chamada recusada porque o circuito do provedor está aberto."""
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por provedor: após `limite_falhas` falhas seguidas, recusa chamadas por
+    `espera` segundos; depois libera uma única chamada de teste (meio-aberto), que
+    fecha o circuito se der certo ou o reabre se falhar.
+    """
+
+    def __init__(self, nome: str, limite_falhas: int = None, espera: float = None):
+        self.nome = nome
+        self.limite_falhas = limite_falhas or settings.CIRCUITO_FALHAS
+        self.espera = espera or settings.CIRCUITO_ESPERA
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_em: Optional[float] = None
+        self._testando = False
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            if self._aberto_em is None:
+                return "fechado"
+            if time.monotonic() - self._aberto_em < self.espera:
+                return "aberto"
+            return "meio-aberto"
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._aberto_em is None:
+                return True
+            if time.monotonic() - self._aberto_em < self.espera or self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._aberto_em = None
+            self._testando = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._testando = False
+            if self._falhas >= self.limite_falhas or self._aberto_em is not None:
+                self._aberto_em = time.monotonic()
+
+    def chamar(self, funcao: Callable, *args, ignorar: Tuple[type, ...] = (), **kwargs) -> Any:
+        """
+        Executa `funcao` sob o disjuntor. Exceções em `ignorar` (erros do próprio
+        ativo, e não do provedor) são repassadas sem contar como falha.
+        """
+        if not self.permitir():
+            raise CircuitoAberto(f"{self.nome} indisponível; nova tentativa em até {self.espera:.0f}s")
+        try:
+            resultado = funcao(*args, **kwargs)
+        except ignorar:
+            self.registrar_sucesso()
+            raise
+        except Exception:
+            self.registrar_falha()
+            raise
+        self.registrar_sucesso()
+        return resultado
+
+
+_circuitos: Dict[str, CircuitBreaker] = {}
+_circuitos_lock = threading.Lock()
+
+
+def get_circuito(provedor: str) -> CircuitBreaker:
+    """Disjuntor compartilhado de um provedor de dados (ex.: "yahoo")."""
+    with _circuitos_lock:
+        if provedor not in _circuitos:
+            _circuitos[provedor] = CircuitBreaker(provedor)
+        return _circuitos[provedor]
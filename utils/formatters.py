@@ -1 +1,22 @@
+# utils/formatters.py
 
+def formatar_ticker_yf(ticker: str) -> str:
+    """Adiciona o sufixo .SA aos tickers da B3 (terminados em número)."""
+    ticker = ticker.upper().strip()
+    if ticker[-1].isdigit() and not ticker.endswith(".SA"):
+        return f"{ticker}.SA"
+    return ticker
+
+
+def formatar_idade(segundos: float) -> str:
+    """Descreve há quanto tempo um dado foi obtido ("agora", "há 45s", "há 3 min", "há 2 h")."""
+    if segundos is None or segundos != segundos:
+        return "-"
+    segundos = int(max(segundos, 0))
+    if segundos < 5:
+        return "agora"
+    if segundos < 60:
+        return f"há {segundos}s"
+    if segundos < 3600:
+        return f"há {segundos // 60} min"
+    return f"há {segundos // 3600} h"
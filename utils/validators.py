@@ -6,6 +6,10 @@ def validar_ticker(ticker: str) -> bool:
     ticker = ticker.upper().strip()
     return bool(re.match(r'^[A-Z]{4}(3|4|11)$|^[A-Z]{1,5}$', ticker))
 
+def simbolo_consultavel(ticker: str) -> bool:
+    """Indica se o texto tem formato de símbolo de mercado (descarta "Tesouro Selic", "CDB 110%")."""
+    return bool(ticker) and bool(re.fullmatch(r'[A-Z0-9.^=-]{1,15}', ticker.upper().strip()))
+
 def validar_percentual(valor: float) -> bool:
     """Valida percentual entre 0 e 100."""
     return 0 <= valor <= 100
@@ -6,6 +6,9 @@ from datetime import datetime
 from database.repository import AtivoRepository
 from services.preco_service import PrecoService
 from services.analise_service import AnaliseService
+from services.retornos_service import RetornosService
+from services.correlacao_service import CorrelacaoService
+from services.risco_service import RiscoService
 from utils.exportacao import exportar_para_excel, exportar_para_csv
 from utils.graficos import GraficoService
 
@@ -26,22 +29,21 @@ def show_analise_avancada(user_id):
         dados_precos = preco_service.buscar_precos_batch([a['ticker'] for a in ativos])
     
     df = pd.DataFrame(ativos)
-    df['preco'] = [dados_precos[t].preco_atual for t in df['ticker']]
+    # Sem cotação (erro ou ticker descartado pelo lote) conta como preço ausente
+    df['preco'] = [dados_precos[t].preco_atual if t in dados_precos and dados_precos[t].status != 'erro' else 0
+                   for t in df['ticker']]
     df['Patrimônio'] = df['qtd'] * df['preco']
     
+    with st.spinner("Carregando históricos..."):
+        # Preços e retornos alinhados, compartilhados com as demais análises
+        matriz = RetornosService.obter(df['ticker'], "5y")
+    
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Correlação", "📈 Risco", "💰 Análise Preço", "📥 Exportar"])
     
     with tab1:
         st.subheader("Matriz de Correlação")
-        from services.preco_service import PrecoService
-        ps = PrecoService()
-        dados = {}
-        for t in df['ticker']:
-            dados_hist = ps._buscar_dados_single(t)
-            if dados_hist.status == "ok":
-                dados[t] = dados_hist.historico['Adj Close']
-        if len(dados) >= 2:
-            df_corr = pd.DataFrame(dados).pct_change().corr()
+        df_corr = CorrelacaoService.obter(df['ticker'], "5y")
+        if df_corr is not None:
             fig = px.imshow(df_corr, text_auto=True, aspect="auto", color_continuous_scale='RdYlGn')
             st.plotly_chart(fig, use_container_width=True)
         else:
@@ -51,18 +53,8 @@ def show_analise_avancada(user_id):
         st.subheader("Análise de Risco")
         from services.analise_service import AnaliseService
         asrv = AnaliseService()
-        riscos = {}
-        for t in df['ticker']:
-            d = dados_precos[t]
-            if d.status == "ok":
-                ret = d.historico['Adj Close'].pct_change().dropna()
-                riscos[t] = {
-                    'Retorno Anual': ret.mean() * 252 * 100,
-                    'Volatilidade': ret.std() * (252**0.5) * 100,
-                    'Drawdown Máx': (d.historico['Adj Close'] / d.historico['Adj Close'].cummax() - 1).min() * 100
-                }
-        if riscos:
-            df_risco = pd.DataFrame(riscos).T
+        df_risco = RiscoService.metricas(matriz)[['retorno_anual', 'volatilidade', 'max_drawdown']]
+        if not df_risco.empty:
             df_risco.columns = ['Retorno Anual %', 'Volatilidade %', 'Drawdown Máx %']
             st.dataframe(df_risco.style.format("{:.2f}%"), width='stretch')
             fig = px.scatter(df_risco, x='Volatilidade %', y='Retorno Anual %', text=df_risco.index,
@@ -74,7 +66,7 @@ def show_analise_avancada(user_id):
         st.subheader("Análise de Preço - Caro ou Barato?")
         ticker = st.selectbox("Selecione um ativo", df['ticker'].tolist())
         if ticker:
-            dados = dados_precos[ticker]
+            dados = preco_service._buscar_dados_single(ticker)
             if dados.status == "ok":
                 resultado = analise_service.analisar(dados)
                 st.markdown(f"<h3 style='color:{resultado.cor}'>{resultado.mensagem}</h3>", unsafe_allow_html=True)
@@ -1,8 +1,7 @@
 # views/assistente.py
 import streamlit as st
 import pandas as pd
-from decimal import Decimal
-from database.repository import MetaRepository
+from database.repository import AtivoRepository, LoteInvalido, MetaRepository, banco_padrao
 from services.preco_service import PrecoService
 from services.analise_service import AnaliseService
 from utils.graficos import GraficoService
@@ -12,7 +11,10 @@ def show_assistente(user_id):
     st.title("🎯 Assistente Inteligente de Carteira")
     st.markdown("### Meta: Rentabilidade de **8% a 12% ao ano**")
     
-    meta_repo = MetaRepository()
+    # Mesmo gerenciador (e arquivo) do restante do app
+    banco = banco_padrao()
+    meta_repo = MetaRepository(banco)
+    ativo_repo = AtivoRepository(banco)
     preco_service = PrecoService()
     analise_service = AnaliseService()
     grafico_service = GraficoService()
@@ -178,19 +180,13 @@ def show_assistente(user_id):
                     st.rerun()
             with col_b2:
                 if st.button("💾 Salvar na Carteira", use_container_width=True):
-                    from models.ativo import Ativo
-                    from database.repository import AtivoRepository
-                    repo = AtivoRepository()
-                    for _, ativo in df_final.iterrows():
-                        a = Ativo(
-                            ticker=ativo['Ticker'],
-                            quantidade=Decimal(str(ativo['Cotas'])),
-                            preco_medio=Decimal(str(ativo['Preço'])),
-                            setor=ativo['Classe']
-                        )
-                        repo.salvar(a, user_id)
-                    st.balloons()
-                    st.success("✅ Ativos salvos!")
+                    lote = df_final.rename(columns={'Ticker': 'ticker', 'Cotas': 'qtd', 'Preço': 'pm', 'Classe': 'setor'})
+                    try:
+                        ativo_repo.salvar_lote(user_id, lote)
+                        st.balloons()
+                        st.success("✅ Ativos salvos!")
+                    except LoteInvalido as e:
+                        st.error(f"❌ Nada foi salvo: {e}")
             with col_b3:
                 if st.button("📊 Ver Dashboard", use_container_width=True):
                     st.session_state.etapa_assistente = 1
@@ -4,6 +4,8 @@ import pandas as pd
 import plotly.express as px
 from database.repository import AtivoRepository, MetaRepository
 from services.preco_service import PrecoService
+from services.retornos_service import RetornosService
+from services.estresse_service import EstresseService
 from utils.exportacao import formatar_moeda
 
 def show_balanceamento(user_id):
@@ -28,7 +30,8 @@ def show_balanceamento(user_id):
         dados_precos = preco_service.buscar_precos_batch([a['ticker'] for a in ativos])
     
     df = pd.DataFrame(ativos)
-    df['preco'] = [dados_precos[t].preco_atual if dados_precos[t].status == 'ok' else 0 for t in df['ticker']]
+    df['preco'] = [dados_precos[t].preco_atual if t in dados_precos and dados_precos[t].status != 'erro' else 0
+                   for t in df['ticker']]
     df['Patrimônio'] = df['qtd'] * df['preco']
     total = df['Patrimônio'].sum()
     
@@ -96,5 +99,22 @@ def show_balanceamento(user_id):
     perda = total - novo_total_queda
     st.metric("Patrimônio após queda", formatar_moeda(novo_total_queda), delta=f"-{perda:,.2f}", delta_color="inverse")
     
+    st.subheader("🎲 Simulação de Monte Carlo")
+    piso_pct = st.slider("Piso de patrimônio (%)", 50, 100, 80)
+    if st.button("▶️ Simular 10.000 cenários de 1 ano"):
+        with st.spinner("Simulando..."):
+            resultado = EstresseService.simular(
+                df.groupby('ticker')['Patrimônio'].sum(), df.groupby('ticker')['setor'].first(),
+                RetornosService.obter(df['ticker'], "5y"), piso=piso_pct / 100, semente=42)
+        if resultado.vazio:
+            st.warning("Sem cotações válidas para simular a carteira.")
+        else:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Pior 5%", f"{resultado.percentis[5]:+.1f}%")
+            col2.metric("CVaR 95%", f"-{resultado.cvar:.1f}%")
+            col3.metric("Chance de romper o piso", f"{resultado.prob_piso * 100:.1f}%")
+            st.line_chart(resultado.faixas)
+            st.dataframe(resultado.contribuicao, width='stretch')
+    
     # Recomendação pós-crise
     st.info("💡 Em crise, mantenha a calma e evite vender. Use aportes para comprar nas classes abaixo da meta.")
@@ -1,7 +1,9 @@
 # views/bola_neve.py
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
+from services.bola_neve_service import BolaNeveService
 from utils.exportacao import formatar_moeda
 
 def show_bola_neve(user_id):
@@ -17,25 +19,8 @@ def show_bola_neve(user_id):
         anos = st.slider("⏳ Período (anos)", 1, 50, 20)
     
     meses = anos * 12
-    taxa_mensal = (1 + taxa_anual) ** (1/12) - 1
-    
-    df_sim = pd.DataFrame({'Mês': range(1, meses+1)})
-    
-    # Com reinvestimento
-    patrim = []
-    atual = valor_inicial
-    for i in range(meses):
-        atual = atual * (1 + taxa_mensal) + aporte_mensal
-        patrim.append(atual)
-    df_sim['Com reinvestimento'] = patrim
-    
-    # Sem reinvestimento
-    patrim_sem = []
-    atual_sem = valor_inicial
-    for i in range(meses):
-        atual_sem = atual_sem + aporte_mensal
-        patrim_sem.append(atual_sem)
-    df_sim['Sem reinvestimento'] = patrim_sem
+    # Forma fechada dos juros compostos: todos os meses de uma vez
+    df_sim = BolaNeveService.projetar(valor_inicial, aporte_mensal, taxa_anual, anos)
     
     final_com = df_sim['Com reinvestimento'].iloc[-1]
     final_sem = df_sim['Sem reinvestimento'].iloc[-1]
@@ -58,10 +43,27 @@ def show_bola_neve(user_id):
     st.plotly_chart(fig, use_container_width=True)
     
     with st.expander("📊 Ver tabela anual"):
-        df_sim['Ano'] = ((df_sim['Mês'] - 1) // 12) + 1
-        df_anual = df_sim.groupby('Ano').last().reset_index()
-        df_anual = df_anual[['Ano', 'Com reinvestimento', 'Sem reinvestimento']]
-        df_anual.columns = ['Ano', 'Com reinvestimento', 'Sem reinvestimento']
-        df_anual['Com reinvestimento'] = df_anual['Com reinvestimento'].apply(formatar_moeda)
-        df_anual['Sem reinvestimento'] = df_anual['Sem reinvestimento'].apply(formatar_moeda)
-        st.table(df_anual)
+        df_anual = BolaNeveService.tabela_anual(df_sim)
+        st.table(df_anual.style.format(formatar_moeda, subset=['Com reinvestimento', 'Sem reinvestimento']))
+    
+    with st.expander("🗺️ Comparar cenários (taxa × prazo)"):
+        taxas_grade = np.round(np.arange(0.0, 20.01, 0.5), 1)
+        anos_grade = np.arange(1, 51)
+        finais = BolaNeveService.varredura(valor_inicial, taxas_grade / 100, anos_grade, [aporte_mensal])[:, :, 0]
+        fig_mapa = px.imshow(finais, x=anos_grade, y=taxas_grade, origin='lower', aspect='auto',
+                             color_continuous_scale='YlOrBr',
+                             labels={'x': 'Anos', 'y': 'Rentabilidade anual (%)', 'color': 'Patrimônio final (R$)'})
+        st.plotly_chart(fig_mapa, use_container_width=True)
+    
+    st.subheader("🎲 E se a rentabilidade variar?")
+    modelo = st.radio("Modelo de retornos", BolaNeveService.MODELOS, horizontal=True)
+    volatilidade = st.slider("Volatilidade anual (%)", 0, 40, 20) / 100
+    meta = st.number_input("🎯 Meta de patrimônio (R$)", min_value=0.0, value=1_000_000.0, step=50_000.0)
+    try:
+        simulacao = BolaNeveService.simular(valor_inicial, aporte_mensal, anos, modelo,
+                                            taxa_anual=taxa_anual, volatilidade_anual=volatilidade)
+    except ValueError as e:
+        st.warning(str(e))
+    else:
+        st.metric("Chance de atingir a meta", f"{simulacao.chance(meta) * 100:.1f}%")
+        st.line_chart(simulacao.faixas)
@@ -4,6 +4,7 @@ import pandas as pd
 from config.settings import SCANNER_FIIS, SCANNER_ACOES, SCANNER_ETFS, SCANNER_BDRS, SCANNER_INTERNACIONAL
 from services.preco_service import PrecoService
 from services.analise_service import AnaliseService
+from utils.concorrencia import executar_em_lote
 from utils.exportacao import formatar_moeda
 
 def show_scanner(user_id):
@@ -30,35 +31,25 @@ def show_scanner(user_id):
     
     if st.button("🔍 Analisar oportunidades", use_container_width=True):
         with st.spinner(f"Analisando {len(tickers)} ativos..."):
-            resultados = []
-            for ticker in tickers:
-                dados = preco_service._buscar_dados_single(ticker)
-                if dados.status == "ok":
-                    resultado = analise_service.analisar(dados)
-                    # Ajuste de sensibilidade (exemplo)
-                    if sensibilidade == "Agressivo":
-                        if resultado.pontuacao <= -30:
-                            resultado.status = "oportunidade"
-                            resultado.mensagem = "🔥 OPORTUNIDADE!"
-                        elif resultado.pontuacao <= -10:
-                            resultado.status = "barato"
-                            resultado.mensagem = "👍 Barato"
-                        elif resultado.pontuacao <= 15:
-                            resultado.status = "neutro"
-                            resultado.mensagem = "⚖️ Neutro"
-                        else:
-                            resultado.status = "caro"
-                            resultado.mensagem = "❌ Caro"
-                    resultados.append({
-                        "Ticker": ticker,
-                        "Status": resultado.status,
-                        "Preço": dados.preco_atual,
-                        "DY (%)": dados.dividend_yield if dados.dividend_yield else 0,
-                        "Pontuação": resultado.pontuacao,
-                        "Detalhes": resultado.explicacao[:100] + "..."
-                    })
-            if resultados:
-                df = pd.DataFrame(resultados).sort_values("Pontuação", ascending=True)
+            dados_por_ticker = executar_em_lote(preco_service._buscar_dados_single, tickers)
+            validos = [t for t in tickers
+                       if dados_por_ticker.get(t) is not None and dados_por_ticker[t].status == "ok"]
+            metricas = pd.DataFrame(
+                [{c: getattr(dados_por_ticker[t], c) for c in AnaliseService.METRICAS + ['dividend_yield']}
+                 for t in validos],
+                index=validos, columns=AnaliseService.METRICAS + ['dividend_yield'])
+            # Faixas da sensibilidade escolhida, rotuladas como no Scanner do app
+            pontos = AnaliseService.reclassificar(
+                metricas.join(analise_service.pontuar_lote(metricas)), sensibilidade)
+            if validos:
+                df = pd.DataFrame({
+                    "Ticker": validos,
+                    "Status": pontos['status'].to_numpy(),
+                    "Preço": metricas['preco_atual'].to_numpy(dtype=float),
+                    "DY (%)": metricas['dividend_yield'].fillna(0).to_numpy(dtype=float),
+                    "Pontuação": pontos['pontuacao'].to_numpy(),
+                    "Detalhes": pontos['mensagem'].to_numpy()
+                }).sort_values("Pontuação", ascending=True)
                 def colorir(row):
                     if row['Status'] == 'oportunidade':
                         return ['background-color: #006400; color: white']*len(row)